@@ -0,0 +1,453 @@
+#!/bin/python3
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+from __future__ import absolute_import
+
+__author__ = "Erol Yesin"
+
+import asyncio
+import os
+from abc import abstractmethod
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import Lock, Thread
+from typing import Any
+
+from base_dev_helper import BaseCommDeviceHelper
+from capture import RX, TX
+from framing import Framer, LineFramer
+
+# Queued for `async for` once the transport is gone
+_EOF = object()
+
+_loop = None
+_loop_lock = Lock()
+
+
+def shared_loop():
+    """Process-wide asyncio loop on a daemon thread, created on first use.
+    Devices opened with the sync open() run on it."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            Thread(name="asyncDevLoop", target=_loop.run_forever, daemon=True).start()
+        return _loop
+
+
+class _Protocol(asyncio.BufferedProtocol):
+    """Hands asyncio transport callbacks to an AsyncCommDeviceHelper.
+
+    Stream sockets read straight into the device framer's ring through
+    get_buffer()/buffer_updated(); pipes and datagram endpoints, which only
+    call data_received()/datagram_received(), are handled too.
+    """
+
+    def __init__(self, device):
+        self.device = device
+
+    def get_buffer(self, sizehint):
+        return self.device.framer.ring.writable()
+
+    def buffer_updated(self, nbytes):
+        self.device._deliver(self.device.framer.commit(nbytes))
+
+    def data_received(self, data):
+        self.device._deliver(self.device.framer.feed(data))
+
+    def datagram_received(self, data, addr):
+        # A datagram is a frame already
+        self.device.framer.received += len(data)
+        self.device._deliver([self.device.framer.message(data)])
+
+    def error_received(self, exc):
+        self.device.debug_write(topic="ERROR", data=repr(exc))
+
+    def pause_writing(self):
+        self.device._paused = asyncio.get_running_loop().create_future()
+
+    def resume_writing(self):
+        paused, self.device._paused = self.device._paused, None
+        if paused is not None and not paused.done():
+            paused.set_result(None)
+
+    def connection_lost(self, exc):
+        self.device._connection_lost(exc)
+
+
+class AsyncCommDeviceHelper(BaseCommDeviceHelper):
+    """Coroutine-first sibling of the threaded device helpers.
+
+    The transport is an asyncio protocol on the running loop, so one process
+    can drive thousands of connections without any thread per device.
+    subscribe()/start()/attach_bus()/dispatch_async() work as before, with
+    callbacks run on the loop thread.  On top of them:
+
+        async with AsyncTCPHelper("10.0.0.5:5025") as dev:   # or await aopen()
+            await dev.send("*IDN?")
+            reply = await dev.query("MEAS:VOLT?", timeout=1)
+            async for msg in dev:
+                ...
+
+    Every received message reaches the subscribers and `async for`; up to
+    BACKLOG of them are held for the iterator, oldest dropped first.
+    query() replies are matched as correlate() sets up, in order by default.
+
+    The sync open() and close() that DevicePool and other threaded callers
+    use run aopen()/aclose() on shared_loop(), so the device, its callbacks
+    and any `async for` over it then belong to that loop.
+    """
+
+    BACKLOG: int = 1000
+
+    def __init__(
+        self,
+        address: str = None,
+        port: (int, str, None) = None,
+        timeout: float = None,
+        framer: Framer = None,
+        binary: bool = False,
+    ):
+        super(AsyncCommDeviceHelper, self).__init__(
+            address=address,
+            port=port,
+            timeout=timeout,
+            framer=framer or LineFramer(),
+            binary=binary,
+        )
+        self.timeout = timeout
+        self.continue_thread = False
+        self.rx_dropped = 0
+        self._transport = None
+        self._rx = None
+        self._paused = None
+        self._closed = None
+
+    @abstractmethod
+    async def _connect(self):
+        """Create the transport with self._protocol() as its protocol and
+        return it."""
+        pass
+
+    def _protocol(self):
+        return _Protocol(self)
+
+    def _encode(self, data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return self.framer.encode(bytes(data))
+        data = str(data)
+        if "\n" not in data:
+            data += self.EOL
+        return data.encode()
+
+    def _write(self, data):
+        self._transport.write(data)
+
+    def _send(self, data):
+        # Returns the bytes written: EOL and framing included
+        if self._transport is None:
+            raise ConnectionError("%s is not open" % self.name)
+        data = self._encode(data)
+        self._write(data)
+        return len(data)
+
+    def _recv(self, size=1024):
+        # Data arrives through the protocol callbacks
+        return None
+
+    def _open(self):
+        pass
+
+    def _close(self):
+        if self._transport is not None:
+            self._transport.close()
+
+    async def aopen(self):
+        loop = asyncio.get_running_loop()
+        self._rx = asyncio.Queue()
+        self._closed = loop.create_future()
+        try:
+            self._transport = await self._connect()
+        except BaseException:
+            # Nothing for aclose() to wait for
+            self._closed = None
+            raise
+        self.continue_thread = True
+        self.connected = True
+        self.last_error = None
+        self._post(self.STATE_EVENT, [{"connected": True, "error": None}])
+        return self
+
+    def _run_sync(self, coro):
+        loop = shared_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("await aopen()/aclose() on the device's own loop")
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return future.result(timeout=(self.timeout or 4) + 1)
+        except Exception:
+            future.cancel()
+            raise
+
+    def open(self, reactor=None):
+        """aopen() on shared_loop() for callers without a loop of their own.
+        reactor is not used: the transport runs on that loop."""
+        return self._run_sync(self.aopen())
+
+    def close(self):
+        """aclose() on the loop the device was opened on."""
+        return self._run_sync(self.aclose())
+
+    async def aclose(self):
+        self.continue_thread = False
+        self._close()
+        if self._capture is not None:
+            self._capture.flush()
+        if self._closed is not None:
+            await asyncio.wait((self._closed,), timeout=self.timeout or 4)
+        return self
+
+    async def __aenter__(self):
+        return await self.aopen()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    def _transmit(self, data):
+        # Loop thread: write data now and post it to the TX subscribers
+        try:
+            size = self._send(data)
+        except OSError:
+            self.tx_errors += 1
+            raise
+        self.tx_msgs += 1
+        self.tx_bytes += size
+        if self._capture is not None:
+            self._capture.write(TX, [data])
+        self._post(self.TX_EVENT, [data])
+
+    async def send(self, data):
+        """Write data and post it to the TX subscribers, waiting while the
+        transport's write buffer is over its high-water mark."""
+        self._transmit(data)
+        if self._paused is not None:
+            await asyncio.shield(self._paused)
+
+    async def query(self, cmd, timeout: float = None, key: Any = None):
+        """Send cmd and return its reply, matched by the Correlator that
+        correlate() sets up, so query_stats() and metrics()["rtt"] cover
+        it.  A query that timed out does not take the next query's reply.
+        Raises asyncio.TimeoutError after timeout (the device timeout)."""
+        if self._correlator is None:
+            self.correlate()
+        correlator = self._correlator
+        if timeout is None:
+            timeout = self.timeout
+        if not correlator.acquire(timeout=0):
+            # Wait for a slot off the loop: the replies freeing one arrive on it
+            waiting = asyncio.get_running_loop().run_in_executor(
+                None, correlator.acquire, timeout
+            )
+            try:
+                acquired = await asyncio.shield(waiting)
+            except asyncio.CancelledError:
+                waiting.add_done_callback(
+                    lambda done: done.result() and correlator.release()
+                )
+                raise
+            if not acquired:
+                raise asyncio.TimeoutError(
+                    "%d queries in flight" % correlator.in_flight
+                )
+        future = correlator.submit(
+            cmd, self._transmit, timeout=timeout, key=key, acquired=True
+        )
+        if self._paused is not None:
+            await asyncio.shield(self._paused)
+        try:
+            return await asyncio.wrap_future(future)
+        except FutureTimeoutError as e:
+            raise asyncio.TimeoutError(*e.args) from None
+
+    def __aiter__(self):
+        if self._rx is None:
+            raise RuntimeError("%s is not open" % self.name)
+        return self
+
+    async def __anext__(self):
+        msg = await self._rx.get()
+        if msg is _EOF:
+            # Keep ending any other iterator too
+            self._rx.put_nowait(_EOF)
+            raise StopAsyncIteration
+        return msg
+
+    def _deliver(self, msgs):
+        if not msgs:
+            return
+        self.rx_msgs += len(msgs)
+        if self._capture is not None:
+            self._capture.write(RX, msgs)
+        if self._correlator is not None:
+            self._correlator.match(msgs)
+        rx = self._rx
+        for msg in msgs:
+            if rx.qsize() >= self.BACKLOG:
+                rx.get_nowait()
+                self.rx_dropped += 1
+            rx.put_nowait(msg)
+        self._post(self.RX_EVENT, msgs)
+
+    def _connection_lost(self, exc):
+        self.continue_thread = False
+        self._transport = None
+        if self.connected:
+            self.connected = False
+            self.last_error = exc
+            self._post(
+                self.STATE_EVENT,
+                [{"connected": False, "error": repr(exc) if exc else None}],
+            )
+        if self._correlator is not None:
+            self._correlator.cancel(reason="%s closed" % self.name)
+        if self._paused is not None and not self._paused.done():
+            self._paused.set_result(None)
+        self._paused = None
+        if self._closed is not None and not self._closed.done():
+            self._rx.put_nowait(_EOF)
+            self._closed.set_result(exc)
+
+
+class AsyncTCPHelper(AsyncCommDeviceHelper):
+    def __init__(
+        self,
+        address: str,
+        timeout: float = None,
+        framer: Framer = None,
+        binary: bool = False,
+    ):
+        self.address = address.split(":")[0]
+        self.port = int(address.split(":")[1])
+        super(AsyncTCPHelper, self).__init__(
+            address=self.address,
+            port=self.port,
+            timeout=timeout,
+            framer=framer,
+            binary=binary,
+        )
+        self.bus_id = "%s:%d" % (self.address, self.port)
+
+    async def _connect(self):
+        transport, _ = await asyncio.get_running_loop().create_connection(
+            self._protocol, self.address, self.port
+        )
+        return transport
+
+
+class AsyncUDPHelper(AsyncCommDeviceHelper):
+    """Datagrams to and from address ("host:port"); each one is a message,
+    so the framer only decodes them."""
+
+    def __init__(
+        self,
+        address: str,
+        local_addr: tuple = None,
+        timeout: float = None,
+        framer: Framer = None,
+        binary: bool = False,
+    ):
+        self.address = address.split(":")[0]
+        self.port = int(address.split(":")[1])
+        self.local_addr = local_addr
+        super(AsyncUDPHelper, self).__init__(
+            address=self.address,
+            port=self.port,
+            timeout=timeout,
+            framer=framer,
+            binary=binary,
+        )
+        self.bus_id = "%s:%d" % (self.address, self.port)
+
+    async def _connect(self):
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            self._protocol,
+            remote_addr=(self.address, self.port),
+            local_addr=self.local_addr,
+        )
+        return transport
+
+    def _encode(self, data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return data
+        return super(AsyncUDPHelper, self)._encode(data)
+
+    def _write(self, data):
+        self._transport.sendto(data)
+
+
+class AsyncSerialHelper(AsyncCommDeviceHelper):
+    """Serial port through pyserial for the line settings, then read and
+    written as a non-blocking file descriptor by loop pipe transports."""
+
+    def __init__(
+        self,
+        port: str,
+        baud: int = 115200,
+        timeout: float = None,
+        framer: Framer = None,
+        binary: bool = False,
+    ):
+        self.port_name = port
+        self.baud = baud
+        super(AsyncSerialHelper, self).__init__(
+            address=port, port=baud, timeout=timeout, framer=framer, binary=binary
+        )
+        self._serport = None
+        self._reader = None
+        self._writer = None
+
+    async def _connect(self):
+        import serial
+
+        self._serport = serial.Serial(
+            port=self.port_name, baudrate=self.baud, timeout=0, exclusive=True
+        )
+        loop = asyncio.get_running_loop()
+        fd = self._serport.fileno()
+        # Each transport closes its own file, pyserial keeps the original fd
+        self._reader, _ = await loop.connect_read_pipe(
+            self._protocol, open(os.dup(fd), "rb", buffering=0)
+        )
+        self._writer, _ = await loop.connect_write_pipe(
+            self._protocol, open(os.dup(fd), "wb", buffering=0)
+        )
+        return self._writer
+
+    def _close(self):
+        # Either pipe may already be gone after the other one was lost
+        for transport in (self._reader, self._writer):
+            if transport is not None:
+                transport.close()
+        self._reader = self._writer = None
+        if self._serport is not None and self._serport.is_open:
+            self._serport.close()
@@ -21,18 +21,128 @@ from __future__ import absolute_import
 
 __author__ = "Erol Yesin"
 
+import os
 from abc import ABC, abstractmethod
+from collections import deque
 from threading import Thread
+from time import monotonic
 from typing import Any, List
 
 from comm_queues.comm_queue import Queue as Q
+from capture import RX, TX, CaptureWriter, Replay
+from comm_queues.queue_stats import Histogram
+from correlator import Correlator
 from event_handler.event_handler import EventHandler as Eventer
+from framing import Framer, LineFramer
 from log_wrapper.log_wrapper import LoggerWrapper
 
 
+def _wire_size(data):
+    try:
+        return len(data)
+    except TypeError:
+        return 0
+
+
+def _as_text(call_back: callable, encoding: str):
+    """call_back seeing bytes payloads (and lists of them) decoded.  The
+    packet is shared with the other subscribers, so its payload is put back."""
+
+    def decode(payload):
+        if isinstance(payload, (bytes, bytearray, memoryview)):
+            return str(payload, encoding, "replace")
+        if isinstance(payload, list):
+            return [decode(item) for item in payload]
+        return payload
+
+    def on_event(pkt):
+        raw = pkt.payload
+        pkt.payload = decode(raw)
+        try:
+            call_back(pkt)
+        finally:
+            pkt.payload = raw
+
+    return on_event
+
+
+class _Coalescer:
+    """Output batching for coalesce(): how long to linger for more data,
+    how many bytes go into one _send_many(), and what the writes looked like."""
+
+    # Items per _send_many() call
+    BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+    def __init__(self, window: float, max_bytes: int):
+        self.window = window
+        self.max_bytes = max_bytes
+        self.writes = 0
+        self.items = 0
+        self.bytes = 0
+        self.batch = Histogram(bounds=self.BUCKETS)
+
+    def linger(self, queue: Q, batch: list):
+        """Add what else arrives within window of the first item, stopping
+        early once max_bytes are waiting."""
+        size = sum(map(_wire_size, batch))
+        deadline = monotonic() + self.window
+        while size < self.max_bytes and None not in batch:
+            left = deadline - monotonic()
+            if left <= 0:
+                break
+            more = queue.get_many(timeout=left)
+            if not more:
+                break
+            batch += more
+            size += sum(map(_wire_size, more))
+        return batch
+
+    def chunks(self, batch: list):
+        """batch split into runs of at most max_bytes (one item at least)."""
+        chunk = []
+        size = 0
+        for data in batch:
+            length = _wire_size(data)
+            if chunk and size + length > self.max_bytes:
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append(data)
+            size += length
+        if chunk:
+            yield chunk
+
+    def count(self, chunk: list):
+        self.writes += 1
+        self.items += len(chunk)
+        self.bytes += sum(map(_wire_size, chunk))
+        self.batch.add(len(chunk))
+
+    def stats(self, reset: bool = False):
+        snap = {
+            "window": self.window,
+            "max_bytes": self.max_bytes,
+            "writes": self.writes,
+            "items": self.items,
+            "bytes": self.bytes,
+            "items_per_write": self.batch.snapshot(),
+        }
+        if reset:
+            self.writes = self.items = self.bytes = 0
+            self.batch.reset()
+        return snap
+
+
 class BaseCommDeviceHelper(ABC):
     EOLL: List[str] = ["\r\n", "\n"]
     EOL = "\r\n"
+    # Most items moved per queue lock acquisition by the output/distribution threads
+    BATCH_SIZE: int = 64
+    # Seconds query() waits for a reply unless told otherwise
+    QUERY_TIMEOUT: float = 5.0
+    # A read of 0 bytes means the peer closed.  Transports whose reads time
+    # out empty (serial ports, polled queues) set this False and keep reading
+    EOF_ON_EMPTY_READ: bool = True
 
     def __init__(
         self,
@@ -42,33 +152,68 @@ class BaseCommDeviceHelper(ABC):
         recv_proc: callable = None,
         send_proc: callable = None,
         dist_proc: callable = None,
+        framer: Framer = None,
+        binary: bool = False,
     ):
 
         self.name = self.__class__.__name__
+        # Last level of this device's EventBus topics, see attach_bus()
+        self.bus_id = os.path.basename(str(address)) if address else self.name
         self.RX_EVENT = self.name + "InEvent"
         self.TX_EVENT = self.name + "OutEvent"
+        # Posts {"connected": bool, "error": repr or None} on open, close and loss
+        self.STATE_EVENT = self.name + "StateEvent"
 
         self.__event = {
             self.RX_EVENT: Eventer(event=self.RX_EVENT, src=self.name),
             self.TX_EVENT: Eventer(event=self.TX_EVENT, src=self.name),
+            self.STATE_EVENT: Eventer(event=self.STATE_EVENT, src=self.name),
         }
 
         self.__inQ = Q()
         self.__outQ = Q()
 
         self.continue_thread = True
-        label = self.name[:3].lower()
-        if recv_proc is None:
-            recv_proc = self.__process_input__
-        self.__inT = Thread(name=label + "IT", target=recv_proc, args=(self.__inQ,))
-
-        if send_proc is None:
-            send_proc = self.__process_output__
-        self.__outT = Thread(name=label + "OT", target=send_proc, args=(self.__outQ,))
-
-        if dist_proc is None:
-            dist_proc = self.__distribute_input__
-        self.__distT = Thread(name=label + "DT", target=dist_proc)
+        # True between a successful open() and close() or a lost connection
+        self.connected = False
+        self.last_error = None
+        # Traffic counters, see metrics().  Bytes read through a framer are
+        # counted by the framer
+        self.rx_msgs = 0
+        self.rx_bytes = 0
+        self.tx_msgs = 0
+        self.tx_bytes = 0
+        self.tx_errors = 0
+        self.__recv_proc = recv_proc or self.__process_input__
+        self.__send_proc = send_proc or self.__process_output__
+        self.__dist_proc = dist_proc or self.__distribute_input__
+        self.__make_threads()
+
+        # With a framer the input thread reads raw bytes into it through
+        # _recv_into() and queues its frames, instead of queueing _recv()
+        self.framer = framer
+        # binary=True: payloads stay bytes from _recv() to the subscribers,
+        # only those subscribed with an encoding see text
+        self.binary = binary
+        if binary and framer is not None:
+            framer.encoding = None
+        # Lines framer a Reactor reads with when the device has no framer
+        self._reactor_framer = None
+        # query() replies, see correlate()
+        self._correlator = None
+        # Every query() round trip since correlate() was first called; unlike
+        # query_stats(reset=True) nothing resets it, metrics() exports it
+        self._rtt_total = None
+        # Output batching, see coalesce()
+        self._coalescer = None
+        # Frames read and sent, see capture()
+        self._capture = None
+
+        # open(reactor=...): the Reactor and the loop this device is read on
+        self._reactor = None
+        self._loop = None
+        # Reactor writes the transport has not taken yet: [items, bytes left]
+        self._pending = deque()
 
         self.debug_file = None
         self.debug_on()
@@ -87,6 +232,44 @@ class BaseCommDeviceHelper(ABC):
         pass
         return ""
 
+    def _recv_into(self, buffer):
+        """Read into a writable buffer (e.g. ByteRing.writable()) and return the
+        byte count.  Transports with a native recv_into should override this."""
+        data = self._recv(size=len(buffer))
+        if not data:
+            return 0
+        if isinstance(data, str):
+            data = data.encode()
+        buffer[: len(data)] = data
+        return len(data)
+
+    def _send_many(self, batch: list):
+        """Write several items, in as few system calls as the transport
+        allows.  Used instead of _send() once coalesce() is on; transports
+        with gather writes (sendmsg) should override this."""
+        for data in batch:
+            self._send(data=data)
+
+    def _encode(self, data):
+        """data as the bytes _send() writes.  Transports that frame or add
+        line endings override this."""
+        if isinstance(data, str):
+            return data.encode()
+        return bytes(data)
+
+    def _write_some(self, view: memoryview):
+        """Reactor: write what the non-blocking transport takes of view and
+        return the count, raising BlockingIOError when it takes nothing."""
+        return os.write(self.fileno(), view)
+
+    def _set_blocking(self, flag: bool):
+        """Reactor: the transport is non-blocking while registered."""
+        os.set_blocking(self.fileno(), flag)
+
+    def fileno(self):
+        """File descriptor a Reactor can wait on, None if the transport has none."""
+        return None
+
     @classmethod
     @abstractmethod
     def _open(self):
@@ -99,13 +282,102 @@ class BaseCommDeviceHelper(ABC):
 
     def send(self, data):
         self.__outQ.put(data)
+        if self._loop is not None:
+            self._loop.call_soon(self._on_writable)
+
+    def coalesce(
+        self, enable: bool = True, window: float = 0.001, max_bytes: int = 16384
+    ):
+        """Batch output: after the first queued item the output thread waits
+        up to `window` seconds (or until max_bytes are queued) for more, and
+        writes them with one _send_many() per max_bytes.  On a Reactor
+        whatever is queued is written at once, without waiting.  TX events
+        still fire for every item."""
+        self._coalescer = _Coalescer(window, max_bytes) if enable else None
+        return self
+
+    def coalesce_stats(self, reset: bool = False):
+        if self._coalescer is None:
+            return None
+        return self._coalescer.stats(reset=reset)
+
+    def capture(self, path: str = None, mmap: bool = False):
+        """Record every frame read and every item sent, exactly as the RX/TX
+        subscribers see them and stamped with time.monotonic_ns(), to a
+        capture file at path (see capture.py) until capture(None).  Outlives
+        close() and open(), so reconnects stay in one file.  mmap=True writes
+        through a shared mapping."""
+        if self._capture is not None:
+            self._capture.close()
+        self._capture = None if path is None else CaptureWriter(path, mmap=mmap)
+        return self
+
+    def capture_stats(self):
+        if self._capture is None:
+            return None
+        return self._capture.stats()
+
+    def replay(self, path: str, speed: float = 1.0, tx: bool = False):
+        """Feed a capture file to this device's subscribers as if it was
+        being read again, speed times faster (0: as fast as possible).
+        Returns the started Replay, wait() on it for the end."""
+        return Replay(path, self, speed=speed, tx=tx).start()
+
+    def correlate(self, key: callable = None, in_flight: int = 8):
+        """Set how query() matches replies: in order (FIFO) by default, or by
+        key(msg) == key(cmd) so they may arrive in any order.  Up to
+        in_flight queries are pipelined before query() waits for a slot."""
+        if self._correlator is not None:
+            self._correlator.cancel(reason="correlation changed")
+        if self._rtt_total is None:
+            self._rtt_total = Histogram()
+        self._correlator = Correlator(
+            key=key, in_flight=in_flight, rtt_total=self._rtt_total
+        )
+        return self
+
+    def query(self, cmd, timeout: float = None, key: Any = None):
+        """send(cmd) and return a concurrent.futures.Future for its reply.
+        Raises TimeoutError from result() after timeout (QUERY_TIMEOUT)
+        seconds.  key overrides key(cmd) for keyed correlation.  Each
+        received message is one reply, so give the device a framer."""
+        if self._correlator is None:
+            self.correlate()
+        if timeout is None:
+            timeout = self.QUERY_TIMEOUT
+        return self._correlator.submit(cmd, self.send, timeout=timeout, key=key)
+
+    def query_stats(self, reset: bool = False):
+        if self._correlator is None:
+            return None
+        return self._correlator.stats(reset=reset)
 
     def subscribe(
-        self, name: str, call_back: callable, event: str = None, cookie: Any = None
+        self,
+        name: str,
+        call_back: callable,
+        event: str = None,
+        cookie: Any = None,
+        batch: bool = False,
+        where: Any = None,
+        encoding: str = None,
+        **throttle,
     ):
+        # throttle: max_rate, debounce, latest_only (see EventHandler.subscribe)
+        # encoding: decode bytes payloads for this subscriber only, undecodable
+        # bytes replaced; for binary=True devices
         if event is None:
             event = self.RX_EVENT
-        self.__event[event].subscribe(name=name, on_event=call_back, cookie=cookie)
+        if encoding is not None:
+            call_back = _as_text(call_back, encoding)
+        self.__event[event].subscribe(
+            name=name,
+            on_event=call_back,
+            cookie=cookie,
+            batch=batch,
+            where=where,
+            **throttle,
+        )
 
     def unsubscribe(self, name: str, event: str = None):
         if event is None:
@@ -128,16 +400,76 @@ class BaseCommDeviceHelper(ABC):
         self.__event[event].post(payload="Stop logging topic %s to %s" % (event, name))
         self.unsubscribe(event=event, name=name)
 
-    def open(self):
+    def __make_threads(self):
+        # Threads run once, so every open() after a close() needs new ones
+        label = self.name[:3].lower()
+        self.__inT = Thread(
+            name=label + "IT", target=self.__recv_proc, args=(self.__inQ,)
+        )
+        self.__outT = Thread(
+            name=label + "OT", target=self.__send_proc, args=(self.__outQ,)
+        )
+        self.__distT = Thread(name=label + "DT", target=self.__dist_proc)
+
+    def open(self, reactor=None):
+        """Start the input, output and distribution threads, or with a
+        Reactor (see reactor.py) have its thread do all three instead.
+        A closed device can be opened again, e.g. to reconnect; subscribers
+        and data still queued for send() are kept."""
         self.continue_thread = True
         self._open()
-        self.__inT.start()
-        self.__outT.start()
-        self.__distT.start()
+        for framer in (self.framer, self._reactor_framer):
+            if framer is not None:
+                # Drop a partial frame left over from the last connection
+                framer.reset()
+        # Before any reader runs, so a loss it sees right away is not missed
+        self.connected = True
+        self.last_error = None
+        if reactor is not None:
+            try:
+                self._loop = reactor.register(self)
+            except Exception:
+                self.connected = False
+                raise
+            self._reactor = reactor
+            if len(self.__outQ):
+                # Left from the last connection
+                self._loop.call_soon(self._on_writable)
+        else:
+            if self.__inT.ident is not None:
+                self.__make_threads()
+            self.__inT.start()
+            self.__outT.start()
+            self.__distT.start()
+        self.__event[self.STATE_EVENT].post(payload={"connected": True, "error": None})
         return self
 
+    def _connection_lost(self, error: Exception = None):
+        """The transport hit end of stream or failed while open.  Called on
+        the thread that noticed; only posts to STATE_EVENT, reconnecting is
+        left to the owner (see DevicePool)."""
+        if not self.continue_thread or not self.connected:
+            return
+        self.connected = False
+        self.last_error = error
+        self.debug_write(topic="LOST", data=repr(error))
+        self.__event[self.STATE_EVENT].post(
+            payload={"connected": False, "error": repr(error) if error else None}
+        )
+
     def close(self):
         self.continue_thread = False
+        was_connected, self.connected = self.connected, False
+        if self._correlator is not None:
+            self._correlator.cancel()
+        if self._loop is not None:
+            try:
+                self._reactor.unregister(self, self._loop)
+            except TimeoutError as e:
+                # Still queued: the loop drops the descriptor once it gets there
+                self.debug_write(topic="ERROR", data=repr(e))
+            self._reactor = self._loop = None
+            self.__unsend()
         self._close()
         if self.__inT.is_alive():
             self.__inQ.put(item=None)
@@ -146,10 +478,96 @@ class BaseCommDeviceHelper(ABC):
             self.__outQ.put(item=None)
             self.__outT.join(timeout=4)
         if self.__distT.is_alive():
-            self.__outQ.put(item=None)
+            self.__inQ.put(item=None)
             self.__distT.join(timeout=4)
+        if self._capture is not None:
+            self._capture.flush()
+        if was_connected:
+            self.__event[self.STATE_EVENT].post(
+                payload={"connected": False, "error": None}
+            )
+        return self
+
+    def instrument_queues(self, enable: bool = True):
+        self.__inQ.instrument(enable=enable)
+        self.__outQ.instrument(enable=enable)
+        return self
+
+    def queue_stats(self, reset: bool = False):
+        return {
+            "in": self.__inQ.stats(reset=reset),
+            "out": self.__outQ.stats(reset=reset),
+        }
+
+    def time_subscribers(self, enable: bool = True):
+        """Time every RX/TX subscriber callback, see metrics()["dispatch"]."""
+        for eventer in self.__event.values():
+            eventer.time_subscribers(enable=enable)
+        return self
+
+    def metrics(self):
+        """Snapshot of the traffic counters, queue depths, per-subscriber
+        dispatch seconds (once time_subscribers() is on) and query() round
+        trips (once correlate() is on).  Counters only grow, see metrics.py
+        for serving these to Prometheus."""
+        received = sum(
+            framer.received
+            for framer in (self.framer, self._reactor_framer)
+            if framer is not None
+        )
+        return {
+            "device": self.bus_id,
+            "kind": self.name,
+            "connected": self.connected,
+            "rx_msgs": self.rx_msgs,
+            "rx_bytes": self.rx_bytes + received,
+            "tx_msgs": self.tx_msgs,
+            "tx_bytes": self.tx_bytes,
+            "tx_errors": self.tx_errors,
+            "queue_in": len(self.__inQ),
+            "queue_out": len(self.__outQ),
+            "dispatch": {
+                event: eventer.dispatch_stats()
+                for event, eventer in self.__event.items()
+            },
+            "rtt": None if self._rtt_total is None else self._rtt_total.snapshot(),
+        }
+
+    def attach_bus(self, root: str = None, bus=None):
+        """Mirror RX/TX posts onto the EventBus as <root>/rx and <root>/tx,
+        root defaulting to dev/<kind>/<bus_id>, e.g. dev/serial/ttyUSB0."""
+        if root is None:
+            kind = self.name.lower().replace("helper", "") or self.name
+            root = "dev/%s/%s" % (kind, self.bus_id)
+        self.__event[self.RX_EVENT].bridge(topic=root + "/rx", bus=bus)
+        self.__event[self.TX_EVENT].bridge(topic=root + "/tx", bus=bus)
+        return self
+
+    def detach_bus(self):
+        for eventer in self.__event.values():
+            eventer.bridge(topic=None)
+        return self
+
+    def dispatch_async(self, enable: bool = True, **kwargs):
+        """Run RX/TX subscribers on per-subscriber lanes of a shared thread pool
+        so a slow callback no longer holds up the device threads.  kwargs are
+        passed to EventHandler.dispatch_async (executor, backlog, policy)."""
+        for eventer in self.__event.values():
+            eventer.dispatch_async(enable=enable, **kwargs)
         return self
 
+    def lane_stats(self, reset: bool = False):
+        return {
+            event: eventer.lane_stats(reset=reset)
+            for event, eventer in self.__event.items()
+        }
+
+    def throttle_stats(self, reset: bool = False):
+        return {
+            event: eventer.throttle_stats(reset=reset)
+            for event, eventer in self.__event.items()
+        }
+
     def debug_on(
         self,
         file_name=None,
@@ -193,35 +611,207 @@ class BaseCommDeviceHelper(ABC):
             self.debug_file.info(entry)
 
     def __dbg_callback__(self, msg):
-        if (
-            self.debug_file is not None
-            and msg is not None
-            and msg["payload"] is not None
-        ):
-            payload = msg["payload"]
-            if isinstance(payload, bytes):
-                payload = payload.decode("ascii")
+        if self.debug_file is not None and msg is not None and msg.payload is not None:
+            payload = msg.payload
+            if isinstance(payload, (bytes, bytearray, memoryview)):
+                payload = str(payload, "ascii", "backslashreplace")
             if "\r\n" in payload:
                 payload = payload.replace("\r\n", "")
             elif "\n" in payload:
                 payload = payload.replace("\n", "")
-            self.debug_write(topic=msg["event"], data=payload)
+            self.debug_write(topic=msg.event, data=payload)
+
+    def _read_ready(self):
+        """Read what the transport has ready without blocking and return the
+        complete messages, None once the peer has closed."""
+        framer = self.framer
+        if framer is None:
+            # A reactor reads byte streams: frame lines, as readline() did.
+            # Kept aside, a reopen without a reactor goes back to _recv()
+            framer = self._reactor_framer
+            if framer is None:
+                framer = LineFramer(encoding=None if self.binary else "ascii")
+                self._reactor_framer = framer
+        try:
+            msgs = framer.fill(self._recv_into)
+        except BlockingIOError:
+            return []
+        except OSError as e:
+            self._connection_lost(e)
+            return None
+        if msgs is None and not self.EOF_ON_EMPTY_READ:
+            # A read timeout, not the end of the stream
+            return []
+        return msgs
+
+    def _post(self, event: str, payloads: list):
+        # For transports that deliver without the input/output threads
+        self.__event[event].post_many(payloads=payloads)
+
+    def _on_readable(self):
+        # Reactor thread: fileno() is readable
+        msgs = self._read_ready()
+        if msgs is None:
+            self._connection_lost()
+            return False
+        if msgs:
+            capture = self._capture
+            if capture is not None:
+                capture.write(RX, msgs)
+        self._received(msgs)
+        return True
+
+    def _received(self, msgs: list):
+        # Messages read (or replayed): count, answer queries, post
+        self.rx_msgs += len(msgs)
+        if self._correlator is not None and msgs:
+            self._correlator.match(msgs)
+        self.__event[self.RX_EVENT].post_many(payloads=msgs)
+
+    def _on_writable(self):
+        # Reactor thread: write what send() queued until the transport would
+        # block, then wait for EVENT_WRITE to go on
+        loop = self._loop
+        if loop is None:
+            # Closed after this call was scheduled
+            return
+        pending = self._pending
+        coalescer = self._coalescer
+        done = []
+        try:
+            while True:
+                if not pending:
+                    batch = self.__outQ.get_many(max_items=self.BATCH_SIZE, timeout=0)
+                    if not batch:
+                        break
+                    if coalescer is None:
+                        for data in batch:
+                            pending.append([[data], memoryview(self._encode(data))])
+                    else:
+                        for chunk in coalescer.chunks(batch):
+                            data = b"".join(map(self._encode, chunk))
+                            pending.append([chunk, memoryview(data)])
+                while pending:
+                    entry = pending[0]
+                    count = self._write_some(entry[1])
+                    if count < len(entry[1]):
+                        entry[1] = entry[1][count:]
+                        raise BlockingIOError
+                    pending.popleft()
+                    if coalescer is not None:
+                        coalescer.count(entry[0])
+                    done += entry[0]
+        except BlockingIOError:
+            loop.want_write(self)
+        except OSError as e:
+            self.tx_errors += 1
+            loop.want_write(self, False)
+            self.__unsend()
+            self._connection_lost(e)
+        else:
+            loop.want_write(self, False)
+        finally:
+            if done:
+                self.__sent(done)
+
+    def __unsend(self):
+        # Reactor writes not (fully) taken go back to the front of the queue,
+        # a partly written one whole
+        while self._pending:
+            items, _ = self._pending.pop()
+            for data in reversed(items):
+                self.__outQ.put_back(item=data)
+
+    def __write(self, batch: list):
+        # Send a batch and post it to the TX subscribers.  When the transport
+        # fails partway, what was not sent goes back to the front of the
+        # queue for the next connection and what was sent is still posted
+        coalescer = self._coalescer
+        sent = 0
+        try:
+            if coalescer is None:
+                for data in batch:
+                    self._send(data=data)
+                    sent += 1
+            else:
+                for chunk in coalescer.chunks(batch):
+                    # A failed chunk is resent whole
+                    self._send_many(chunk)
+                    coalescer.count(chunk)
+                    self.__sent(chunk)
+                    sent += len(chunk)
+        except OSError:
+            for data in reversed(batch[sent:]):
+                self.__outQ.put_back(item=data)
+            if coalescer is None and sent:
+                self.__sent(batch[:sent])
+            raise
+        if coalescer is None:
+            self.__sent(batch)
+
+    def __sent(self, items: list):
+        if self._capture is not None and items:
+            self._capture.write(TX, items)
+        self.tx_msgs += len(items)
+        self.tx_bytes += sum(map(_wire_size, items))
+        self.__event[self.TX_EVENT].post_many(payloads=items)
 
     def __process_input__(self, queue: Q):
+        if self.framer is not None:
+            return self.__process_frames__(queue)
         while self.continue_thread:
-            data = self._recv()
+            try:
+                data = self._recv()
+            except OSError as e:
+                self._connection_lost(e)
+                break
             if data is not None and len(data) > 0:
+                self.rx_bytes += len(data)
+                if self._capture is not None:
+                    self._capture.write(RX, [data])
                 queue.put(item=data)
 
+    def __process_frames__(self, queue: Q):
+        framer = self.framer
+        while self.continue_thread:
+            try:
+                msgs = framer.fill(self._recv_into)
+            except OSError as e:
+                # Unless close() shut the transport under this read
+                self._connection_lost(e)
+                break
+            if msgs is None:
+                if not self.EOF_ON_EMPTY_READ:
+                    # The read timed out, the device is just idle
+                    continue
+                # End of stream
+                self._connection_lost()
+                break
+            if msgs:
+                capture = self._capture
+                if capture is not None:
+                    capture.write(RX, msgs)
+                queue.put_many(msgs)
+
     def __process_output__(self, queue: Q):
         while self.continue_thread:
-            data = queue.get(timeout=5)
-            if data is not None:
-                self._send(data=data)
-                self.__event[self.TX_EVENT](payload=data)
+            batch = queue.get_many(max_items=self.BATCH_SIZE, timeout=5)
+            coalescer = self._coalescer
+            if coalescer is not None and batch:
+                batch = coalescer.linger(queue, batch)
+            if None in batch:
+                # close() waking this thread up
+                batch = [data for data in batch if data is not None]
+            try:
+                self.__write(batch)
+            except OSError as e:
+                self.tx_errors += 1
+                self._connection_lost(e)
+                break
 
     def __distribute_input__(self):
         while self.continue_thread:
-            data = self.__inQ.get(timeout=5)
-            if data is not None:
-                self.__event[self.RX_EVENT](payload=data)
+            batch = self.__inQ.get_many(max_items=self.BATCH_SIZE, timeout=5)
+            if None in batch:
+                batch = [data for data in batch if data is not None]
+            self._received(batch)
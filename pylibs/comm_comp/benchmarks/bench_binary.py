@@ -0,0 +1,124 @@
+#!/bin/python3
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+# CPU per received message, text against binary=True.  A forked feeder
+# writes --count lines into one end of a socketpair; the device on the other
+# end frames them on its input thread and hands them to --subs subscribers
+# on its distribution thread.  "binary + text sub" has one of them ask for
+# text with subscribe(..., encoding="ascii"), so only it pays for decoding.
+#   Usage:   >python3 bench_binary.py --count 500000 --subs 1 4
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from base_dev_helper import BaseCommDeviceHelper
+from framing import LineFramer
+
+LINE = b"$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47\r\n"
+
+
+class SocketDevice(BaseCommDeviceHelper):
+    def __init__(self, sock: socket.socket, binary: bool):
+        self._socket = sock
+        super(SocketDevice, self).__init__(
+            address="pair%d" % sock.fileno(), framer=LineFramer(), binary=binary
+        )
+
+    def debug_on(self, *args, **kwargs):
+        pass
+
+    def _send(self, data):
+        self._socket.sendall(data)
+
+    def _recv(self, size=1024):
+        return self._socket.recv(size)
+
+    def _recv_into(self, buffer):
+        return self._socket.recv_into(buffer)
+
+    def _open(self):
+        pass
+
+    def _close(self):
+        self._socket.shutdown(socket.SHUT_RDWR)
+        self._socket.close()
+
+
+def feed(sock, count):
+    block = LINE * 1000
+    for _ in range(count // 1000):
+        sock.sendall(block)
+    sock.close()
+
+
+def run(count, binary, subs, text_subs):
+    near, far = socket.socketpair()
+    device = SocketDevice(near, binary=binary)
+    received = [0]
+
+    def on_in(pkt):
+        received[0] += 1
+
+    for n in range(subs):
+        device.subscribe(
+            name="sub%d" % n,
+            call_back=on_in,
+            encoding="ascii" if n < text_subs else None,
+        )
+    device.open()
+    expected = count // 1000 * 1000 * subs
+    feeder = multiprocessing.get_context("fork").Process(target=feed, args=(far, count))
+    cpu = time.process_time()
+    feeder.start()
+    deadline = time.perf_counter() + 120
+    while received[0] < expected and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    cpu = time.process_time() - cpu
+    feeder.join()
+    device.close()
+    far.close()
+    return cpu / (expected / subs) * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=500000)
+    parser.add_argument("--subs", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    print("%-22s %6s %14s" % ("mode", "subs", "CPU us/msg"))
+    for subs in args.subs:
+        for label, binary, text_subs in (
+            ("text", False, 0),
+            ("binary", True, 0),
+            ("binary + text sub", True, 1),
+        ):
+            cost = run(args.count, binary, subs, text_subs)
+            print("%-22s %6d %14.2f" % (label, subs, cost))
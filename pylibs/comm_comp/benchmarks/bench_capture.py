@@ -0,0 +1,106 @@
+#!/bin/python3
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+# Frames/s written to a capture file, buffered against mmap, in batches
+# of --batch frames as the input thread hands them over, then frames/s a
+# max-speed replay of that file delivers to one subscriber.
+#   Usage:   >python3 bench_capture.py --count 1000000 --batch 1 16
+
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import time
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from base_dev_helper import BaseCommDeviceHelper
+from capture import RX, CaptureWriter
+
+LINE = b"$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47\r\n"
+
+
+class SocketDevice(BaseCommDeviceHelper):
+    def __init__(self, sock: socket.socket):
+        self._socket = sock
+        super(SocketDevice, self).__init__(address="pair%d" % sock.fileno())
+
+    def debug_on(self, *args, **kwargs):
+        pass
+
+    def _send(self, data):
+        self._socket.sendall(data)
+
+    def _recv(self, size=1024):
+        return self._socket.recv(size)
+
+    def _open(self):
+        pass
+
+    def _close(self):
+        self._socket.close()
+
+
+def write(path, count, batch, mmap):
+    writer = CaptureWriter(path, mmap=mmap)
+    frames = [LINE] * batch
+    start = time.perf_counter()
+    for _ in range(count // batch):
+        writer.write(RX, frames)
+    writer.close()
+    return count // batch * batch / (time.perf_counter() - start)
+
+
+def replay(path):
+    near, far = socket.socketpair()
+    device = SocketDevice(near)
+    received = [0]
+
+    def on_in(pkt):
+        received[0] += 1
+
+    device.subscribe(name="sink", call_back=on_in)
+    start = time.perf_counter()
+    device.replay(path, speed=0).wait()
+    elapsed = time.perf_counter() - start
+    near.close()
+    far.close()
+    return received[0] / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1000000)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 16])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.cap")
+        print("%-10s %6s %14s" % ("writer", "batch", "frames/s"))
+        for batch in args.batch:
+            for label, mmap in (("buffered", False), ("mmap", True)):
+                rate = write(path, args.count, batch, mmap)
+                print("%-10s %6d %14.0f" % (label, batch, rate))
+        print("max-speed replay: %.0f frames/s" % replay(path))
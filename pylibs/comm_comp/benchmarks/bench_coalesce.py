@@ -0,0 +1,98 @@
+#!/bin/python3
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+# Short commands/s out of one TCPHelper, one _send() per command against
+# coalesce() with a few windows.  --count commands are send() as fast as
+# the caller can; the clock stops when a local server has read them all.
+# "writes" is the number of send system calls the output thread made.
+#   Usage:   >python3 bench_coalesce.py --count 100000 --windows 0 0.001
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from tcp_helper import TCPHelper
+
+COMMAND = "MEAS:VOLT?\n"
+
+
+class QuietTCPHelper(TCPHelper):
+    def debug_on(self, *args, **kwargs):
+        pass
+
+
+def drain(listener, expected, done):
+    conn, _ = listener.accept()
+    received = 0
+    while received < expected:
+        data = conn.recv(1 << 16)
+        if not data:
+            break
+        received += len(data)
+    done.set()
+    conn.close()
+
+
+def run(count, window):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    done = threading.Event()
+    thread = threading.Thread(
+        target=drain, args=(listener, count * len(COMMAND), done), daemon=True
+    )
+    thread.start()
+
+    device = QuietTCPHelper("127.0.0.1:%d" % listener.getsockname()[1])
+    if window is not None:
+        device.coalesce(window=window)
+    device.open()
+    start = time.perf_counter()
+    for _ in range(count):
+        device.send(COMMAND)
+    done.wait(timeout=60)
+    elapsed = time.perf_counter() - start
+    stats = device.coalesce_stats()
+    device.close()
+    listener.close()
+    writes = count if stats is None else stats["writes"]
+    return count / elapsed, writes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 0.001])
+    args = parser.parse_args()
+
+    print("%-16s %12s %10s %12s" % ("mode", "commands/s", "writes", "items/write"))
+    for window in [None] + args.windows:
+        label = "per item" if window is None else "window %gs" % window
+        rate, writes = run(args.count, window)
+        print("%-16s %12.0f %10d %12.1f" % (label, rate, writes, args.count / writes))
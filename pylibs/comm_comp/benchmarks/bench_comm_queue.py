@@ -0,0 +1,88 @@
+#!/bin/python3
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+# Compares the deque backed comm_queues.Queue against the original list backed
+# queue.  Each run pre-loads the queue to the given depth, then times a steady
+# stream of put()/get() pairs at that depth.
+#   Usage:   >python3 bench_comm_queue.py --ops 20000
+
+import argparse
+import os
+import sys
+import time
+from threading import Condition
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from comm_queues import Queue, DROP_OLDEST
+
+
+class ListQueue:
+    """The pre-deque implementation, kept here only as the baseline."""
+
+    def __init__(self):
+        self.items = []
+        self.condition = Condition()
+
+    def put(self, item):
+        with self.condition:
+            if item is not None:
+                self.items.insert(0, item)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        with self.condition:
+            if not self.items:
+                return None
+            return self.items.pop()
+
+
+def run(queue, depth, ops):
+    queue.items.extend(range(depth))
+    start = time.perf_counter()
+    for i in range(ops):
+        queue.put(i)
+        queue.get()
+    return ops / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=20000, help="put/get pairs per run")
+    parser.add_argument(
+        "--depths",
+        type=str,
+        default="10000,100000,1000000",
+        help='Comma separated queue depths. Default: "10000,100000,1000000"',
+    )
+    args = parser.parse_args()
+
+    print(
+        "%10s %16s %16s %16s" % ("depth", "list ops/s", "deque ops/s", "bounded ops/s")
+    )
+    for depth in [int(d) for d in args.depths.split(",")]:
+        legacy = run(ListQueue(), depth, args.ops)
+        ring = run(Queue(), depth, args.ops)
+        bounded = run(Queue(maxsize=depth, policy=DROP_OLDEST), depth, args.ops)
+        print("%10d %16.0f %16.0f %16.0f" % (depth, legacy, ring, bounded))
@@ -0,0 +1,100 @@
+#!/bin/python3
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+# Posts per second through EventHandler.post() against the original
+# dict-copying dispatch, for a range of subscriber counts.  Packet callbacks
+# are timed both with legacy pkt["payload"] indexing and with pkt.payload.
+#   Usage:   >python3 bench_event_handler.py --posts 200000 --subscribers 1,5,50
+
+import argparse
+import os
+import sys
+import time
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from event_handler.event_handler import EventHandler
+
+
+class DictEventHandler:
+    """The dict-copying post(), kept here only as the baseline."""
+
+    def __init__(self, **kwargs):
+        self.packet = dict(kwargs, dest=None, payload=None, cookie=None)
+        self.cb_routines = {}
+
+    def subscribe(self, name, on_event, cookie=None):
+        self.cb_routines[name] = {"on_event": on_event, "cookie": cookie}
+
+    def post(self, payload, **kwargs):
+        packet = self.packet.copy()
+        for field in kwargs:
+            packet[field] = kwargs[field]
+        packet["payload"] = payload
+        for name, cb_routine in self.cb_routines.copy().items():
+            packet["dest"] = name
+            packet["cookie"] = cb_routine["cookie"]
+            cb_routine["on_event"](packet)
+
+
+def on_event(pkt):
+    return pkt["payload"]
+
+
+def on_event_attr(pkt):
+    return pkt.payload
+
+
+def run(eventer, subscribers, posts, on_event=on_event):
+    for n in range(subscribers):
+        eventer.subscribe(name="sub%d" % n, on_event=on_event)
+    post = eventer.post
+    start = time.perf_counter()
+    for i in range(posts):
+        post(i)
+    return posts / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=200000)
+    parser.add_argument(
+        "--subscribers",
+        type=str,
+        default="1,5,50",
+        help='Comma separated subscriber counts. Default: "1,5,50"',
+    )
+    args = parser.parse_args()
+
+    print(
+        "%12s %16s %16s %16s"
+        % ("subscribers", "dict posts/s", "pkt[] posts/s", "pkt.attr posts/s")
+    )
+    for count in [int(c) for c in args.subscribers.split(",")]:
+        legacy = run(DictEventHandler(event="bench", src="bench"), count, args.posts)
+        indexed = run(EventHandler(event="bench", src="bench"), count, args.posts)
+        attr = run(
+            EventHandler(event="bench", src="bench"), count, args.posts, on_event_attr
+        )
+        print("%12d %16.0f %16.0f %16.0f" % (count, legacy, indexed, attr))
@@ -0,0 +1,111 @@
+#!/bin/python3
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+# Throughput of each framer over a synthetic --mb MB stream.  Frames of
+# --min to --max payload bytes are encoded once into a 1 MB block that is
+# replayed through framer.fill() in --chunk byte reads, the way a device
+# input thread calls it with socket.recv_into.
+#   Usage:   >python3 bench_framing.py --mb 100 --chunk 65536
+
+import argparse
+import os
+import random
+import sys
+import time
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from framing import LineFramer, RegexFramer, LengthPrefixFramer
+from framing import SLIPFramer, COBSFramer
+
+BLOCK = 1 << 20
+
+
+def payloads(low, high, text):
+    rng = random.Random(1)
+    while True:
+        size = rng.randint(low, high)
+        if text:
+            yield bytes(rng.choice(b"0123456789,.$ABCDEFGNPS") for _ in range(size))
+        else:
+            yield rng.randbytes(size)
+
+
+def block(framer, low, high, text):
+    """About 1 MB of whole encoded frames, and how many there are."""
+    encoded = []
+    length = count = 0
+    for payload in payloads(low, high, text):
+        frame = framer.encode(payload)
+        if length + len(frame) > BLOCK:
+            return b"".join(encoded), count
+        encoded.append(frame)
+        length += len(frame)
+        count += 1
+
+
+def run(framer, megabytes, chunk, low, high, text):
+    data, per_block = block(framer, low, high, text)
+    view = memoryview(data)
+    total = int(megabytes * BLOCK / len(data)) * len(data)
+    state = {"offset": 0, "left": total}
+
+    def recv_into(buffer):
+        size = min(len(buffer), chunk, state["left"])
+        offset = state["offset"]
+        if offset + size > len(data):
+            size = len(data) - offset
+        buffer[:size] = view[offset : offset + size]
+        state["offset"] = (offset + size) % len(data)
+        state["left"] -= size
+        return size
+
+    frames = 0
+    start = time.perf_counter()
+    while state["left"]:
+        frames += len(framer.fill(recv_into))
+    elapsed = time.perf_counter() - start
+    expected = per_block * total // len(data)
+    return total / elapsed / 1e6, frames / elapsed, frames == expected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=float, default=100, help="stream size in MB")
+    parser.add_argument("--chunk", type=int, default=64 << 10, help="bytes per read")
+    parser.add_argument("--min", type=int, default=16, help="smallest payload")
+    parser.add_argument("--max", type=int, default=256, help="largest payload")
+    args = parser.parse_args()
+
+    print("%-26s %10s %12s %6s" % ("framer", "MB/s", "frames/s", "ok"))
+    for label, framer, text in (
+        ("LineFramer (str)", LineFramer(), True),
+        ("LineFramer (bytes)", LineFramer(encoding=None), True),
+        ("RegexFramer \\r?\\n", RegexFramer(rb"\r?\n"), True),
+        ("LengthPrefixFramer !H", LengthPrefixFramer(), False),
+        ("SLIPFramer", SLIPFramer(), False),
+        ("COBSFramer", COBSFramer(), False),
+    ):
+        rate, frames, ok = run(framer, args.mb, args.chunk, args.min, args.max, text)
+        print("%-26s %10.1f %12.0f %6s" % (label, rate, frames, ok))
@@ -0,0 +1,135 @@
+#!/bin/python3
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+# CPU per received message with the built-in counters only, and with
+# time_subscribers() timing every callback too.  A forked feeder writes
+# --count lines into one end of a socketpair; the device on the other end
+# frames them and hands them to --subs subscribers.  Also times one
+# Prometheus scrape of --devices devices.
+#   Usage:   >python3 bench_metrics.py --count 500000 --subs 1 4 --devices 200
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from base_dev_helper import BaseCommDeviceHelper
+from framing import LineFramer
+from metrics import prometheus_text
+
+LINE = b"$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47\r\n"
+
+
+class SocketDevice(BaseCommDeviceHelper):
+    def __init__(self, sock: socket.socket):
+        self._socket = sock
+        super(SocketDevice, self).__init__(
+            address="pair%d" % sock.fileno(), framer=LineFramer()
+        )
+
+    def debug_on(self, *args, **kwargs):
+        pass
+
+    def _send(self, data):
+        self._socket.sendall(data)
+
+    def _recv(self, size=1024):
+        return self._socket.recv(size)
+
+    def _recv_into(self, buffer):
+        return self._socket.recv_into(buffer)
+
+    def _open(self):
+        pass
+
+    def _close(self):
+        self._socket.shutdown(socket.SHUT_RDWR)
+        self._socket.close()
+
+
+def feed(sock, count):
+    block = LINE * 1000
+    for _ in range(count // 1000):
+        sock.sendall(block)
+    sock.close()
+
+
+def run(count, subs, timed):
+    near, far = socket.socketpair()
+    device = SocketDevice(near)
+    received = [0]
+
+    def on_in(pkt):
+        received[0] += 1
+
+    for n in range(subs):
+        device.subscribe(name="sub%d" % n, call_back=on_in)
+    device.time_subscribers(enable=timed)
+    device.open()
+    expected = count // 1000 * 1000 * subs
+    feeder = multiprocessing.get_context("fork").Process(target=feed, args=(far, count))
+    cpu = time.process_time()
+    feeder.start()
+    deadline = time.perf_counter() + 120
+    while received[0] < expected and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    cpu = time.process_time() - cpu
+    feeder.join()
+    device.close()
+    far.close()
+    return cpu / (expected / subs) * 1e6
+
+
+def scrape(devices):
+    pairs = [socket.socketpair() for _ in range(devices)]
+    helpers = [SocketDevice(near).time_subscribers() for near, _ in pairs]
+    for helper in helpers:
+        helper.subscribe(name="sink", call_back=lambda pkt: None)
+    start = time.perf_counter()
+    text = prometheus_text(helpers)
+    elapsed = time.perf_counter() - start
+    for near, far in pairs:
+        near.close()
+        far.close()
+    return elapsed * 1e3, len(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=500000)
+    parser.add_argument("--subs", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--devices", type=int, default=200)
+    args = parser.parse_args()
+
+    print("%-22s %6s %14s" % ("mode", "subs", "CPU us/msg"))
+    for subs in args.subs:
+        for label, timed in (("counters", False), ("counters + timing", True)):
+            cost = run(args.count, subs, timed)
+            print("%-22s %6d %14.2f" % (label, subs, cost))
+    elapsed, size = scrape(args.devices)
+    print("scrape of %d devices: %.1f ms, %d bytes" % (args.devices, elapsed, size))
@@ -0,0 +1,146 @@
+#!/bin/python3
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+# Recovery of a DevicePool of --devices TCPHelper devices on one Reactor
+# from a simulated switch reboot: the local server resets every connection
+# and refuses new ones for --outage seconds.  Reports how long after the
+# server came back every device was connected again, and how many connect
+# attempts failed on the way.
+#   Usage:   >python3 bench_pool.py --devices 200 --outage 2
+
+import argparse
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from device_pool import DevicePool
+from reactor import Reactor
+from tcp_helper import TCPHelper
+
+
+class QuietTCPHelper(TCPHelper):
+    def debug_on(self, *args, **kwargs):
+        pass
+
+
+class Server:
+    """Single thread selector server that accepts and drains connections."""
+
+    def __init__(self):
+        self.port = 0
+        self.selector = selectors.DefaultSelector()
+        self.listener = None
+        self.lock = threading.Lock()
+        self.listen()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def listen(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(("127.0.0.1", self.port))
+        listener.listen(1024)
+        listener.setblocking(False)
+        self.port = listener.getsockname()[1]
+        with self.lock:
+            self.listener = listener
+            self.selector.register(listener, selectors.EVENT_READ)
+
+    def drop(self):
+        with self.lock:
+            for key in list(self.selector.get_map().values()):
+                self.selector.unregister(key.fileobj)
+                key.fileobj.close()
+            self.listener = None
+
+    def run(self):
+        while True:
+            for key, mask in self.selector.select(timeout=0.05):
+                with self.lock:
+                    sock = key.fileobj
+                    if sock.fileno() < 0:
+                        continue
+                    if sock is self.listener:
+                        conn, _ = sock.accept()
+                        conn.setblocking(False)
+                        self.selector.register(conn, selectors.EVENT_READ)
+                        continue
+                    try:
+                        data = sock.recv(4096)
+                    except OSError:
+                        data = b""
+                    if not data:
+                        self.selector.unregister(sock)
+                        sock.close()
+
+
+def run(devices, outage):
+    server = Server()
+    reactor = Reactor()
+    helpers = [QuietTCPHelper("127.0.0.1:%d" % server.port) for _ in range(devices)]
+    pool = DevicePool(devices=helpers, reactor=reactor, interval=1.0)
+
+    start = time.perf_counter()
+    pool.open(timeout=10)
+    opened = time.perf_counter() - start
+
+    server.drop()
+    time.sleep(outage)
+    server.listen()
+    start = time.perf_counter()
+    while not all(stat["reconnects"] for stat in pool.stats()):
+        if time.perf_counter() - start > 60:
+            break
+        time.sleep(0.01)
+    recovered = time.perf_counter() - start
+    stats = pool.stats()
+    pool.close()
+    reactor.stop()
+    return (
+        opened,
+        recovered,
+        sum(stat["connected"] is False for stat in stats),
+        sum(stat["failures"] for stat in stats),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, nargs="+", default=[20, 200])
+    parser.add_argument("--outage", type=float, default=2.0, help="seconds down")
+    args = parser.parse_args()
+
+    print(
+        "%8s %10s %12s %6s %16s"
+        % ("devices", "open s", "recovery s", "down", "failed attempts")
+    )
+    for devices in args.devices:
+        opened, recovered, down, failures = run(devices, args.outage)
+        print(
+            "%8d %10.3f %12.3f %6d %16d" % (devices, opened, recovered, down, failures)
+        )
@@ -0,0 +1,121 @@
+#!/bin/python3
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+# Distribution thread cost of post() per message against post_many() per
+# batch.  A producer thread feeds a comm_queues.Queue at --rate msgs/s in 1 ms
+# bursts; the distribution thread drains it with get_many() like
+# BaseCommDeviceHelper.__distribute_input__ and posts to --subscribers legacy
+# (per item) or batch-aware callbacks.  Reports the distribution thread's CPU
+# load at that rate, and the ceiling when it drains a pre-filled queue.
+#   Usage:   >python3 bench_post_many.py --rate 100000 --seconds 3
+
+import argparse
+import os
+import sys
+import time
+from threading import Thread
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from comm_queues import Queue
+from event_handler.event_handler import EventHandler
+
+BATCH_SIZE = 64
+
+
+def producer(queue, rate, total):
+    burst = max(rate // 1000, 1) if rate else 1000
+    chunk = ["$GPGGA,123519,4807.038,N,01131.000,E"] * burst
+    start = time.perf_counter()
+    sent = 0
+    while sent < total:
+        queue.put_many(chunk)
+        sent += burst
+        if rate:
+            delay = start + sent / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    queue.put_many(["stop"])
+
+
+def distributor(queue, eventer, many, result):
+    cpu = time.thread_time()
+    delivered = 0
+    while True:
+        batch = queue.get_many(max_items=BATCH_SIZE)
+        stop = batch[-1] == "stop"
+        if stop:
+            batch.pop()
+        if many:
+            eventer.post_many(payloads=batch)
+        else:
+            for payload in batch:
+                eventer.post(payload=payload)
+        delivered += len(batch)
+        if stop:
+            break
+    result.append((delivered, time.thread_time() - cpu))
+
+
+def run(rate, seconds, subscribers, many, batch):
+    received = [0]
+
+    def on_event(pkt):
+        received[0] += len(pkt.payload) if batch else 1
+
+    eventer = EventHandler(src="bench", event="benchEvent")
+    for n in range(subscribers):
+        eventer.subscribe(name="sub%d" % n, on_event=on_event, batch=batch)
+    queue = Queue()
+    total = int((rate or 100000) * seconds)
+    result = []
+    consumer = Thread(target=distributor, args=(queue, eventer, many, result))
+    if not rate:
+        producer(queue, rate, total)
+    start = time.perf_counter()
+    consumer.start()
+    if rate:
+        producer(queue, rate, total)
+    consumer.join()
+    wall = time.perf_counter() - start
+    delivered, cpu = result[0]
+    return delivered / wall, cpu / wall
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=int, default=100000, help="msgs/s offered")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--subscribers", type=int, default=5)
+    args = parser.parse_args()
+
+    print("%-28s %14s %10s %14s" % ("mode", "msgs/s @rate", "dist CPU", "max msgs/s"))
+    for label, many, batch in (
+        ("post() per message", False, False),
+        ("post_many(), legacy subs", True, False),
+        ("post_many(), batch subs", True, True),
+    ):
+        paced, load = run(args.rate, args.seconds, args.subscribers, many, batch)
+        ceiling, _ = run(0, args.seconds, args.subscribers, many, batch)
+        print("%-28s %14.0f %9.0f%% %14.0f" % (label, paced, load * 100, ceiling))
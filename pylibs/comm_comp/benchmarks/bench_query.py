@@ -0,0 +1,149 @@
+#!/bin/python3
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+# Queries/s through query() against a peer that answers every line --rtt ms
+# after it arrived, the way a high-latency link (VPN, satellite, a slow
+# gateway) behaves.  The peer handles lines independently, so the rate is
+# bounded by round trips only and grows with how many are in flight.
+#   Usage:   >python3 bench_query.py --rtt 20 --queries 500 --in-flight 1 8 32
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from base_dev_helper import BaseCommDeviceHelper
+from framing import LineFramer
+
+
+class SocketDevice(BaseCommDeviceHelper):
+    def __init__(self, sock: socket.socket):
+        self._socket = sock
+        super(SocketDevice, self).__init__(
+            address="pair%d" % sock.fileno(), framer=LineFramer()
+        )
+
+    def debug_on(self, *args, **kwargs):
+        pass
+
+    def _send(self, data):
+        self._socket.sendall(data.encode())
+
+    def _recv(self, size=1024):
+        return self._socket.recv(size)
+
+    def _recv_into(self, buffer):
+        return self._socket.recv_into(buffer)
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def _open(self):
+        pass
+
+    def _close(self):
+        self._socket.shutdown(socket.SHUT_RDWR)
+        self._socket.close()
+
+
+def peer(sock, rtt):
+    """Echo each line back `rtt` seconds after it arrived."""
+    due = deque()
+    ready = threading.Condition()
+
+    def writer():
+        while True:
+            with ready:
+                while not due:
+                    ready.wait()
+                at, data = due.popleft()
+            if data is None:
+                return
+            time.sleep(max(at - time.monotonic(), 0))
+            sock.sendall(data)
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    buffered = b""
+    while True:
+        try:
+            data = sock.recv(65536)
+        except OSError:
+            data = b""
+        at = time.monotonic() + rtt
+        buffered += data
+        lines = buffered.split(b"\n")
+        buffered = lines.pop()
+        with ready:
+            if lines:
+                due.append((at, b"".join(line + b"\n" for line in lines)))
+            if not data:
+                due.append((at, None))
+            ready.notify()
+        if not data:
+            thread.join()
+            return
+
+
+def run(queries, in_flight, rtt):
+    near, far = socket.socketpair()
+    thread = threading.Thread(target=peer, args=(far, rtt), daemon=True)
+    thread.start()
+    device = SocketDevice(near).correlate(in_flight=in_flight).open()
+
+    start = time.perf_counter()
+    futures = deque()
+    for n in range(queries):
+        futures.append(device.query("MEAS:VOLT? %d\n" % n, timeout=10))
+        while futures and futures[0].done():
+            futures.popleft().result()
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - start
+
+    stats = device.query_stats()
+    device.close()
+    thread.join()
+    far.close()
+    return queries / elapsed, stats["answered"] == queries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rtt", type=float, default=20, help="round trip in ms")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    print("%10s %12s %8s %6s" % ("in_flight", "queries/s", "speedup", "ok"))
+    baseline = None
+    for in_flight in args.in_flight:
+        rate, ok = run(args.queries, in_flight, args.rtt / 1000)
+        baseline = baseline or rate
+        print("%10d %12.0f %7.1fx %6s" % (in_flight, rate, rate / baseline, ok))
@@ -0,0 +1,143 @@
+#!/bin/python3
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+# Threads and CPU for N devices, three threads each against one Reactor.
+# Every device is one end of a socketpair; a forked feeder process writes
+# --rate lines/s to each far end, so this process only pays for reading,
+# framing and dispatching them to one subscriber per device.  CPU is this
+# process's CPU time over wall time (100% = one core).
+#   Usage:   >python3 bench_reactor.py --devices 10 100 500 --rate 20 --seconds 3
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from base_dev_helper import BaseCommDeviceHelper
+from reactor import Reactor
+
+
+class SocketDevice(BaseCommDeviceHelper):
+    def __init__(self, sock: socket.socket):
+        self._socket = sock
+        super(SocketDevice, self).__init__(address="pair%d" % sock.fileno())
+
+    def debug_on(self, *args, **kwargs):
+        pass
+
+    def _send(self, data):
+        self._socket.sendall(data.encode())
+
+    def _recv(self, size=1024):
+        return self._socket.recv(size)
+
+    def _recv_into(self, buffer):
+        return self._socket.recv_into(buffer)
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def _open(self):
+        pass
+
+    def _close(self):
+        self._socket.shutdown(socket.SHUT_RDWR)
+        self._socket.close()
+
+
+def feed(socks, rate, seconds):
+    line = b"$GPGGA,123519,4807.038,N,01131.000,E\r\n"
+    start = time.perf_counter()
+    sent = 0
+    while sent < rate * seconds:
+        for sock in socks:
+            sock.sendall(line)
+        sent += 1
+        delay = start + sent / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def run(devices, rate, seconds, reactor_threads):
+    pairs = [socket.socketpair() for _ in range(devices)]
+    received = [0]
+
+    def on_in(pkt):
+        received[0] += 1
+
+    reactor = Reactor(threads=reactor_threads) if reactor_threads else None
+    helpers = []
+    for near, far in pairs:
+        helper = SocketDevice(near)
+        helper.subscribe(name="bench", call_back=on_in)
+        helpers.append(helper.open(reactor=reactor))
+    threads = threading.active_count()
+
+    feeder = multiprocessing.get_context("fork").Process(
+        target=feed, args=([far for near, far in pairs], rate, seconds)
+    )
+    start, cpu = time.perf_counter(), time.process_time()
+    feeder.start()
+    feeder.join()
+    expected = devices * rate * seconds
+    deadline = time.perf_counter() + 2
+    while received[0] < expected and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    wall, cpu = time.perf_counter() - start, time.process_time() - cpu
+
+    for helper in helpers:
+        helper.close()
+    for near, far in pairs:
+        far.close()
+    if reactor is not None:
+        reactor.stop()
+    return threads, cpu / wall, received[0] / expected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--rate", type=int, default=20, help="lines/s per device")
+    parser.add_argument("--seconds", type=int, default=3)
+    parser.add_argument("--reactor-threads", type=int, default=1)
+    args = parser.parse_args()
+
+    print("%8s %-12s %8s %8s %10s" % ("devices", "mode", "threads", "CPU", "delivered"))
+    for devices in args.devices:
+        for label, reactor_threads in (
+            ("threads", 0),
+            ("reactor", args.reactor_threads),
+        ):
+            threads, load, delivered = run(
+                devices, args.rate, args.seconds, reactor_threads
+            )
+            print(
+                "%8d %-12s %8d %7.1f%% %9.1f%%"
+                % (devices, label, threads, load * 100, delivered * 100)
+            )
@@ -0,0 +1,97 @@
+#!/bin/python3
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+# One producer, N consumer processes: ShmQueue against multiprocessing.Queue.
+# An empty frame tells a consumer to stop.
+#   Usage:   >python3 bench_shm_queue.py --frames 200000 --size 64 --consumers 2
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from comm_queues import ShmQueue
+
+
+def shm_consumer(queue):
+    while True:
+        stops = queue.get_many(max_items=256).count(b"")
+        if stops:
+            # Leave the other consumers their stop frames
+            queue.put_many([b""] * (stops - 1))
+            return
+
+
+def mp_consumer(queue):
+    while queue.get():
+        pass
+
+
+def run(queue, consumer, frames, size, consumers, batch=1):
+    frame = b"x" * size
+    procs = [
+        multiprocessing.Process(target=consumer, args=(queue,))
+        for _ in range(consumers)
+    ]
+    for proc in procs:
+        proc.start()
+    start = time.perf_counter()
+    if batch > 1:
+        chunk = [frame] * batch
+        for _ in range(frames // batch):
+            queue.put_many(chunk)
+    else:
+        for _ in range(frames):
+            queue.put(frame)
+    for _ in procs:
+        queue.put(b"")
+    for proc in procs:
+        proc.join()
+    return frames / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=200000)
+    parser.add_argument("--size", type=int, default=64, help="frame size in bytes")
+    parser.add_argument("--consumers", type=int, default=2)
+    args = parser.parse_args()
+
+    shm_q = ShmQueue(capacity=4 << 20)
+    try:
+        shm_rate = run(shm_q, shm_consumer, args.frames, args.size, args.consumers)
+        shm_batch_rate = run(
+            shm_q, shm_consumer, args.frames, args.size, args.consumers, batch=64
+        )
+    finally:
+        shm_q.close()
+    mp_rate = run(
+        multiprocessing.Queue(), mp_consumer, args.frames, args.size, args.consumers
+    )
+    print("%-22s %12.0f frames/s" % ("ShmQueue", shm_rate))
+    print("%-22s %12.0f frames/s" % ("ShmQueue.put_many(64)", shm_batch_rate))
+    print("%-22s %12.0f frames/s" % ("multiprocessing.Queue", mp_rate))
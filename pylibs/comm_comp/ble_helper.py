@@ -24,14 +24,21 @@ import time
 
 from bluepy.btle import Peripheral
 from comm_queues.comm_queue import Queue as Q
+from framing import Framer, LineFramer
 
 from .base_dev_helper import BaseCommDeviceHelper
 
 
 class BLEHelper(BaseCommDeviceHelper):
-    def __init__(self, address: str, port: int):
+    def __init__(
+        self, address: str, port: int, framer: Framer = None, binary: bool = False
+    ):
         super(BLEHelper, self).__init__(
-            address=address, port=port, recv_proc=self.__process_input__
+            address=address,
+            port=port,
+            recv_proc=self.__process_input__,
+            framer=framer or LineFramer(delim=b"\r\n"),
+            binary=binary,
         )
         self._device = Peripheral(deviceAddr=address, addrType="random", iface=port)
 
@@ -42,21 +49,21 @@ class BLEHelper(BaseCommDeviceHelper):
         pass
 
     def __process_input__(self, queue: Q):
-        msg = ""
+        framer = self.framer
         while self.continue_thread:
-            data = self.__recv(size=2)
+            data = self.__recv(size=framer.ring.free)
             if data is not None and len(data) > 0:
-                msg += data.decode("ascii")
-                if "\r\n" not in msg:
-                    continue
-                queue.put(item=msg)
-                msg = ""
+                msgs = framer.feed(data)
+                if msgs:
+                    queue.put_many(msgs)
 
     def __send(self, data):
-        self._socket.sendall(str(data).encode("ascii"))
+        if not isinstance(data, (bytes, bytearray)):
+            data = str(data).encode("ascii")
+        self._socket.sendall(data)
 
     def __recv(self, size=1024):
-        return self._socket.recv(2)
+        return self._socket.recv(size)
 
     def __open(self):
         pass
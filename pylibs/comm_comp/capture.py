@@ -0,0 +1,225 @@
+#!/bin/python3
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+from __future__ import absolute_import
+
+__author__ = "Erol Yesin"
+
+import mmap as _mmap
+import struct
+from threading import Event, Lock, Thread
+from time import monotonic_ns
+
+# File: MAGIC, then one record per frame: RECORD header and the payload.
+# The header is the time.monotonic_ns() the frame was read or sent, the
+# flags below and the payload length.
+MAGIC = b"PLCAP\x00\x01\x00"
+RECORD = struct.Struct("<QBI")
+RX = 0
+TX = 1
+# The payload was str, stored as UTF-8
+TEXT = 2
+
+
+class CaptureWriter:
+    """Appends frames to a capture file through a buffered file, or with
+    mmap=True through a shared mapping that grows by doubling from
+    mmap_size (nothing is lost if the process dies, the OS writes the pages
+    back).  Safe to call from the input and output threads at once."""
+
+    def __init__(
+        self,
+        path: str,
+        mmap: bool = False,
+        buffer_size: int = 1 << 16,
+        mmap_size: int = 16 << 20,
+    ):
+        self.path = path
+        self.records = 0
+        self.bytes = 0
+        self._lock = Lock()
+        self._map = None
+        if mmap:
+            self._file = open(path, "w+b")
+            self._file.truncate(max(mmap_size, len(MAGIC)))
+            self._map = _mmap.mmap(self._file.fileno(), 0)
+            self._map[: len(MAGIC)] = MAGIC
+            self._offset = len(MAGIC)
+        else:
+            self._file = open(path, "wb", buffering=buffer_size)
+            self._file.write(MAGIC)
+
+    def write(self, flags: int, payloads: list, stamp: int = None):
+        """Record payloads (bytes or str) read (RX) or sent (TX) together,
+        stamped now unless stamp (monotonic ns) is given."""
+        if stamp is None:
+            stamp = monotonic_ns()
+        with self._lock:
+            if self._file is None:
+                return
+            for payload in payloads:
+                flag = flags
+                if isinstance(payload, str):
+                    payload = payload.encode("utf-8", "surrogatepass")
+                    flag |= TEXT
+                size = len(payload)
+                if self._map is None:
+                    self._file.write(RECORD.pack(stamp, flag, size))
+                    self._file.write(payload)
+                else:
+                    offset = self._offset
+                    end = offset + RECORD.size + size
+                    if end > len(self._map):
+                        self._map.resize(max(len(self._map) * 2, end))
+                    RECORD.pack_into(self._map, offset, stamp, flag, size)
+                    self._map[offset + RECORD.size : end] = payload
+                    self._offset = end
+                self.records += 1
+                self.bytes += size
+
+    def flush(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+            elif self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            if self._map is not None:
+                self._map.flush()
+                self._map.close()
+                self._map = None
+                # Drop the unused tail of the mapping
+                self._file.truncate(self._offset)
+            self._file.close()
+            self._file = None
+
+    def stats(self):
+        return {"path": self.path, "records": self.records, "bytes": self.bytes}
+
+
+def read_capture(path: str):
+    """Yield (stamp_ns, "rx" or "tx", payload) for every record in a capture
+    file, payloads as they were captured (bytes or str).  Stops at a torn
+    last record or the zero filled tail of an mmap capture that was not
+    closed."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a capture file" % path)
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            stamp, flags, size = RECORD.unpack(head)
+            if not stamp:
+                return
+            payload = f.read(size)
+            if len(payload) < size:
+                return
+            if flags & TEXT:
+                payload = payload.decode("utf-8", "surrogatepass")
+            yield stamp, "tx" if flags & TX else "rx", payload
+
+
+class Replay:
+    """Feeds a capture file back into a device's RX subscribers, and with
+    tx=True its TX subscribers, from a thread of its own.  RX frames take
+    the path read frames take (metrics counters, query() replies), so the
+    device does not need to be open.
+
+    speed=1.0 keeps the captured timing, 10 plays it ten times faster and
+    0 (or None) as fast as the subscribers keep up.  Frames due at the same
+    time are posted as one batch."""
+
+    def __init__(self, path: str, device, speed: float = 1.0, tx: bool = False):
+        self.path = path
+        self.device = device
+        self.speed = speed
+        self.tx = tx
+        self.records = 0
+        self.seconds = 0.0
+        # Worst time a frame was posted behind its schedule
+        self.max_lag = 0.0
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = Thread(name="replayT", target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        return self.wait(timeout=4)
+
+    def wait(self, timeout: float = None):
+        """True once the whole capture was played (or stop() was called)."""
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        return self._thread is None or not self._thread.is_alive()
+
+    def _flush(self, direction, batch):
+        if direction == "rx":
+            self.device._received(batch)
+        else:
+            self.device._post(self.device.TX_EVENT, batch)
+        self.records += len(batch)
+
+    def _run(self):
+        device = self.device
+        start = monotonic_ns()
+        first = None
+        batch = []
+        batch_dir = None
+        for stamp, direction, payload in read_capture(self.path):
+            if self._stop.is_set():
+                break
+            if direction == "tx" and not self.tx:
+                continue
+            if first is None:
+                first = stamp
+            if self.speed:
+                delay = start + (stamp - first) / self.speed - monotonic_ns()
+                if delay > 0:
+                    if batch:
+                        self._flush(batch_dir, batch)
+                        batch = []
+                    if self._stop.wait(delay / 1e9):
+                        break
+                else:
+                    self.max_lag = max(self.max_lag, -delay / 1e9)
+            if batch and (direction != batch_dir or len(batch) >= device.BATCH_SIZE):
+                self._flush(batch_dir, batch)
+                batch = []
+            batch.append(payload)
+            batch_dir = direction
+        if batch and not self._stop.is_set():
+            self._flush(batch_dir, batch)
+        self.seconds = (monotonic_ns() - start) / 1e9
+
+    def stats(self):
+        return {
+            "records": self.records,
+            "seconds": self.seconds,
+            "max_lag": self.max_lag,
+        }
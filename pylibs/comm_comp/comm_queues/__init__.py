@@ -22,4 +22,13 @@ __author__ = "Erol Yesin"
 #
 
 from .comm_queue import Queue
+from .comm_queue import QueueFull
+from .comm_queue import BLOCK, DROP_OLDEST, DROP_NEWEST, RAISE
 from .comm_queue import CommQueues
+from .queue_stats import Histogram
+from .queue_stats import QueueStats
+from .shm_queue import ShmQueue
+from .shm_queue import ShmCommQueues
+from .spill_queue import SpillQueue
+from .async_queue import AsyncQueue
+from .byte_ring import ByteRing
@@ -0,0 +1,117 @@
+#!/bin/python3
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+#
+#
+
+__author__ = "Erol Yesin"
+
+import asyncio
+from collections import deque
+
+from .comm_queue import Queue
+
+
+class AsyncQueue:
+    """Awaitable view of a thread-side Queue for one event loop.
+
+    Producer threads keep calling queue.put(); coroutines await get() or
+    get_many() without parking an executor thread.  Every put runs a listener
+    that schedules at most one wake-up per loop iteration through
+    call_soon_threadsafe, and the wake-up hands batches to waiting coroutines
+    in FIFO order.
+    """
+
+    def __init__(self, queue: Queue, loop: asyncio.AbstractEventLoop = None):
+        self.queue = queue
+        self.loop = loop or asyncio.get_running_loop()
+        self._waiters = deque()
+        self._scheduled = False
+        queue.add_listener(self._on_put)
+
+    def _on_put(self):
+        # Producer thread, queue lock held
+        if not self._scheduled:
+            self._scheduled = True
+            try:
+                self.loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                # Loop already closed
+                pass
+
+    def _wake(self):
+        # Cleared first so a put racing with this drain schedules another pass
+        self._scheduled = False
+        waiters = self._waiters
+        while waiters:
+            future, max_items = waiters[0]
+            if future.done():
+                waiters.popleft()
+                continue
+            batch = self.queue.get_many(max_items=max_items, timeout=0)
+            if not batch:
+                break
+            waiters.popleft()
+            future.set_result(batch)
+
+    async def get_many(self, max_items: int = None, timeout: float = None):
+        """Up to max_items queued items, waiting up to timeout seconds for the
+        first one.  Returns an empty list on timeout."""
+        batch = self.queue.get_many(max_items=max_items, timeout=0)
+        if batch or timeout == 0:
+            return batch
+        future = self.loop.create_future()
+        self._waiters.append((future, max_items))
+        try:
+            await asyncio.wait((future,), timeout=timeout)
+        except asyncio.CancelledError:
+            if future.done():
+                # Handed a batch just as we were cancelled: give it back
+                for item in reversed(future.result()):
+                    self.queue.put_back(item)
+            else:
+                future.cancel()
+            raise
+        if future.done():
+            return future.result()
+        future.cancel()
+        return []
+
+    async def get(self, timeout: float = None):
+        batch = await self.get_many(max_items=1, timeout=timeout)
+        if batch:
+            return batch[0]
+        return None
+
+    def put_nowait(self, item):
+        """Queue.put() that never blocks the loop; a full BLOCK queue raises
+        QueueFull and the drop policies behave as usual."""
+        return self.queue.put(item, timeout=0)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+    def close(self):
+        self.queue.remove_listener(self._on_put)
+        while self._waiters:
+            self._waiters.popleft()[0].cancel()
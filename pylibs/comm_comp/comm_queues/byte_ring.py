@@ -0,0 +1,130 @@
+#!/bin/python3
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+#
+#
+
+__author__ = "Erol Yesin"
+
+
+class ByteRing:
+    """Preallocated receive buffer for raw byte streams.
+
+    Bytes are written straight into the free tail through writable()/commit()
+    (or fill(sock.recv_into)) and read back as memoryview slices, so framing a
+    message allocates nothing until the caller decodes it.  Instead of
+    wrapping, the unread bytes slide back to the front when the tail runs out,
+    which keeps every read contiguous.  Views returned by read()/peek() are
+    only valid until the next write.  Not thread-safe: one reader thread owns it.
+    """
+
+    __slots__ = ("capacity", "_buf", "_view", "_start", "_end")
+
+    def __init__(self, capacity: int = 64 << 10):
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def free(self):
+        return self.capacity - len(self)
+
+    @property
+    def full(self):
+        return self._start == 0 and self._end == self.capacity
+
+    def _compact(self):
+        length = self._end - self._start
+        if self._start:
+            self._buf[:length] = self._view[self._start : self._end]
+            self._start, self._end = 0, length
+
+    def writable(self, min_size: int = 1):
+        """Free tail as a writable memoryview, compacted first if it is smaller
+        than min_size.  Empty when the buffer is full."""
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif self.capacity - self._end < min_size:
+            self._compact()
+        return self._view[self._end :]
+
+    def commit(self, count: int):
+        """Mark count bytes written into the last writable() view as readable."""
+        if count < 0 or self._end + count > self.capacity:
+            raise ValueError("commit of %d bytes overruns the buffer" % count)
+        self._end += count
+
+    def fill(self, recv_into: callable):
+        """Call recv_into(view), e.g. socket.recv_into, and commit what it wrote."""
+        count = recv_into(self.writable()) or 0
+        self.commit(count)
+        return count
+
+    def write(self, data):
+        """Copy data in, for sources that hand out their own bytes objects."""
+        length = len(data)
+        if length > self.free:
+            raise BufferError("%d bytes do not fit in %d free" % (length, self.free))
+        self.writable(min_size=length)[:length] = data
+        self._end += length
+        return length
+
+    def find(self, delim: bytes, start: int = 0):
+        """Offset of delim from the read position, -1 if not buffered."""
+        index = self._buf.find(delim, self._start + start, self._end)
+        return index if index < 0 else index - self._start
+
+    def search(self, pattern, start: int = 0):
+        """(start, end) offsets of the first match of a compiled bytes
+        pattern from the read position, None if there is none yet."""
+        match = pattern.search(self._buf, self._start + start, self._end)
+        if match is None:
+            return None
+        return match.start() - self._start, match.end() - self._start
+
+    def peek(self, count: int = None):
+        end = self._end if count is None else min(self._start + count, self._end)
+        return self._view[self._start : end]
+
+    def read(self, count: int = None):
+        view = self.peek(count)
+        self.skip(len(view))
+        return view
+
+    def read_until(self, delim: bytes):
+        """Message up to and including delim as a memoryview, None if the
+        delimiter has not arrived yet."""
+        index = self.find(delim)
+        if index < 0:
+            return None
+        return self.read(index + len(delim))
+
+    def skip(self, count: int):
+        self._start = min(self._start + count, self._end)
+        if self._start == self._end:
+            self._start = self._end = 0
+
+    def clear(self):
+        self._start = self._end = 0
@@ -22,29 +22,176 @@
 #
 
 __author__ = "Erol Yesin"
-from threading import Condition
+from collections import deque
+from threading import Condition, Lock
+from time import monotonic
+
+from .queue_stats import LATENCY_BUCKETS, QueueStats
+
+# Policies applied by put() when a bounded queue is full
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+RAISE = "raise"
+POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, RAISE)
+
+
+class QueueFull(Exception):
+    pass
 
 
 class Queue:
-    def __init__(self):
-        self.items = []
-        self.condition = Condition()
+    """Thread-safe FIFO backed by a deque ring buffer.
+
+    maxsize of None or 0 leaves the queue unbounded.  Once a bounded queue is
+    full, put() applies `policy`: BLOCK waits up to `timeout` seconds for room
+    (then raises QueueFull), DROP_OLDEST discards the head, DROP_NEWEST
+    discards the new item and RAISE raises QueueFull right away.
+    put_back() is the retry path of a consumer and is never refused, so the
+    queue may briefly hold one more item than maxsize.
+
+    instrument() turns on depth/rate counters and a histogram of the time
+    items spend queued; stats() returns a snapshot.  While off, the only cost
+    is one attribute test per operation.
+    """
+
+    def __init__(self, maxsize: int = None, policy: str = BLOCK, timeout: float = None):
+        assert policy in POLICIES, "unknown queue policy %s" % policy
+        self.maxsize = maxsize or 0
+        self.policy = policy
+        self.timeout = timeout
+        self.dropped = 0
+        self.items = deque()
+        lock = Lock()
+        self.condition = Condition(lock)
+        self.not_full = Condition(lock)
+        self._stats = None
+        self._stamps = None
+        self._listeners = ()
 
     @property
     def empty(self):
         return self.size == 0
 
-    def put(self, item):
+    @property
+    def full(self):
+        return 0 < self.maxsize <= len(self.items)
+
+    def add_listener(self, listener: callable):
+        """listener() is called, with the lock held, after every put.  It must
+        not block; the asyncio bridge uses it to schedule a wake-up."""
+        with self.condition:
+            self._listeners = self._listeners + (listener,)
+
+    def remove_listener(self, listener: callable):
+        with self.condition:
+            self._listeners = tuple(l for l in self._listeners if l is not listener)
+
+    def _notify(self, count: int = 1):
+        self.condition.notify(count)
+        for listener in self._listeners:
+            listener()
+
+    def instrument(self, enable: bool = True, buckets: tuple = LATENCY_BUCKETS):
+        with self.condition:
+            if not enable:
+                self._stats = self._stamps = None
+            elif self._stats is None:
+                # Items queued before now are stamped as just put
+                self._stamps = deque([monotonic()] * len(self.items))
+                self._stats = QueueStats(buckets=buckets)
+        return self
+
+    def stats(self, reset: bool = False):
+        with self.condition:
+            if self._stats is None:
+                return {"enabled": False, "depth": self.size, "dropped": self.dropped}
+            return self._stats.snapshot(
+                depth=self.size, dropped=self.dropped, reset=reset
+            )
+
+    def _stamp_get(self, count):
+        now = monotonic()
+        stamps = self._stamps
+        add = self._stats.latency.add
+        for _ in range(count):
+            add(now - stamps.popleft())
+        self._stats.gets += count
+
+    def put(self, item, timeout: float = None):
         with self.condition:
             if item is not None:
-                self.items.insert(0, item)
-            self.condition.notify()
+                if self.full and not self._make_room(timeout):
+                    return False
+                self.items.append(item)
+                if self._stats is not None:
+                    self._stamps.append(monotonic())
+                    self._stats.on_put(1, len(self.items))
+            self._notify()
+        return item is not None
+
+    def put_many(self, items, timeout: float = None):
+        """Enqueue every item of an iterable under a single lock acquisition.
+        If the queue fills up (QueueFull) the items put so far stay queued."""
+        count = 0
+        # Items consumers were already woken for
+        notified = 0
+        with self.condition:
+            stamps = self._stamps
+            now = monotonic() if stamps is not None else None
+            try:
+                for item in items:
+                    if item is None:
+                        continue
+                    if self.full:
+                        if self.policy == BLOCK and count > notified:
+                            # Let the consumers make room for the rest
+                            self._notify(count - notified)
+                            notified = count
+                        if not self._make_room(timeout):
+                            continue
+                    self.items.append(item)
+                    if stamps is not None:
+                        stamps.append(now)
+                    count += 1
+            finally:
+                if self._stats is not None and count:
+                    self._stats.on_put(count, len(self.items))
+                self._notify(max(count - notified, 1))
+        return count
 
     def put_back(self, item):
         if item is not None:
             with self.condition:
-                self.items.append(item)
-                self.condition.notify()
+                self.items.appendleft(item)
+                if self._stats is not None:
+                    self._stamps.appendleft(monotonic())
+                    self._stats.on_put(1, len(self.items))
+                self._notify()
+
+    def _make_room(self, timeout):
+        # Called with the lock held and the queue full
+        if self.policy == DROP_OLDEST:
+            self.items.popleft()
+            if self._stamps is not None:
+                self._stamps.popleft()
+            self.dropped += 1
+            return True
+        if self.policy == DROP_NEWEST:
+            self.dropped += 1
+            return False
+        if self.policy == RAISE:
+            raise QueueFull("queue full (maxsize=%d)" % self.maxsize)
+
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else monotonic() + timeout
+        while self.full:
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                raise QueueFull("queue full (maxsize=%d)" % self.maxsize)
+            self.not_full.wait(timeout=remaining)
+        return True
 
     def no_wait_get(self):
         if not self.empty:
@@ -58,8 +205,7 @@ class Queue:
                 if self.empty:
                     return None
             try:
-                end = self.size - 1
-                item = self.items[end]
+                item = self.items[0]
             except IndexError:
                 item = None
             return item
@@ -67,7 +213,10 @@ class Queue:
     def clear(self):
         with self.condition:
             self.items.clear()
+            if self._stamps is not None:
+                self._stamps.clear()
             self.condition.notify()
+            self.not_full.notify_all()
 
     def get(self, timeout=None):
         with self.condition:
@@ -76,27 +225,59 @@ class Queue:
                 if self.empty:
                     return None
             try:
-                item = self.items.pop()
+                item = self.items.popleft()
             except IndexError:
                 item = None
+            if self._stats is not None and item is not None:
+                self._stamp_get(1)
+            if self.maxsize:
+                self.not_full.notify()
         return item
 
+    def get_many(self, max_items: int = None, timeout=None):
+        """Wait like get() for the first item, then take up to max_items
+        (all queued items when None) in the same lock acquisition.
+        Returns an empty list if nothing arrived."""
+        with self.condition:
+            while self.empty:
+                self.condition.wait(timeout=timeout)
+                if self.empty:
+                    return []
+            items = self.items
+            if max_items is None or max_items >= len(items):
+                batch = list(items)
+                items.clear()
+            else:
+                batch = [items.popleft() for _ in range(max_items)]
+            if self._stats is not None:
+                self._stamp_get(len(batch))
+            if self.maxsize:
+                self.not_full.notify(len(batch))
+        return batch
+
     def cycle(self):
-        item = self.no_wait_get()
-        if item is not None:
-            self.put(item)
+        with self.condition:
+            if self.empty:
+                return None
+            item = self.items[0]
+            self.items.rotate(-1)
+            if self._stamps is not None:
+                self._stamps.popleft()
+                self._stamps.append(monotonic())
         return item
 
     @property
     def size_of_next(self):
-        if self.size > 0:
-            return 4 + len(self.items[-1])
-        return None
+        try:
+            return 4 + len(self.items[0])
+        except IndexError:
+            return None
 
     def type_of_next(self):
-        if self.size > 0:
-            return type(self.items[-1])
-        return None
+        try:
+            return type(self.items[0])
+        except IndexError:
+            return None
 
     @property
     def size(self):
@@ -0,0 +1,122 @@
+#!/bin/python3
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+#
+#
+
+__author__ = "Erol Yesin"
+
+from bisect import bisect_left
+from time import monotonic
+
+# Upper bucket edges in seconds, the last bucket is open ended
+LATENCY_BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 0.1, 1.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram.  add() is a bisect and two increments."""
+
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct: float):
+        """Upper edge of the bucket holding the pct-th percentile."""
+        if not self.count:
+            return None
+        rank = self.count * pct / 100.0
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        buckets = {str(bound): count for bound, count in zip(self.bounds, self.counts)}
+        buckets["+Inf"] = self.counts[-1]
+        return {
+            "buckets": buckets,
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+        }
+
+
+class QueueStats:
+    """Counters kept by an instrumented Queue.  Updated with the queue lock held."""
+
+    __slots__ = ("puts", "gets", "high_watermark", "latency", "_mark")
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.latency = Histogram(bounds=buckets)
+        self.reset()
+
+    def reset(self):
+        self.puts = 0
+        self.gets = 0
+        self.high_watermark = 0
+        self.latency.reset()
+        self._mark = (monotonic(), 0, 0)
+
+    def on_put(self, count: int, depth: int):
+        self.puts += count
+        if depth > self.high_watermark:
+            self.high_watermark = depth
+
+    def snapshot(self, depth: int, dropped: int, reset: bool = False):
+        now = monotonic()
+        since, puts, gets = self._mark
+        elapsed = max(now - since, 1e-9)
+        snap = {
+            "enabled": True,
+            "depth": depth,
+            "high_watermark": self.high_watermark,
+            "puts": self.puts,
+            "gets": self.gets,
+            "dropped": dropped,
+            "put_rate": (self.puts - puts) / elapsed,
+            "get_rate": (self.gets - gets) / elapsed,
+            "latency": self.latency.snapshot(),
+        }
+        if reset:
+            self.reset()
+            self.high_watermark = depth
+        else:
+            self._mark = (now, self.puts, self.gets)
+        return snap
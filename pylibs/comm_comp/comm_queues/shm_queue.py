@@ -0,0 +1,225 @@
+#!/bin/python3
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+#
+#
+
+__author__ = "Erol Yesin"
+
+import multiprocessing
+import os
+import struct
+from multiprocessing.shared_memory import SharedMemory
+from time import monotonic
+
+from .comm_queue import QueueFull
+
+# head, tail and frame count; head/tail are running byte offsets, never wrapped
+_HEADER = struct.Struct("<QQQ")
+_LEN = struct.Struct("<I")
+
+
+class ShmQueue:
+    """Byte frame queue living in a multiprocessing.shared_memory ring buffer.
+
+    Frames are stored as a 4 byte little-endian length followed by the raw
+    bytes, so nothing is pickled.  Blocking uses multiprocessing semaphores
+    (OS semaphores): `readable` counts queued frames and `space` is posted by
+    consumers whenever they free room for the producer.  Meant for one
+    producer and any number of consumer processes.  Hand the queue to child
+    processes as a Process argument; the copy attaches to the same block.
+    """
+
+    def __init__(self, capacity: int = 1 << 20, name: str = None, ctx=None):
+        ctx = ctx or multiprocessing.get_context()
+        self.capacity = capacity
+        self._shm = SharedMemory(name=name, create=True, size=_HEADER.size + capacity)
+        # Only the creating process unlinks; forked children inherit this
+        self._owner = os.getpid()
+        _HEADER.pack_into(self._shm.buf, 0, 0, 0, 0)
+        self._lock = ctx.Lock()
+        self._readable = ctx.Semaphore(0)
+        self._space = ctx.Semaphore(0)
+        self._bind()
+
+    def _bind(self):
+        self._buf = self._shm.buf
+
+    def __getstate__(self):
+        return {
+            "name": self._shm.name,
+            "capacity": self.capacity,
+            "lock": self._lock,
+            "readable": self._readable,
+            "space": self._space,
+        }
+
+    def __setstate__(self, state):
+        self.capacity = state["capacity"]
+        self._lock = state["lock"]
+        self._readable = state["readable"]
+        self._space = state["space"]
+        self._shm = SharedMemory(name=state["name"])
+        self._owner = None
+        self._bind()
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def size(self):
+        return _HEADER.unpack_from(self._buf, 0)[2]
+
+    @property
+    def empty(self):
+        return self.size == 0
+
+    def __len__(self):
+        return self.size
+
+    def _write(self, offset, data):
+        offset %= self.capacity
+        first = min(len(data), self.capacity - offset)
+        start = _HEADER.size + offset
+        self._buf[start : start + first] = data[:first]
+        if first < len(data):
+            self._buf[_HEADER.size : _HEADER.size + len(data) - first] = data[first:]
+
+    def _read(self, offset, length):
+        offset %= self.capacity
+        first = min(length, self.capacity - offset)
+        start = _HEADER.size + offset
+        if first == length:
+            return bytes(self._buf[start : start + length])
+        return bytes(self._buf[start : start + first]) + bytes(
+            self._buf[_HEADER.size : _HEADER.size + length - first]
+        )
+
+    def _frames(self, items):
+        for item in items:
+            if isinstance(item, str):
+                item = item.encode()
+            if _LEN.size + len(item) > self.capacity:
+                raise ValueError("frame of %d bytes exceeds queue capacity" % len(item))
+            yield item
+
+    def put(self, item, timeout: float = None):
+        self.put_many(items=(item,), timeout=timeout)
+
+    def put_many(self, items, timeout: float = None):
+        """Write as many frames per lock acquisition as the ring has room for."""
+        deadline = None if timeout is None else monotonic() + timeout
+        pending = self._frames(items)
+        frame = next(pending, None)
+        count = 0
+        while frame is not None:
+            # Stale wake-ups from earlier gets are dropped before the room check
+            while self._space.acquire(False):
+                pass
+            written = 0
+            with self._lock:
+                head, tail, frames = _HEADER.unpack_from(self._buf, 0)
+                while frame is not None:
+                    needed = _LEN.size + len(frame)
+                    if self.capacity - (tail - head) < needed:
+                        break
+                    self._write(tail, _LEN.pack(len(frame)))
+                    self._write(tail + _LEN.size, frame)
+                    tail += needed
+                    written += 1
+                    frame = next(pending, None)
+                _HEADER.pack_into(self._buf, 0, head, tail, frames + written)
+            for _ in range(written):
+                self._readable.release()
+            count += written
+            if frame is not None and not written:
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise QueueFull("shared memory queue full")
+                self._space.acquire(True, remaining)
+        return count
+
+    def get_many(self, max_items: int = None, timeout: float = None):
+        if not self._readable.acquire(True, timeout):
+            return []
+        taken = 1
+        while (max_items is None or taken < max_items) and self._readable.acquire(
+            False
+        ):
+            taken += 1
+        batch = []
+        with self._lock:
+            head, tail, frames = _HEADER.unpack_from(self._buf, 0)
+            for _ in range(taken):
+                length = _LEN.unpack(self._read(head, _LEN.size))[0]
+                batch.append(self._read(head + _LEN.size, length))
+                head += _LEN.size + length
+            _HEADER.pack_into(self._buf, 0, head, tail, frames - taken)
+        self._space.release()
+        return batch
+
+    def get(self, timeout: float = None):
+        batch = self.get_many(max_items=1, timeout=timeout)
+        if batch:
+            return batch[0]
+        return None
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        if self._owner == os.getpid():
+            self._shm.unlink()
+
+
+class ShmCommQueues(object):
+    """Shared memory counterpart of CommQueues.
+
+    The first instance in the producer process creates the three queues;
+    passing it to a child process re-attaches and makes it that process's
+    ShmCommQueues singleton.
+    """
+
+    __instance: object = None
+
+    def __new__(cls, capacity: int = 1 << 20, ctx=None):
+        if ShmCommQueues.__instance is None:
+            instance = object.__new__(cls)
+            instance.inQ = ShmQueue(capacity=capacity, ctx=ctx)
+            instance.outQ = ShmQueue(capacity=capacity, ctx=ctx)
+            instance.tokenQ = ShmQueue(capacity=capacity, ctx=ctx)
+            ShmCommQueues.__instance = instance
+        return ShmCommQueues.__instance
+
+    def __reduce__(self):
+        return ShmCommQueues._attach, (self.inQ, self.outQ, self.tokenQ)
+
+    @staticmethod
+    def _attach(in_q, out_q, token_q):
+        if ShmCommQueues.__instance is None:
+            instance = object.__new__(ShmCommQueues)
+            instance.inQ, instance.outQ, instance.tokenQ = in_q, out_q, token_q
+            ShmCommQueues.__instance = instance
+        return ShmCommQueues.__instance
+
+    def close(self):
+        for queue in (self.inQ, self.outQ, self.tokenQ):
+            queue.close()
+        ShmCommQueues.__instance = None
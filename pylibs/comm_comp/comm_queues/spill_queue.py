@@ -0,0 +1,400 @@
+#!/bin/python3
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+#
+#
+
+__author__ = "Erol Yesin"
+
+import mmap
+import pickle
+import struct
+from collections import deque
+from pathlib import Path
+
+from .comm_queue import Queue
+from .queue_stats import LATENCY_BUCKETS
+
+_LEN = struct.Struct("<I")
+# segment number and byte offset of the next record to read
+_CURSOR = struct.Struct("<QQ")
+_SEG_FMT = "%010d.seg"
+_HEAD = "head.seg"
+
+
+class SpillQueue(Queue):
+    """Queue backed by an append-only segment log under `path`, with at most
+    `threshold` of the oldest items also kept in RAM.
+
+    Records are length-prefixed serialized items.  Every item is written to
+    the log as it is put, so a crash loses nothing that put() returned for.
+    Items past the RAM head are read back through mmap.  The position of the
+    oldest item not yet taken lives in a memory-mapped cursor file, fully
+    taken segments are deleted, and a restart replays the backlog in order.
+
+    With manual_ack=True an item taken by get() stays in the log until ack()
+    says it was handled (e.g. published), so a crash in between replays it
+    instead of losing it; put_back() of an unacknowledged item keeps its log
+    record.  Other items put back are held in RAM and written to a head
+    segment by close().
+
+    Spilled items carry no timestamp, so instrument() keeps the counters and
+    watermarks but not the queued-time histogram.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        threshold: int = 1000,
+        segment_size: int = 16 << 20,
+        serializer: callable = pickle.dumps,
+        deserializer: callable = pickle.loads,
+        manual_ack: bool = False,
+    ):
+        super(SpillQueue, self).__init__()
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.segment_size = segment_size
+        self.serializer = serializer
+        self.deserializer = deserializer
+        self.manual_ack = manual_ack
+
+        # Records past the read position, not in RAM
+        self._disk_count = 0
+        # Log position after each RAM item, None for items put back
+        self._ends = deque()
+        # manual_ack: log position after each item taken and not acked yet
+        self._taken = deque()
+        self._read_seg = None
+        self._read_off = 0
+        self._writer = None
+        self._reader = None
+        self._reader_seg = None
+
+        cursor_file = self.path / "cursor"
+        if not cursor_file.exists():
+            cursor_file.write_bytes(bytes(_CURSOR.size))
+        self._cursor_fd = cursor_file.open("r+b")
+        self._cursor = mmap.mmap(self._cursor_fd.fileno(), _CURSOR.size)
+        self._recover()
+
+    # -- segment log ----------------------------------------------------------
+
+    def _segments(self):
+        return sorted(int(p.stem) for p in self.path.glob("*.seg") if p.stem.isdigit())
+
+    def _seg_path(self, seg):
+        return self.path / (_SEG_FMT % seg)
+
+    def _recover(self):
+        head = self.path / _HEAD
+        if head.exists():
+            put_back = self._scan(head.read_bytes(), 0)[0]
+            self.items.extend(put_back)
+            self._ends.extend([None] * len(put_back))
+            head.unlink()
+
+        segments = self._segments()
+        read_seg, read_off = _CURSOR.unpack(self._cursor)
+        if not segments:
+            read_seg, read_off = read_seg + 1, 0
+            segments = [read_seg]
+            self._seg_path(read_seg).touch()
+        elif read_seg not in segments:
+            read_seg, read_off = segments[0], 0
+        for seg in segments:
+            if seg < read_seg:
+                self._seg_path(seg).unlink()
+                continue
+            data = self._seg_path(seg).read_bytes()
+            count, end = self._scan(data, read_off if seg == read_seg else 0, True)
+            if end < len(data):
+                # Drop a record torn by a crash in the middle of a write
+                with self._seg_path(seg).open("r+b") as seg_file:
+                    seg_file.truncate(end)
+            self._disk_count += count
+        self._write_cursor(read_seg, read_off)
+        self._read_seg, self._read_off = read_seg, read_off
+        self._write_seg = segments[-1]
+        self._writer = self._seg_path(self._write_seg).open("ab")
+
+    def _scan(self, data, offset, count_only=False):
+        records = 0 if count_only else []
+        while offset + _LEN.size <= len(data):
+            length = _LEN.unpack_from(data, offset)[0]
+            end = offset + _LEN.size + length
+            if end > len(data):
+                break
+            if count_only:
+                records += 1
+            else:
+                records.append(self.deserializer(data[offset + _LEN.size : end]))
+            offset = end
+        return records, offset
+
+    def _write_cursor(self, seg, offset):
+        _CURSOR.pack_into(self._cursor, 0, seg, offset)
+
+    def _append(self, item):
+        data = self.serializer(item)
+        if self._writer.tell() + _LEN.size + len(data) > self.segment_size:
+            self._writer.close()
+            self._write_seg += 1
+            self._writer = self._seg_path(self._write_seg).open("ab")
+        self._writer.write(_LEN.pack(len(data)) + data)
+        return self._write_seg, self._writer.tell()
+
+    def _map(self, seg):
+        if self._reader is not None:
+            self._reader.close()
+        self._reader = None
+        self._reader_seg = seg
+        size = self._seg_path(seg).stat().st_size
+        if size:
+            with self._seg_path(seg).open("rb") as seg_file:
+                self._reader = mmap.mmap(
+                    seg_file.fileno(), size, access=mmap.ACCESS_READ
+                )
+
+    def _mapped(self, offset):
+        return self._reader is not None and offset + _LEN.size <= len(self._reader)
+
+    def _next_record(self, consume=True):
+        seg, offset = self._read_seg, self._read_off
+        while True:
+            if self._reader_seg != seg:
+                self._map(seg)
+            if self._mapped(offset):
+                break
+            if seg == self._write_seg:
+                # The active segment grew since it was mapped
+                self._map(seg)
+                break
+            # Sealed segment fully read, go on with the next one
+            seg, offset = seg + 1, 0
+        length = _LEN.unpack_from(self._reader, offset)[0]
+        start = offset + _LEN.size
+        item = self.deserializer(self._reader[start : start + length])
+        if consume:
+            self._disk_count -= 1
+            self._read_seg, self._read_off = seg, start + length
+            self._done((seg, start + length))
+        return item
+
+    def _done(self, end):
+        if self.manual_ack:
+            self._taken.append(end)
+        else:
+            self._commit(end)
+
+    def _commit(self, end):
+        # Everything up to log position end was taken: move the cursor past
+        # it and delete the segments it left behind
+        if end is None:
+            return
+        seg, offset = end
+        for old in range(_CURSOR.unpack(self._cursor)[0], seg):
+            if self._seg_path(old).exists():
+                self._seg_path(old).unlink()
+        if self.size or self._taken:
+            self._write_cursor(seg, offset)
+        else:
+            self._reset(seg)
+
+    def _reset(self, seg):
+        # Log drained: drop every segment and restart with an empty one
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        self._reader_seg = None
+        self._writer.close()
+        for old in self._segments():
+            self._seg_path(old).unlink()
+        self._write_seg = max(seg, self._write_seg) + 1
+        self._writer = self._seg_path(self._write_seg).open("ab")
+        self._write_cursor(self._write_seg, 0)
+        self._read_seg, self._read_off = self._write_seg, 0
+        self._disk_count = 0
+
+    # -- Queue overrides ------------------------------------------------------
+
+    @property
+    def size(self):
+        return len(self.items) + self._disk_count
+
+    def _push(self, item):
+        end = self._append(item)
+        if self._disk_count or len(self.items) >= self.threshold:
+            self._disk_count += 1
+        else:
+            # Also kept in RAM, the read position moves past it
+            self.items.append(item)
+            self._ends.append(end)
+            self._read_seg, self._read_off = end
+
+    def _pop(self, consume=True):
+        if self.items:
+            if not consume:
+                return self.items[0]
+            item = self.items.popleft()
+            self._done(self._ends.popleft())
+            return item
+        if self._disk_count:
+            return self._next_record(consume=consume)
+        return None
+
+    @property
+    def unacked(self):
+        return len(self._taken)
+
+    def ack(self, count: int = None):
+        """Mark the oldest count (default: every) items taken and not acked
+        yet as handled, so the log moves past them.  Returns how many."""
+        with self.condition:
+            if count is None or count > len(self._taken):
+                count = len(self._taken)
+            end = None
+            for _ in range(count):
+                end = self._taken.popleft() or end
+            self._commit(end)
+        return count
+
+    def instrument(self, enable: bool = True, buckets: tuple = LATENCY_BUCKETS):
+        super(SpillQueue, self).instrument(enable=enable, buckets=buckets)
+        self._stamps = None
+        return self
+
+    def put(self, item, timeout: float = None):
+        with self.condition:
+            if item is not None:
+                self._push(item)
+                self._writer.flush()
+                if self._stats is not None:
+                    self._stats.on_put(1, self.size)
+            self._notify()
+        return item is not None
+
+    def put_back(self, item):
+        if item is not None:
+            with self.condition:
+                self.items.appendleft(item)
+                # The latest item taken comes back with its log record
+                self._ends.appendleft(self._taken.pop() if self._taken else None)
+                if self._stats is not None:
+                    self._stats.on_put(1, self.size)
+                self._notify()
+
+    def put_many(self, items, timeout: float = None):
+        count = 0
+        with self.condition:
+            for item in items:
+                if item is not None:
+                    self._push(item)
+                    count += 1
+            self._writer.flush()
+            if self._stats is not None:
+                self._stats.on_put(count, self.size)
+            self._notify(max(count, 1))
+        return count
+
+    def peek(self, timeout=None):
+        with self.condition:
+            while self.empty:
+                self.condition.wait(timeout=timeout)
+                if self.empty:
+                    return None
+            return self._pop(consume=False)
+
+    def get(self, timeout=None):
+        with self.condition:
+            while self.empty:
+                self.condition.wait(timeout=timeout)
+                if self.empty:
+                    return None
+            if self._stats is not None:
+                self._stats.gets += 1
+            return self._pop()
+
+    def get_many(self, max_items: int = None, timeout=None):
+        with self.condition:
+            while self.empty:
+                self.condition.wait(timeout=timeout)
+                if self.empty:
+                    return []
+            batch = []
+            while self.size and (max_items is None or len(batch) < max_items):
+                batch.append(self._pop())
+            if self._stats is not None:
+                self._stats.gets += len(batch)
+        return batch
+
+    def cycle(self):
+        with self.condition:
+            item = self._pop()
+            if item is not None:
+                self._push(item)
+                self._writer.flush()
+        return item
+
+    @property
+    def size_of_next(self):
+        # Under the lock: a get() may be remapping the segment being read
+        with self.condition:
+            item = self._pop(consume=False)
+        if item is None:
+            return None
+        return 4 + len(item)
+
+    def type_of_next(self):
+        with self.condition:
+            item = self._pop(consume=False)
+        if item is None:
+            return None
+        return type(item)
+
+    def clear(self):
+        with self.condition:
+            self.items.clear()
+            self._ends.clear()
+            self._taken.clear()
+            self._reset(self._write_seg)
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            # The rest of RAM is in the log already
+            put_back = [
+                item for item, end in zip(self.items, self._ends) if end is None
+            ]
+            if put_back:
+                data = b"".join(
+                    _LEN.pack(len(record)) + record
+                    for record in map(self.serializer, put_back)
+                )
+                (self.path / _HEAD).write_bytes(data)
+            self.items.clear()
+            self._ends.clear()
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+            self._writer.close()
+            self._cursor.close()
+            self._cursor_fd.close()
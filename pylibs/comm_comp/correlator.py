@@ -0,0 +1,247 @@
+#!/bin/python3
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+from __future__ import absolute_import
+
+__author__ = "Erol Yesin"
+
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, TimeoutError
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+
+from comm_queues.queue_stats import Histogram
+from event_handler.timer_wheel import shared_wheel
+
+# Stands in the FIFO for a query that timed out, so its late reply is dropped
+_LATE = object()
+
+
+class Correlator:
+    """Matches received messages to outstanding queries.
+
+    Without `key` replies answer queries in the order they were sent (FIFO),
+    which suits SCPI-style instruments.  With `key`, key(msg) picks the query
+    a reply belongs to, so replies may come back in any order; the request
+    side key is given to submit() or taken as key(cmd).  At most `in_flight`
+    queries are outstanding; submit() waits for a slot.  A query that gets
+    no reply within its timeout fails with TimeoutError and frees its slot;
+    in FIFO order the reply it may still get is dropped (counted as late)
+    instead of answering the next query.  Every reply still reaches the RX
+    subscribers as well.
+    """
+
+    def __init__(
+        self, key: callable = None, in_flight: int = 8, rtt_total: Histogram = None
+    ):
+        self.key = key
+        self.in_flight = in_flight
+        self.sent = 0
+        self.answered = 0
+        self.expired = 0
+        # FIFO replies dropped because their query had timed out
+        self.late = 0
+        # Messages key() raised on (or gave an unhashable key for)
+        self.key_errors = 0
+        # Seconds from submit() to the matching reply
+        self.rtt = Histogram()
+        # Fed the same round trips but never reset here, see metrics()
+        self.rtt_total = rtt_total
+        self._slots = BoundedSemaphore(in_flight)
+        self._lock = Lock()
+        # Held across queueing a future and send(), so the commands go out
+        # in the order their futures wait in
+        self._submit_lock = Lock()
+        # FIFO: deque of futures (or _LATE); keyed: key -> deque of futures
+        self._fifo = deque()
+        self._late = 0
+        self._keyed = {}
+
+    @property
+    def pending(self):
+        with self._lock:
+            waiting = len(self._fifo) - self._late
+            return waiting + sum(map(len, self._keyed.values()))
+
+    def acquire(self, timeout: float = None):
+        """Take a slot ahead of submit(..., acquired=True), for callers that
+        must not wait inside submit(), e.g. on an event loop."""
+        return self._slots.acquire(timeout=timeout)
+
+    def release(self):
+        # Give back a slot acquire() took that no submit() is going to use
+        self._slots.release()
+
+    def submit(
+        self,
+        cmd,
+        send: callable,
+        timeout: float = None,
+        key=None,
+        acquired: bool = False,
+    ):
+        """send(cmd) once a slot is free and return a Future for its reply."""
+        future = Future()
+        if not acquired and not self._slots.acquire(timeout=timeout):
+            future.set_exception(TimeoutError("%d queries in flight" % self.in_flight))
+            return future
+        if self.key is not None and key is None:
+            try:
+                key = self.key(cmd)
+            except Exception as e:
+                self.release()
+                future.set_exception(e)
+                return future
+        future.key = key
+        future.timer = None
+        future.sent = monotonic()
+        with self._submit_lock:
+            with self._lock:
+                if self.key is None:
+                    self._fifo.append(future)
+                else:
+                    self._keyed.setdefault(key, deque()).append(future)
+                self.sent += 1
+            if timeout is not None:
+                future.timer = shared_wheel().call_later(timeout, self._expire, future)
+            try:
+                send(cmd)
+            except Exception as e:
+                with self._lock:
+                    removed = self._remove(future)
+                if removed:
+                    self._finish(future, error=e)
+        return future
+
+    def _take(self, msg):
+        # Lock held: the future msg answers, None if it answers nothing
+        if self.key is None:
+            if not self._fifo:
+                return None
+            future = self._fifo.popleft()
+            if future is _LATE:
+                self._late -= 1
+                self.late += 1
+                return None
+            return future
+        try:
+            waiting = self._keyed.get(self.key(msg))
+        except Exception:
+            # Not a reply key() understands, e.g. an unsolicited line
+            self.key_errors += 1
+            return None
+        if waiting is None:
+            return None
+        future = waiting.popleft()
+        if not waiting:
+            del self._keyed[future.key]
+        return future
+
+    def _remove(self, future):
+        # Lock held
+        if self.key is None:
+            try:
+                self._fifo.remove(future)
+            except ValueError:
+                return False
+            return True
+        waiting = self._keyed.get(future.key)
+        if waiting is None or future not in waiting:
+            return False
+        waiting.remove(future)
+        if not waiting:
+            del self._keyed[future.key]
+        return True
+
+    def _finish(self, future, result=None, error=None):
+        if future.timer is not None:
+            future.timer.cancel()
+        self._slots.release()
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            # Cancelled by the caller
+            pass
+
+    def _expire(self, future):
+        with self._lock:
+            if self.key is None:
+                # Its reply may still come: keep its place to drop that
+                try:
+                    self._fifo[self._fifo.index(future)] = _LATE
+                except ValueError:
+                    return
+                self._late += 1
+            elif not self._remove(future):
+                return
+            self.expired += 1
+        future.timer = None
+        self._finish(future, error=TimeoutError("no reply to query"))
+
+    def match(self, msgs: list):
+        """Resolve the queries msgs answer and return how many did."""
+        answered = []
+        with self._lock:
+            if not self._fifo and not self._keyed:
+                return 0
+            for msg in msgs:
+                future = self._take(msg)
+                if future is not None:
+                    answered.append((future, msg))
+            self.answered += len(answered)
+            now = monotonic()
+            for future, _ in answered:
+                self.rtt.add(now - future.sent)
+                if self.rtt_total is not None:
+                    self.rtt_total.add(now - future.sent)
+        for future, msg in answered:
+            self._finish(future, result=msg)
+        return len(answered)
+
+    def cancel(self, reason: str = "device closed"):
+        """Fail every outstanding query, e.g. when the device closes."""
+        with self._lock:
+            futures = [future for future in self._fifo if future is not _LATE]
+            for waiting in self._keyed.values():
+                futures += waiting
+            self._fifo.clear()
+            self._late = 0
+            self._keyed.clear()
+        for future in futures:
+            self._finish(future, error=ConnectionError(reason))
+
+    def stats(self, reset: bool = False):
+        snap = {
+            "in_flight": self.in_flight,
+            "pending": self.pending,
+            "sent": self.sent,
+            "answered": self.answered,
+            "expired": self.expired,
+            "late": self.late,
+            "key_errors": self.key_errors,
+            "rtt": self.rtt.snapshot(),
+        }
+        if reset:
+            self.sent = self.answered = self.expired = self.late = 0
+            self.key_errors = 0
+            self.rtt.reset()
+        return snap
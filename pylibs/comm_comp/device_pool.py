@@ -0,0 +1,299 @@
+#!/bin/python3
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+from __future__ import absolute_import
+
+__author__ = "Erol Yesin"
+
+import random
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+from time import monotonic
+
+from event_handler.timer_wheel import shared_wheel
+
+
+class _Member:
+    """A device in the pool and its connection history."""
+
+    def __init__(self, device):
+        self.device = device
+        self.added = monotonic()
+        # Connected since (monotonic), None while down
+        self.up_since = None
+        # Seconds connected before the current connection
+        self.up_total = 0.0
+        self.opens = 0
+        self.reconnects = 0
+        self.failures = 0
+        self.losses = 0
+        self.probe_failures = 0
+        self.last_error = None
+        # Consecutive failed opens, drives the backoff
+        self.attempt = 0
+        # A (re)connect is scheduled or running
+        self.pending = False
+        self.probing = False
+        self.tried = False
+        self.retry = None
+
+    def down(self):
+        if self.up_since is not None:
+            self.up_total += monotonic() - self.up_since
+            self.up_since = None
+
+
+class DevicePool:
+    """Opens, watches and reconnects many BaseCommDeviceHelper devices.
+
+    open() opens every device in parallel on a small executor, on `reactor`
+    when one is given (see reactor.py).  A device that fails to open, reports
+    a lost connection on its STATE_EVENT, or fails its health probe is
+    closed and opened again after a jittered exponential backoff: a random
+    delay of up to backoff * 2 ** failures, capped at max_backoff, so a
+    fleet that dropped together does not reconnect in lock step.  The device
+    object is reused, so its subscribers and queued sends survive.
+
+    probe(device) runs every `interval` seconds for each connected device on
+    the executor; raising or returning a false value marks the device dead.
+    Without a probe only device.connected is checked.
+    """
+
+    def __init__(
+        self,
+        devices: list = (),
+        reactor=None,
+        probe: callable = None,
+        interval: float = 5.0,
+        backoff: float = 0.5,
+        max_backoff: float = 5.0,
+        workers: int = 32,
+        name: str = "devPool",
+    ):
+        self.reactor = reactor
+        self.probe = probe
+        self.interval = interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.name = name
+        self.workers = workers
+        self._executor = self._new_executor()
+        self._members = {}
+        self._lock = Lock()
+        self._timer = None
+        self._closed = True
+        for device in devices:
+            self.add(device)
+
+    def _new_executor(self):
+        return ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix=self.name
+        )
+
+    def __len__(self):
+        return len(self._members)
+
+    def __iter__(self):
+        return iter(list(self._members))
+
+    def add(self, device):
+        """Manage device, opening it right away if the pool is open."""
+        member = _Member(device)
+        with self._lock:
+            self._members[device] = member
+        device.subscribe(
+            name=self.name,
+            call_back=lambda pkt: self._on_state(member, pkt.payload),
+            event=device.STATE_EVENT,
+        )
+        if not self._closed:
+            member.pending = True
+            self._executor.submit(self._connect, member)
+        return device
+
+    def remove(self, device):
+        """Stop managing device and close it."""
+        with self._lock:
+            member = self._members.pop(device)
+            if member.retry is not None:
+                member.retry.cancel()
+        device.unsubscribe(name=self.name, event=device.STATE_EVENT)
+        device.close()
+        return device
+
+    def open(self, timeout: float = None):
+        """Open every device in parallel, waiting up to timeout seconds for the
+        first attempts.  Devices that fail keep retrying in the background."""
+        self._closed = False
+        with self._lock:
+            members = list(self._members.values())
+            for member in members:
+                member.pending = True
+        futures = [self._executor.submit(self._connect, member) for member in members]
+        if self._timer is None:
+            self._timer = shared_wheel().call_every(self.interval, self._check)
+        wait(futures, timeout=timeout)
+        return self
+
+    def close(self):
+        """Stop reconnecting and close every device, waiting for opens that
+        are still running."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        with self._lock:
+            self._closed = True
+            members = list(self._members.values())
+            for member in members:
+                if member.retry is not None:
+                    member.retry.cancel()
+                    member.retry = None
+                member.pending = False
+                member.down()
+        wait([self._executor.submit(member.device.close) for member in members])
+        # An open() already running closes its device once it returns; the
+        # next open() starts a new executor
+        executor, self._executor = self._executor, self._new_executor()
+        executor.shutdown()
+        return self
+
+    def _connect(self, member):
+        # Executor thread: (re)open one device
+        if self._closed or member.device not in self._members:
+            return False
+        device = member.device
+        try:
+            if member.tried:
+                # Whatever the last connection left: threads, transport
+                device.close()
+            member.tried = True
+            device.open(reactor=self.reactor)
+        except Exception as e:
+            with self._lock:
+                member.failures += 1
+                member.attempt += 1
+                member.last_error = repr(e)
+            self._retry(member)
+            return False
+        with self._lock:
+            closed = self._closed or device not in self._members
+            if not closed:
+                if member.opens:
+                    member.reconnects += 1
+                member.opens += 1
+                member.attempt = 0
+                member.up_since = monotonic()
+                member.pending = False
+        if closed:
+            # close() or remove() ran while this open was in flight
+            device.close()
+            return False
+        if not device.connected:
+            # Lost again before pending was cleared
+            self._lost(member, device.last_error)
+        return True
+
+    def _retry(self, member):
+        if self._closed:
+            return
+        ceiling = min(self.max_backoff, self.backoff * 2**member.attempt)
+        delay = random.uniform(0, ceiling)
+        member.retry = shared_wheel().call_later(delay, self._reconnect, member)
+
+    def _reconnect(self, member):
+        # Wheel thread: the backoff is over
+        self._executor.submit(self._connect, member)
+
+    def _lost(self, member, error=None):
+        with self._lock:
+            if self._closed or member.pending or member.device not in self._members:
+                return
+            member.pending = True
+            member.losses += 1
+            member.down()
+            if error is not None:
+                # STATE_EVENT carries the repr already
+                member.last_error = error if isinstance(error, str) else repr(error)
+        self._retry(member)
+
+    def _on_state(self, member, state):
+        # Any thread: the device posted to its STATE_EVENT
+        if not state["connected"]:
+            self._lost(member, state["error"])
+
+    def _check(self):
+        # Wheel thread: hand the health checks to the executor
+        with self._lock:
+            members = [
+                member
+                for member in self._members.values()
+                if not member.pending and not member.probing
+            ]
+            for member in members:
+                member.probing = True
+        for member in members:
+            self._executor.submit(self._probe, member)
+
+    def _probe(self, member):
+        device = member.device
+        error = None
+        try:
+            alive = device.connected and (
+                self.probe is None or bool(self.probe(device))
+            )
+        except Exception as e:
+            alive = False
+            error = e
+        member.probing = False
+        if not alive:
+            if device.connected:
+                member.probe_failures += 1
+                error = error or ConnectionError("health probe failed")
+            self._lost(member, error or device.last_error)
+
+    def stats(self, reset: bool = False):
+        """One entry per device, in the order they were added: its bus_id,
+        whether it is connected, uptime (seconds on the current connection),
+        availability (fraction of the time since it was added) and counters
+        of opens, reconnects, failed opens, lost connections and failed
+        probes."""
+        now = monotonic()
+        snap = []
+        with self._lock:
+            for device, member in self._members.items():
+                up = 0.0 if member.up_since is None else now - member.up_since
+                snap.append(
+                    {
+                        "device": device.bus_id,
+                        "connected": device.connected,
+                        "uptime": up,
+                        "availability": (member.up_total + up)
+                        / max(now - member.added, 1e-9),
+                        "opens": member.opens,
+                        "reconnects": member.reconnects,
+                        "failures": member.failures,
+                        "losses": member.losses,
+                        "probe_failures": member.probe_failures,
+                        "last_error": member.last_error,
+                    }
+                )
+                if reset:
+                    member.reconnects = member.failures = 0
+                    member.losses = member.probe_failures = 0
+        return snap
@@ -0,0 +1,33 @@
+#!/bin/python3
+from __future__ import absolute_import
+
+__author__ = "Erol Yesin"
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+from .event_handler import EventHandler
+from .packet import Packet
+from .lane import Lane
+from .throttle import Throttle
+from .event_bus import EventBus
+from .timer_wheel import TimerWheel, Timer, shared_wheel
+from .timer_wheel import SKIP, FIRE_ALL, COALESCE
+from .repeated_timer import RepeatedTimer
+from .timer_event import TimerEvent
+from .async_timer import AsyncRepeatedTimer, AsyncTimerEvent
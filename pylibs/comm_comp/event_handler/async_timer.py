@@ -0,0 +1,182 @@
+#!/bin/python3
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+#
+#
+
+__author__ = "Erol Yesin"
+
+import asyncio
+import inspect
+import time
+
+from comm_queues.queue_stats import Histogram
+
+from .event_handler import EventHandler
+
+
+class AsyncRepeatedTimer:
+    """RepeatedTimer for code that already runs an asyncio event loop.
+
+    Takes the same keywords as RepeatedTimer (`interval`, `target`, `src`,
+    `start_tm`, `dest`) plus `loop=`, and must be created on the loop's
+    thread.  Ticks are scheduled with loop.call_at() on the loop clock, each
+    from the exact previous deadline, so there is no thread per timer and no
+    drift.  The target is called with the kwargs dict on the loop thread; a
+    coroutine it returns is run as a task.  A tick that comes due while the
+    previous task is still running is skipped and counted as an overlap, and
+    ticks missed while the loop was busy are skipped and counted as missed.
+    """
+
+    def __init__(self, **kwargs):
+        assert "interval" in kwargs, "interval key not defined"
+        assert "target" in kwargs, "target key not defined"
+        assert "src" in kwargs, "src key not defined"
+        self.loop = kwargs.pop("loop", None) or asyncio.get_running_loop()
+        self.kwargs = kwargs
+        self.__dict__.update(kwargs)
+        self.name = self.src
+
+        if "dest" not in self.kwargs:
+            self.kwargs["dest"] = "Ether"
+        del self.kwargs["target"]
+        if "start_tm" not in kwargs:
+            self.start_tm = time.time()
+        # start_tm moved onto the loop clock, read once
+        self._anchor = self.loop.time() - (time.time() - self.start_tm)
+
+        self.runs = 0
+        self.missed = 0
+        self.overlaps = 0
+        self.errors = 0
+        self.last_error = None
+        self.lateness = Histogram()
+        self.duration = Histogram()
+        self._deadline = None
+        self._handle = None
+        self._task = None
+        self._started = None
+        self.start()
+
+    def start(self):
+        if self._handle is None:
+            now = self.loop.time()
+            elapsed = (now - self._anchor) % self.interval
+            self._deadline = now + self.interval - elapsed
+            self._handle = self.loop.call_at(self._deadline, self._tick)
+        return self
+
+    def _tick(self):
+        now = self.loop.time()
+        deadline = self._deadline
+        self.lateness.add(now - deadline)
+        if self._task is not None:
+            self.overlaps += 1
+        else:
+            self.runs += 1
+            try:
+                result = self.target(self.kwargs)
+            except Exception as e:
+                self._failed(e)
+            else:
+                if inspect.isawaitable(result):
+                    self._started = now
+                    self._task = asyncio.ensure_future(result, loop=self.loop)
+                    self._task.add_done_callback(self._done)
+                else:
+                    self.duration.add(self.loop.time() - now)
+        # Re-arm from the deadline, past any ticks the loop was too busy for
+        deadline += self.interval
+        now = self.loop.time()
+        if deadline <= now:
+            missed = int((now - deadline) // self.interval) + 1
+            self.missed += missed
+            deadline += missed * self.interval
+        self._deadline = deadline
+        self._handle = self.loop.call_at(deadline, self._tick)
+
+    def _done(self, task):
+        self._task = None
+        self.duration.add(self.loop.time() - self._started)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self._failed(error)
+
+    def _failed(self, error):
+        self.errors += 1
+        self.last_error = repr(error)
+
+    def stats(self, reset: bool = False):
+        """Runs, skipped ticks, and lateness/duration histograms (seconds)."""
+        snap = {
+            "runs": self.runs,
+            "missed": self.missed,
+            "overlaps": self.overlaps,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "lateness": self.lateness.snapshot(),
+            "duration": self.duration.snapshot(),
+        }
+        if reset:
+            self.runs = self.missed = self.overlaps = self.errors = 0
+            self.last_error = None
+            self.lateness.reset()
+            self.duration.reset()
+        return snap
+
+    def is_alive(self):
+        return self._handle is not None
+
+    def stop(self):
+        """Cancel further ticks; a target task already running is left to finish."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    async def drain(self, timeout: float = None):
+        """Wait for the target task still running after stop(), if any."""
+        if self._task is not None:
+            await asyncio.wait((self._task,), timeout=timeout)
+
+
+class AsyncTimerEvent(EventHandler, AsyncRepeatedTimer):
+    """TimerEvent on the running event loop; subscribers are called on the
+    loop thread for every tick."""
+
+    def __init__(self, **kwargs):
+        assert "interval" in kwargs, "interval key not defined"
+        if "event" not in kwargs:
+            kwargs["event"] = str(kwargs["interval"]) + "s_timer"
+        if "src" not in kwargs:
+            kwargs["src"] = "AsyncTimerEvent"
+        if "target" not in kwargs:
+            kwargs["target"] = "self"
+        # target="self" posts every tick to this handler's subscribers
+        if kwargs["target"] == "self":
+            kwargs["target"] = self._post_tick
+
+        loop = kwargs.pop("loop", None)
+        EventHandler.__init__(self, **kwargs)
+        AsyncRepeatedTimer.__init__(self, loop=loop, **kwargs)
+
+    def _post_tick(self, kwargs):
+        self.post(payload=kwargs)
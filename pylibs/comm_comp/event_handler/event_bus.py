@@ -0,0 +1,154 @@
+#!/bin/python3
+#
+#  Copyright (c) 2019-2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+from threading import Lock
+from typing import Any
+
+from .event_handler import EventHandler
+
+SEP = "/"
+ONE = "+"
+ALL = "#"
+
+
+class _Node:
+    __slots__ = ("children", "handler")
+
+    def __init__(self):
+        self.children = {}
+        self.handler = None
+
+
+class EventBus(object):
+    """Process-wide publish/subscribe bus over hierarchical topics.
+
+    Topics are "/" separated (dev/serial/ttyUSB0/rx).  Subscription patterns
+    may use MQTT style wildcards: "+" matches one level and a trailing "#"
+    any number of levels, including none.  Every distinct pattern owns an
+    EventHandler, so subscribe() takes the same options (batch, where,
+    max_rate, ...) and packets carry the published topic as pkt["topic"].
+    Patterns are kept in a trie, so matching walks the topic's levels instead
+    of testing every subscription, and the handlers found per topic are
+    cached until the next subscribe/unsubscribe.
+    """
+
+    __instance: object = None
+    # Distinct topics remembered before the route cache is flushed
+    CACHE_SIZE: int = 4096
+
+    def __new__(cls):
+        if EventBus.__instance is None:
+            EventBus.__instance = object.__new__(cls)
+            EventBus.__instance._root = _Node()
+            EventBus.__instance._lock = Lock()
+            EventBus.__instance._routes = {}
+        return EventBus.__instance
+
+    @staticmethod
+    def _levels(pattern: str):
+        levels = pattern.split(SEP)
+        for depth, level in enumerate(levels):
+            if ALL in level and (level != ALL or depth != len(levels) - 1):
+                raise ValueError("'#' must be the whole last level: %s" % pattern)
+            if ONE in level and level != ONE:
+                raise ValueError("'+' must be a whole level: %s" % pattern)
+        return levels
+
+    def handler(self, pattern: str, create: bool = True):
+        """The EventHandler behind a pattern, e.g. to call dispatch_async()."""
+        with self._lock:
+            node = self._root
+            for level in self._levels(pattern):
+                child = node.children.get(level)
+                if child is None:
+                    if not create:
+                        return None
+                    child = node.children[level] = _Node()
+                node = child
+            if node.handler is None and create:
+                node.handler = EventHandler(event=pattern, src="bus")
+                self._routes = {}
+            return node.handler
+
+    def subscribe(
+        self,
+        pattern: str,
+        name: str,
+        on_event: callable,
+        cookie: Any = None,
+        **options,
+    ):
+        self.handler(pattern).subscribe(
+            name=name, on_event=on_event, cookie=cookie, **options
+        )
+        return self
+
+    def unsubscribe(self, pattern: str, name: str):
+        handler = self.handler(pattern, create=False)
+        if handler is not None:
+            handler.unsubscribe(name=name)
+        return self
+
+    def match(self, topic: str):
+        """EventHandlers whose pattern matches topic."""
+        routes = self._routes
+        handlers = routes.get(topic)
+        if handlers is None:
+            handlers = self._match(topic.split(SEP))
+            if len(routes) >= self.CACHE_SIZE:
+                routes.clear()
+            routes[topic] = handlers
+        return handlers
+
+    def _match(self, levels):
+        found = []
+        # Wildcards do not match $-prefixed system topics at the first level
+        wild = not levels[0].startswith("$")
+        stack = [(self._root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            children = node.children
+            if wild or depth:
+                tail = children.get(ALL)
+                if tail is not None and tail.handler is not None:
+                    found.append(tail.handler)
+            if depth == len(levels):
+                if node.handler is not None:
+                    found.append(node.handler)
+                continue
+            child = children.get(levels[depth])
+            if child is not None:
+                stack.append((child, depth + 1))
+            if wild or depth:
+                child = children.get(ONE)
+                if child is not None:
+                    stack.append((child, depth + 1))
+        return tuple(found)
+
+    def publish(self, topic: str, payload, **kwargs):
+        for handler in self.match(topic):
+            handler.post(payload, topic=topic, **kwargs)
+        return self
+
+    def publish_many(self, topic: str, payloads: list, **kwargs):
+        for handler in self.match(topic):
+            handler.post_many(payloads, topic=topic, **kwargs)
+        return self
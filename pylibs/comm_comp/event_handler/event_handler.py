@@ -18,8 +18,30 @@
 #
 
 __author__ = "Erol Yesin"
+from collections import deque
+from threading import Lock
+from time import monotonic, perf_counter
 from typing import Any
 
+from comm_queues.comm_queue import DROP_OLDEST
+from comm_queues.queue_stats import Histogram
+
+from .filters import FilterTable, compile_filter
+from .lane import Lane, shared_executor
+from .packet import FIELDS, Packet
+from .throttle import Throttle
+
+
+def _timed(on_event: callable, histogram: Histogram):
+    def timed(pkt):
+        start = perf_counter()
+        try:
+            return on_event(pkt)
+        finally:
+            histogram.add(perf_counter() - start)
+
+    return timed
+
 
 class EventHandler:
     def __init__(self, **kwargs):
@@ -33,26 +55,276 @@ class EventHandler:
             self.packet["cookie"] = None
         ## super().__init__(**kwargs)
         self.cb_routines = {}
+        # (name, on_event, cookie, batch) per subscriber, replaced on every
+        # subscribe/unsubscribe so post() iterates it without copying or locking
+        self._subscribers = ()
+        self._lock = Lock()
+        # Free list of packets: a post takes one and returns it when the
+        # subscribers are done, so steady state dispatch allocates nothing
+        # and concurrent or nested posts still get a packet each
+        self._pool = deque()
+        extra = {k: v for k, v in kwargs.items() if k not in FIELDS}
+        self._base = (kwargs.get("event"), kwargs["src"], extra)
+        # dispatch_async(): name -> Lane, and the matching post() tuple
+        self._lane_map = None
+        self._lane_args = None
+        self._lanes = None
+        # What post() reads, swapped as one tuple: (subscriber or lane
+        # tuples, FilterTable or None, lanes?)
+        self._route = ((), None, False)
+        # bridge(): (EventBus, topic) every post is also published to
+        self._bridge = None
+        # time_subscribers(): name -> Histogram of callback seconds
+        self._timings = None
+
+    def _on_event(self, name, r):
+        # The callback post() runs for a subscriber, timed if asked to
+        if self._timings is None:
+            return r["on_event"]
+        histogram = self._timings.setdefault(name, Histogram())
+        return _timed(r["on_event"], histogram)
+
+    def _rebuild(self):
+        self._subscribers = tuple(
+            (name, self._on_event(name, r), r["cookie"], r["batch"])
+            for name, r in self.cb_routines.items()
+        )
+        if self._lane_args is None:
+            self._lane_map = self._lanes = None
+        else:
+            lane_map = {}
+            for name, r in self.cb_routines.items():
+                lane = (self._lane_map or {}).get(name)
+                if lane is None:
+                    lane = Lane(
+                        name=name, on_event=self._on_event(name, r), **self._lane_args
+                    )
+                lane_map[name] = lane
+            self._lane_map = lane_map
+            self._lanes = tuple(
+                (name, lane_map[name], cookie, batch)
+                for name, _, cookie, batch in self._subscribers
+            )
+        filters = [r["where"] for r in self.cb_routines.values()]
+        table = None
+        if any(where is not None for where in filters):
+            table = FilterTable(filters)
+        if self._lanes is None:
+            self._route = (self._subscribers, table, False)
+        else:
+            self._route = (self._lanes, table, True)
 
-    def subscribe(self, name: str, on_event: callable, cookie: Any = None):
-        if name not in self.cb_routines:
-            self.cb_routines[name] = {"on_event": on_event, "cookie": cookie}
+    def dispatch_async(
+        self,
+        enable: bool = True,
+        executor=None,
+        backlog: int = 1000,
+        policy: str = DROP_OLDEST,
+        timeout: float = None,
+    ):
+        """Deliver posts on a thread pool instead of the posting thread.
+
+        Every subscriber gets its own Lane: a bounded backlog drained by one
+        pool task at a time, so each subscriber keeps post order while
+        subscribers run in parallel.  `policy` (a comm_queues policy) decides
+        what happens when a lane's backlog is full.  Packets are allocated per
+        lane in this mode, so callbacks may keep them.
+        """
+        with self._lock:
+            if enable:
+                self._lane_args = {
+                    "executor": executor or shared_executor(),
+                    "backlog": backlog,
+                    "policy": policy,
+                    "timeout": timeout,
+                }
+                # New settings apply to fresh lanes
+                self._lane_map = None
+            else:
+                self._lane_args = None
+            self._rebuild()
+        return self
+
+    def time_subscribers(self, enable: bool = True):
+        """Keep a histogram of how long each subscriber's callback takes, two
+        clock reads per delivery.  Lanes already running stay untimed."""
+        with self._lock:
+            self._timings = {} if enable else None
+            self._rebuild()
+        return self
+
+    def dispatch_stats(self, reset: bool = False):
+        """Callback seconds per subscriber, see time_subscribers()."""
+        timings = self._timings or {}
+        snap = {name: histogram.snapshot() for name, histogram in timings.items()}
+        if reset:
+            for histogram in timings.values():
+                histogram.reset()
+        return snap
+
+    def lane_stats(self, reset: bool = False):
+        lane_map = self._lane_map or {}
+        return {name: lane.stats(reset=reset) for name, lane in lane_map.items()}
+
+    def bridge(self, topic: str = None, bus=None):
+        """Also publish every post to `topic` on an EventBus (the process-wide
+        one by default).  bridge() with no topic stops it."""
+        if topic is None:
+            self._bridge = None
+        else:
+            if bus is None:
+                from .event_bus import EventBus
+
+                bus = EventBus()
+            self._bridge = (bus, topic)
+        return self
+
+    def throttle_stats(self, reset: bool = False):
+        """Delivered/suppressed counts of the rate limited subscribers."""
+        return {
+            name: r["throttle"].stats(reset=reset)
+            for name, r in self.cb_routines.copy().items()
+            if r["throttle"] is not None
+        }
+
+    def join(self, timeout: float = None):
+        """Wait for every lane backlog to be delivered."""
+        deadline = None if timeout is None else monotonic() + timeout
+        for lane in (self._lane_map or {}).values():
+            remaining = None if deadline is None else max(deadline - monotonic(), 0)
+            if not lane.join(timeout=remaining):
+                return False
+        return True
+
+    def subscribe(
+        self,
+        name: str,
+        on_event: callable,
+        cookie: Any = None,
+        batch: bool = False,
+        where: Any = None,
+        max_rate: float = None,
+        debounce: float = None,
+        latest_only: bool = False,
+    ):
+        # batch subscribers get one packet per post_many() with a list payload.
+        # where= limits the payloads delivered; see filters.compile_filter().
+        # max_rate/debounce/latest_only thin the packets out; see Throttle.
+        with self._lock:
+            if name not in self.cb_routines:
+                throttle = None
+                if max_rate or debounce or latest_only:
+                    throttle = Throttle(
+                        on_event,
+                        max_rate=max_rate,
+                        debounce=debounce,
+                        latest_only=latest_only,
+                    )
+                    on_event = throttle
+                self.cb_routines[name] = {
+                    "on_event": on_event,
+                    "cookie": cookie,
+                    "batch": batch,
+                    "where": compile_filter(where),
+                    "throttle": throttle,
+                }
+                self._rebuild()
         return self
 
     def unsubscribe(self, name):
-        if name in self.cb_routines:
-            del self.cb_routines[name]
+        with self._lock:
+            if name in self.cb_routines:
+                throttle = self.cb_routines.pop(name)["throttle"]
+                if throttle is not None:
+                    throttle.cancel()
+                self._rebuild()
         return self
 
-    def post(self, payload, **kwargs):
-        packet = self.packet.copy()
+    def _take(self, kwargs):
+        try:
+            packet = self._pool.pop()
+        except IndexError:
+            packet = Packet()
+        packet.event, packet.src, packet.extra = self._base
         for field in kwargs:
             packet[field] = kwargs[field]
-        packet["payload"] = payload
-        for name, cb_routine in self.cb_routines.copy().items():
-            packet["dest"] = name
-            packet["cookie"] = cb_routine["cookie"]
-            cb_routine["on_event"](packet)
+        return packet
+
+    @staticmethod
+    def _groups(targets, table, payloads):
+        if table is None:
+            return [(target, payloads) for target in targets]
+        hits = [[] for _ in targets]
+        for payload in payloads:
+            for index in table.match(payload):
+                hits[index].append(payload)
+        return [(target, items) for target, items in zip(targets, hits) if items]
+
+    def _post_lanes(self, groups, kwargs, many):
+        packet = self._take(kwargs)
+        event, src, extra = packet.event, packet.src, packet.extra
+        self._pool.append(packet)
+        stamp = monotonic()
+        for (name, lane, cookie, batch), payloads in groups:
+            if many and batch:
+                lane.submit(Packet(event, src, name, payloads, cookie, extra), stamp)
+            else:
+                lane.submit_many(
+                    [Packet(event, src, name, p, cookie, extra) for p in payloads],
+                    stamp,
+                )
+        return self
+
+    def post(self, payload, **kwargs):
+        if self._bridge is not None:
+            bus, topic = self._bridge
+            bus.publish(topic, payload, **kwargs)
+        targets, table, lanes = self._route
+        if table is not None:
+            targets = [targets[index] for index in table.match(payload)]
+        if lanes:
+            return self._post_lanes(
+                [(target, (payload,)) for target in targets], kwargs, many=False
+            )
+        # One packet per post, re-addressed for each subscriber in turn.
+        # Callbacks that keep the packet past their return must copy() it.
+        packet = self._take(kwargs)
+        packet.payload = payload
+        try:
+            for name, on_event, cookie, _ in targets:
+                packet.dest = name
+                packet.cookie = cookie
+                on_event(packet)
+        finally:
+            packet.payload = packet.cookie = None
+            self._pool.append(packet)
+        return self
+
+    def post_many(self, payloads: list, **kwargs):
+        if not payloads:
+            return self
+        if self._bridge is not None:
+            bus, topic = self._bridge
+            bus.publish_many(topic, payloads, **kwargs)
+        targets, table, lanes = self._route
+        groups = self._groups(targets, table, payloads)
+        if lanes:
+            return self._post_lanes(groups, kwargs, many=True)
+        packet = self._take(kwargs)
+        try:
+            for (name, on_event, cookie, batch), items in groups:
+                packet.dest = name
+                packet.cookie = cookie
+                if batch:
+                    packet.payload = items
+                    on_event(packet)
+                else:
+                    for payload in items:
+                        packet.payload = payload
+                        on_event(packet)
+        finally:
+            packet.payload = packet.cookie = None
+            self._pool.append(packet)
         return self
 
     def __call__(self, payload, **kwargs):
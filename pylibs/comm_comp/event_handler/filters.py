@@ -0,0 +1,186 @@
+#!/bin/python3
+#
+#  Copyright (c) 2019-2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+import json
+import re
+from collections.abc import Mapping
+
+# Trie node slot holding the subscriber indices whose prefix ends there
+_HITS = None
+
+
+class Prefix:
+    """Payload starts with `prefix` (str payloads, or bytes via UTF-8)."""
+
+    __slots__ = ("prefix",)
+
+    def __init__(self, prefix: (str, bytes)):
+        self.prefix = prefix
+
+
+class Regex:
+    """re.search(pattern, payload) finds a match."""
+
+    __slots__ = ("pattern", "_other")
+
+    def __init__(self, pattern):
+        self.pattern = re.compile(pattern)
+        self._other = None
+
+    def __call__(self, payload):
+        pattern = self.pattern
+        if isinstance(payload, str) != isinstance(pattern.pattern, str):
+            if isinstance(payload, (bytes, bytearray, memoryview)):
+                payload = bytes(payload).decode("utf-8", "replace")
+            elif isinstance(payload, str):
+                if self._other is None:
+                    self._other = re.compile(pattern.pattern.decode("utf-8"))
+                pattern = self._other
+            else:
+                return False
+        return pattern.search(payload) is not None
+
+
+class FieldEquals:
+    """payload[field] == value, where the payload is a mapping or a JSON
+    document.  Values must be hashable; they key the equality index."""
+
+    __slots__ = ("field", "value")
+
+    def __init__(self, field: str, value):
+        self.field = field
+        self.value = value
+
+
+def compile_filter(where):
+    """Normalise a subscribe(where=...) spec to a list of filters, any one of
+    which selects the packet.
+
+    A str/bytes is a Prefix, a compiled pattern a Regex, a dict one or more
+    FieldEquals that must all hold, a callable a plain predicate and a
+    list/tuple any of the above.
+    """
+    if where is None:
+        return None
+    if isinstance(where, (list, tuple)):
+        return [f for spec in where for f in compile_filter(spec)]
+    if isinstance(where, (str, bytes)):
+        return [Prefix(where)]
+    if isinstance(where, re.Pattern):
+        return [Regex(where)]
+    if isinstance(where, Mapping):
+        fields = [FieldEquals(field, value) for field, value in where.items()]
+        return [tuple(fields) if len(fields) > 1 else fields[0]]
+    if isinstance(where, (Prefix, Regex, FieldEquals)) or callable(where):
+        return [where]
+    raise TypeError("unsupported where= filter: %r" % (where,))
+
+
+class FilterTable:
+    """Compiled where= filters of one EventHandler.
+
+    Prefixes live in a character trie (one for str, one for bytes payloads),
+    field equalities in a field -> value -> subscribers hash index, and only
+    regexes and predicates are tried one by one.  match() returns the indices
+    of the subscribers that should see a payload, in subscription order.
+    """
+
+    def __init__(self, filters, parse: callable = json.loads):
+        self.parse = parse
+        self.always = []
+        self.str_trie = {}
+        self.bytes_trie = {}
+        self.fields = {}
+        self.scans = []
+        for index, compiled in enumerate(filters):
+            if compiled is None:
+                self.always.append(index)
+                continue
+            for where in compiled:
+                self._add(index, where)
+
+    def _add(self, index, where):
+        if isinstance(where, Prefix):
+            prefix = where.prefix
+            text = prefix if isinstance(prefix, str) else prefix.decode("utf-8")
+            self._insert(self.str_trie, text, index)
+            self._insert(self.bytes_trie, text.encode("utf-8"), index)
+        elif isinstance(where, (FieldEquals, tuple)):
+            first, rest = (
+                (where[0], where[1:]) if isinstance(where, tuple) else (where, ())
+            )
+            values = self.fields.setdefault(first.field, {})
+            values.setdefault(first.value, []).append((index, rest))
+        else:
+            self.scans.append((index, where))
+
+    @staticmethod
+    def _insert(trie, key, index):
+        node = trie
+        for unit in key:
+            node = node.setdefault(unit, {})
+        node.setdefault(_HITS, []).append(index)
+
+    @staticmethod
+    def _walk(trie, payload, hits):
+        node = trie
+        if _HITS in node:
+            hits.update(node[_HITS])
+        for unit in payload:
+            node = node.get(unit)
+            if node is None:
+                return
+            if _HITS in node:
+                hits.update(node[_HITS])
+
+    def _document(self, payload):
+        if isinstance(payload, Mapping):
+            return payload
+        if isinstance(payload, (str, bytes, bytearray)):
+            try:
+                doc = self.parse(payload)
+            except ValueError:
+                return None
+            return doc if isinstance(doc, Mapping) else None
+        return None
+
+    def match(self, payload):
+        hits = set(self.always)
+        if self.str_trie:
+            if isinstance(payload, str):
+                self._walk(self.str_trie, payload, hits)
+            elif isinstance(payload, (bytes, bytearray, memoryview)):
+                self._walk(self.bytes_trie, payload, hits)
+        if self.fields:
+            doc = self._document(payload)
+            if doc is not None:
+                for field, values in self.fields.items():
+                    try:
+                        entries = values.get(doc[field], ())
+                    except (KeyError, TypeError):
+                        continue
+                    for index, rest in entries:
+                        if all(doc.get(f.field) == f.value for f in rest):
+                            hits.add(index)
+        for index, test in self.scans:
+            if index not in hits and test(payload):
+                hits.add(index)
+        return sorted(hits)
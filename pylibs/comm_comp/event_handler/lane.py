@@ -0,0 +1,177 @@
+#!/bin/python3
+#
+#  Copyright (c) 2019-2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock
+from time import monotonic
+
+from comm_queues.comm_queue import DROP_OLDEST, DROP_NEWEST, RAISE, QueueFull
+from comm_queues.queue_stats import Histogram
+
+_executor = None
+_executor_lock = Lock()
+
+
+def shared_executor():
+    """Process-wide pool the subscriber lanes run on, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=min(32, (os.cpu_count() or 1) + 4),
+                thread_name_prefix="evtLane",
+            )
+        return _executor
+
+
+class Lane:
+    """Serial delivery lane for one subscriber on a shared executor.
+
+    Packets queue in a bounded backlog and at most one pool task drains it at
+    a time, so the subscriber sees posts in order while other lanes run in
+    parallel.  A task delivers up to QUANTUM packets and then re-queues
+    itself, which keeps one busy lane from hogging a worker.  `policy` is one
+    of the comm_queues full-queue policies.  `lag` is the time a packet
+    waited in the backlog before its callback started.
+    """
+
+    QUANTUM: int = 64
+
+    def __init__(
+        self,
+        name: str,
+        on_event: callable,
+        executor=None,
+        backlog: int = 1000,
+        policy: str = DROP_OLDEST,
+        timeout: float = None,
+    ):
+        self.name = name
+        self.on_event = on_event
+        self.executor = executor or shared_executor()
+        self.backlog = backlog
+        self.policy = policy
+        self.timeout = timeout
+        self.items = deque()
+        self.condition = Condition()
+        self._running = False
+        self.dispatched = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = None
+        self.lag = Histogram()
+
+    def __len__(self):
+        return len(self.items)
+
+    def _make_room(self):
+        # Called with the lock held and the backlog full
+        if self.policy == DROP_OLDEST:
+            self.items.popleft()
+            self.dropped += 1
+            return True
+        if self.policy == DROP_NEWEST:
+            self.dropped += 1
+            return False
+        if self.policy == RAISE:
+            raise QueueFull("lane %s backlog full (%d)" % (self.name, self.backlog))
+
+        deadline = None if self.timeout is None else monotonic() + self.timeout
+        while len(self.items) >= self.backlog:
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                raise QueueFull("lane %s backlog full (%d)" % (self.name, self.backlog))
+            self.condition.wait(timeout=remaining)
+        return True
+
+    def submit_many(self, packets, stamp: float = None):
+        if stamp is None:
+            stamp = monotonic()
+        with self.condition:
+            for packet in packets:
+                if len(self.items) >= self.backlog and not self._make_room():
+                    continue
+                self.items.append((stamp, packet))
+            if self._running or not self.items:
+                return
+            self._running = True
+        self._schedule()
+
+    def submit(self, packet, stamp: float = None):
+        self.submit_many((packet,), stamp=stamp)
+
+    def _schedule(self):
+        try:
+            self.executor.submit(self._drain)
+        except RuntimeError:
+            # Executor shut down: the backlog is abandoned
+            with self.condition:
+                self._running = False
+                self.condition.notify_all()
+
+    def _drain(self):
+        with self.condition:
+            items = self.items
+            batch = [items.popleft() for _ in range(min(self.QUANTUM, len(items)))]
+            self.condition.notify_all()
+        on_event = self.on_event
+        add = self.lag.add
+        for stamp, packet in batch:
+            add(monotonic() - stamp)
+            try:
+                on_event(packet)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = repr(e)
+        with self.condition:
+            self.dispatched += len(batch)
+            if not self.items:
+                self._running = False
+                self.condition.notify_all()
+                return
+        self._schedule()
+
+    def join(self, timeout: float = None):
+        """Wait until the backlog is delivered.  Returns False on timeout."""
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: not self._running and not self.items, timeout=timeout
+            )
+
+    def stats(self, reset: bool = False):
+        with self.condition:
+            snap = {
+                "depth": len(self.items),
+                "backlog": self.backlog,
+                "policy": self.policy,
+                "dispatched": self.dispatched,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "lag": self.lag.snapshot(),
+            }
+            if reset:
+                self.dispatched = self.dropped = self.errors = 0
+                self.last_error = None
+                self.lag.reset()
+        return snap
@@ -0,0 +1,90 @@
+#!/bin/python3
+#
+#  Copyright (c) 2019-2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+from collections.abc import Mapping
+
+# Packet fields every EventHandler post carries
+FIELDS = ("event", "src", "dest", "payload", "cookie")
+_FIELD_SET = frozenset(FIELDS)
+_NO_EXTRA = {}
+
+
+class Packet(Mapping):
+    """Event packet as a __slots__ record.
+
+    Reads like the dict packets callbacks always received (pkt["payload"],
+    "cookie" in pkt, str(pkt), dict(pkt)) while costing a single small object
+    per post.  Keys beyond FIELDS live in `extra`, which is shared with the
+    posting EventHandler and copied the first time a callback writes to it.
+    """
+
+    __slots__ = FIELDS + ("extra",)
+
+    def __init__(
+        self,
+        event=None,
+        src=None,
+        dest=None,
+        payload=None,
+        cookie=None,
+        extra: dict = _NO_EXTRA,
+    ):
+        self.event = event
+        self.src = src
+        self.dest = dest
+        self.payload = payload
+        self.cookie = cookie
+        self.extra = extra
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            return getattr(self, key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            setattr(self, key, value)
+        else:
+            extra = dict(self.extra)
+            extra[key] = value
+            self.extra = extra
+
+    def __contains__(self, key):
+        return key in _FIELD_SET or key in self.extra
+
+    def __iter__(self):
+        yield from FIELDS
+        yield from self.extra
+
+    def __len__(self):
+        return len(FIELDS) + len(self.extra)
+
+    def copy(self):
+        return dict(self)
+
+    def clone(self):
+        """Detached Packet, for holding on to a pooled one."""
+        return Packet(
+            self.event, self.src, self.dest, self.payload, self.cookie, self.extra
+        )
+
+    def __repr__(self):
+        return repr(dict(self))
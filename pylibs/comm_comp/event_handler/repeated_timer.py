@@ -24,42 +24,69 @@
 __author__ = "Six: https://stackoverflow.com/users/4117209/six"
 
 import time
-from threading import Event, Thread
-from event_handler import EventHandler
 
+from .timer_wheel import SKIP, shared_wheel
 
-class RepeatedTimer(Thread):
-    """Repeat `function` every `interval` seconds."""
+
+class RepeatedTimer:
+    """Repeat `function` every `interval` seconds.
+
+    Runs as a periodic timer on the shared TimerWheel rather than on a thread
+    of its own.  Pass `wheel=` to use a different TimerWheel and `catch_up=`
+    (SKIP, FIRE_ALL, COALESCE) to choose how missed ticks are handled.
+    `start_tm` (wall clock) only sets the phase; the ticks themselves follow
+    time.monotonic_ns().
+    """
 
     def __init__(self, **kwargs):
         assert "interval" in kwargs, "interval key not defined"
         assert "target" in kwargs, "target key not defined"
         assert "src" in kwargs, "src key not defined"
-        self.__thread_event = Event()
+        self.wheel = kwargs.pop("wheel", None) or shared_wheel()
+        self.catch_up = kwargs.pop("catch_up", SKIP)
         self.join_timeout = 2
         self.kwargs = kwargs
         self.__dict__.update(kwargs)
-        self.__eventer = EventHandler(src=self.src)
+        self.name = self.src
 
         if "dest" not in self.kwargs:
             self.kwargs["dest"] = "Ether"
         del self.kwargs["target"]
         if "start_tm" not in kwargs:
             self.start_tm = time.time()
-        super().__init__(name=self.src, target=self._target)
-        self.__continue = True
+        # start_tm moved onto the monotonic clock, read once
+        self._anchor_ns = time.monotonic_ns() - int((time.time() - self.start_tm) * 1e9)
+        self.__timer = None
         self.start()
 
+    def start(self):
+        if self.__timer is None or not self.__timer.active:
+            self.__timer = self.wheel.call_every(
+                self.interval, self._target, first=self._time, catch_up=self.catch_up
+            )
+        return self
+
     def _target(self):
-        while not self.__thread_event.wait(self._time) and self.__continue:
-            self.target(self.kwargs)
+        self.target(self.kwargs)
 
     @property
     def _time(self):
-        return self.interval - ((time.time() - self.start_tm) % self.interval)
+        elapsed = (time.monotonic_ns() - self._anchor_ns) / 1e9
+        return self.interval - (elapsed % self.interval)
+
+    def stats(self, reset: bool = False):
+        """Runs, missed ticks, and lateness/duration histograms (seconds)."""
+        if self.__timer is None:
+            return None
+        return self.__timer.stats(reset=reset)
+
+    def is_alive(self):
+        return self.__timer is not None and self.__timer.active
 
     def stop(self):
-        if self.is_alive():
-            self.__thread_event.set()
-            self.__continue = False
-            self.join(timeout=self.join_timeout)
+        if self.__timer is not None:
+            self.__timer.cancel()
+
+    def join(self, timeout: float = None):
+        # Kept from the Thread based version; there is no thread to wait for
+        pass
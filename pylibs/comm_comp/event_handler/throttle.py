@@ -0,0 +1,116 @@
+#!/bin/python3
+#
+#  Copyright (c) 2019-2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+from threading import Lock
+from time import monotonic
+
+from .timer_wheel import shared_wheel
+
+
+class Throttle:
+    """Wraps a subscriber callback so it runs at most `max_rate` times per
+    second, only after `debounce` seconds without new packets, and/or
+    (`latest_only`) with whatever arrived last instead of every packet.
+
+    Packets that would break the limit are dropped, or with latest_only /
+    debounce held (a copy) and flushed later from the shared TimerWheel,
+    replacing any packet already held.  Every dropped or replaced packet
+    counts as suppressed.
+    """
+
+    def __init__(
+        self,
+        on_event: callable,
+        max_rate: float = None,
+        debounce: float = None,
+        latest_only: bool = False,
+    ):
+        self.on_event = on_event
+        self.interval = 1.0 / max_rate if max_rate else 0.0
+        self.debounce = debounce
+        self.latest_only = latest_only
+        self._lock = Lock()
+        self._pending = None
+        self._timer = None
+        self._next_allowed = 0.0
+        self.delivered = 0
+        self.suppressed = 0
+        self.errors = 0
+
+    def __call__(self, packet):
+        now = monotonic()
+        with self._lock:
+            if self.debounce:
+                due = max(now + self.debounce, self._next_allowed)
+            elif self._pending is None and not self.latest_only:
+                if now >= self._next_allowed:
+                    self._next_allowed = now + self.interval
+                    self.delivered += 1
+                    deliver = True
+                else:
+                    self.suppressed += 1
+                    deliver = False
+                due = None
+            else:
+                due = max(now, self._next_allowed)
+            if due is not None:
+                if self._pending is not None:
+                    self.suppressed += 1
+                self._pending = packet.clone()
+                if self._timer is None or self.debounce:
+                    if self._timer is not None:
+                        self._timer.cancel()
+                    self._timer = shared_wheel().call_later(due - now, self._flush)
+                return
+        if deliver:
+            self.on_event(packet)
+
+    def _flush(self):
+        with self._lock:
+            if self._pending is None:
+                return
+            packet, self._pending, self._timer = self._pending, None, None
+            self._next_allowed = monotonic() + self.interval
+            self.delivered += 1
+        try:
+            self.on_event(packet)
+        except Exception:
+            self.errors += 1
+
+    def cancel(self):
+        with self._lock:
+            if self._pending is not None:
+                self.suppressed += 1
+            if self._timer is not None:
+                self._timer.cancel()
+            self._pending = self._timer = None
+
+    def stats(self, reset: bool = False):
+        with self._lock:
+            snap = {
+                "delivered": self.delivered,
+                "suppressed": self.suppressed,
+                "pending": self._pending is not None,
+                "errors": self.errors,
+            }
+            if reset:
+                self.delivered = self.suppressed = self.errors = 0
+        return snap
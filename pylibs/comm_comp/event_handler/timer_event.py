@@ -20,8 +20,8 @@ __author__ = "Erol Yesin"
 #
 #
 
-from event_handler import EventHandler
-from repeated_timer import RepeatedTimer
+from .event_handler import EventHandler
+from .repeated_timer import RepeatedTimer
 
 
 class TimerEvent(EventHandler, RepeatedTimer):
@@ -33,11 +33,18 @@ class TimerEvent(EventHandler, RepeatedTimer):
             kwargs["src"] = "TimerEvent"
         if "target" not in kwargs:
             kwargs["target"] = "self"
+        # target="self" posts every tick to this handler's subscribers
+        if kwargs["target"] == "self":
+            kwargs["target"] = self._post_tick
 
         EventHandler.__init__(self, **kwargs)
         RepeatedTimer.__init__(self, **kwargs)
 
+    def _post_tick(self, kwargs):
+        self.post(payload=kwargs)
 
+
+# Usage (from comm_comp):   >python3 -m event_handler.timer_event
 if __name__ == "__main__":
     import sys
     import os
@@ -0,0 +1,343 @@
+#!/bin/python3
+#
+#  Copyright (c) 2019-2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+__author__ = "Erol Yesin"
+
+from threading import Condition, Lock, Thread
+from time import monotonic_ns
+
+from comm_queues.queue_stats import Histogram
+
+# What a periodic timer does about ticks missed while it ran late:
+# drop them and stay on its grid, run each of them back to back, or run
+# once for all of them and then return to the grid
+SKIP = "skip"
+FIRE_ALL = "fire_all"
+COALESCE = "coalesce"
+CATCH_UP = (SKIP, FIRE_ALL, COALESCE)
+
+# Slot bits per level: 256 one-tick slots, then three levels of 64 slots,
+# covering 2**26 ticks (18.6 hours at 1 ms) before a timer has to be re-filed
+_ROOT_BITS = 8
+_LEVEL_BITS = 6
+_LEVELS = 4
+_SHIFTS = [0] + [_ROOT_BITS + _LEVEL_BITS * n for n in range(_LEVELS - 1)]
+_SIZES = [1 << _ROOT_BITS] + [1 << _LEVEL_BITS] * (_LEVELS - 1)
+_SPAN = 1 << (_ROOT_BITS + _LEVEL_BITS * (_LEVELS - 1))
+
+_wheel = None
+_wheel_lock = Lock()
+
+
+def shared_wheel():
+    """Process-wide TimerWheel, created on first use."""
+    global _wheel
+    with _wheel_lock:
+        if _wheel is None:
+            _wheel = TimerWheel()
+        return _wheel
+
+
+class Timer:
+    """Handle returned by TimerWheel.call_later()/call_every().
+
+    `deadline` and `interval` are monotonic_ns values; `expires` is the wheel
+    tick the deadline falls in.  `lateness` (start of the callback against
+    its deadline) and `duration` are histograms in seconds.
+    """
+
+    __slots__ = (
+        "wheel",
+        "callback",
+        "args",
+        "kwargs",
+        "deadline",
+        "expires",
+        "interval",
+        "catch_up",
+        "slot",
+        "cancelled",
+        "runs",
+        "missed",
+        "errors",
+        "last_error",
+        "lateness",
+        "duration",
+    )
+
+    def __init__(self, wheel, callback, args, kwargs, deadline, interval, catch_up):
+        if catch_up not in CATCH_UP:
+            raise ValueError("unknown catch_up policy %r" % (catch_up,))
+        self.wheel = wheel
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.expires = wheel._tick(deadline)
+        self.interval = interval
+        self.catch_up = catch_up
+        self.slot = None
+        self.cancelled = False
+        self.runs = 0
+        self.missed = 0
+        self.errors = 0
+        self.last_error = None
+        self.lateness = Histogram()
+        self.duration = Histogram()
+
+    @property
+    def active(self):
+        # A periodic timer stays active while its callback runs
+        if self.cancelled:
+            return False
+        return self.slot is not None or self.interval is not None
+
+    def cancel(self):
+        self.wheel.cancel(self)
+
+    def stats(self, reset: bool = False):
+        snap = {
+            "runs": self.runs,
+            "missed": self.missed,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "lateness": self.lateness.snapshot(),
+            "duration": self.duration.snapshot(),
+        }
+        if reset:
+            self.runs = self.missed = self.errors = 0
+            self.last_error = None
+            self.lateness.reset()
+            self.duration.reset()
+        return snap
+
+
+class TimerWheel:
+    """Hierarchical timing wheel running any number of one-shot and periodic
+    timers on a single thread.
+
+    Time is cut into `resolution` second ticks.  A timer due within 256 ticks
+    sits in the root wheel's slot for its tick; later ones sit in a coarser
+    level and cascade down as the root wheel wraps.  Slots are dicts, so
+    adding and cancelling a timer are O(1) whatever the number of timers.
+    Callbacks run on the wheel thread and must not block for long.  All
+    times are time.monotonic_ns(), so wall clock steps do not disturb the
+    timers, and periodic timers are re-armed from their exact previous
+    deadline, so they do not drift; `catch_up` decides what happens to the
+    ticks a late timer missed.
+    """
+
+    def __init__(self, resolution: float = 0.001, name: str = "timerWheel"):
+        self.resolution = resolution
+        self.name = name
+        self._res_ns = max(int(resolution * 1e9), 1)
+        self._origin = monotonic_ns()
+        self._current = 0
+        self._wheels = [[{} for _ in range(size)] for size in _SIZES]
+        self._count = 0
+        self._condition = Condition()
+        self._thread = None
+        self._continue = True
+        # Tick the idle wheel thread will wake at: (waiting, tick or None)
+        self._wake = (False, None)
+
+    def __len__(self):
+        return self._count
+
+    def _tick(self, when_ns: int):
+        # First tick at or after when_ns, so timers never fire early
+        return -((self._origin - when_ns) // self._res_ns)
+
+    def _skip_idle(self):
+        # Lock held.  An empty wheel has nothing to expire or cascade, so jump
+        # to the current tick instead of stepping through the idle ones
+        if not self._count:
+            now = (monotonic_ns() - self._origin) // self._res_ns
+            self._current = max(self._current, now)
+
+    def _file(self, timer):
+        # Lock held.  Put timer into the slot matching its distance from now.
+        expires = max(timer.expires, self._current)
+        delta = min(expires - self._current, _SPAN - 1)
+        level = 0
+        while level < _LEVELS - 1 and delta >= (1 << _SHIFTS[level + 1]):
+            level += 1
+        if level == _LEVELS - 1:
+            expires = self._current + delta
+        slot = self._wheels[level][(expires >> _SHIFTS[level]) & (_SIZES[level] - 1)]
+        slot[timer] = None
+        timer.slot = slot
+
+    def _schedule(self, timer):
+        with self._condition:
+            timer.cancelled = False
+            if timer.slot is None:
+                self._skip_idle()
+                self._count += 1
+            else:
+                del timer.slot[timer]
+            self._file(timer)
+            if self._thread is None:
+                self._thread = Thread(name=self.name, target=self._run, daemon=True)
+                self._thread.start()
+            waiting, wake = self._wake
+            if waiting and (wake is None or timer.expires < wake):
+                self._wake = (False, None)
+                self._condition.notify()
+        return timer
+
+    def call_later(self, delay: float, callback: callable, *args, **kwargs):
+        """Run callback(*args, **kwargs) once, delay seconds from now."""
+        deadline = monotonic_ns() + int(delay * 1e9)
+        timer = Timer(self, callback, args, kwargs, deadline, None, SKIP)
+        return self._schedule(timer)
+
+    def call_every(
+        self,
+        interval: float,
+        callback: callable,
+        *args,
+        first: float = None,
+        catch_up: str = SKIP,
+        **kwargs
+    ):
+        """Run callback(*args, **kwargs) every interval seconds, the first time
+        after `first` seconds (one interval by default).  catch_up is SKIP,
+        FIRE_ALL or COALESCE."""
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if first is None:
+            first = interval
+        deadline = monotonic_ns() + int(first * 1e9)
+        timer = Timer(
+            self, callback, args, kwargs, deadline, int(interval * 1e9), catch_up
+        )
+        return self._schedule(timer)
+
+    def cancel(self, timer: Timer):
+        with self._condition:
+            timer.cancelled = True
+            if timer.slot is not None:
+                del timer.slot[timer]
+                timer.slot = None
+                self._count -= 1
+
+    def _cascade(self, level):
+        # Lock held.  Empty one slot of `level` into the finer levels.
+        index = (self._current >> _SHIFTS[level]) & (_SIZES[level] - 1)
+        slot = self._wheels[level][index]
+        if slot:
+            self._wheels[level][index] = {}
+            for timer in slot:
+                self._file(timer)
+        return index
+
+    def _expire(self):
+        # Lock held.  Advance one tick and return the timers that fell due.
+        index = self._current & (_SIZES[0] - 1)
+        if index == 0:
+            level = 1
+            while level < _LEVELS and self._cascade(level) == 0:
+                level += 1
+        root = self._wheels[0]
+        due = root[index]
+        if due:
+            root[index] = {}
+        self._current += 1
+        return due
+
+    def _next_due(self):
+        # Lock held.  Ticks until the next root slot with timers, or until the
+        # next cascade when the rest of the root wheel is empty.
+        root = self._wheels[0]
+        start = self._current & (_SIZES[0] - 1)
+        for ticks in range(_SIZES[0] - start):
+            if root[start + ticks]:
+                return ticks
+        return _SIZES[0] - start
+
+    def _run(self):
+        while self._continue:
+            fired = []
+            with self._condition:
+                self._skip_idle()
+                now = (monotonic_ns() - self._origin) // self._res_ns
+                while self._current <= now:
+                    for timer in self._expire():
+                        timer.slot = None
+                        self._count -= 1
+                        fired.append(timer)
+                if not fired:
+                    if self._count:
+                        due = self._current + self._next_due()
+                        wait = (
+                            self._origin + due * self._res_ns - monotonic_ns()
+                        ) / 1e9
+                    else:
+                        due = wait = None
+                    self._wake = (True, due)
+                    self._condition.wait(timeout=wait)
+                    self._wake = (False, None)
+                    continue
+            for timer in fired:
+                self._fire(timer)
+
+    def _fire(self, timer):
+        if timer.cancelled:
+            # Cancelled after _expire() collected it
+            return
+        start = monotonic_ns()
+        timer.runs += 1
+        timer.lateness.add((start - timer.deadline) / 1e9)
+        try:
+            timer.callback(*timer.args, **timer.kwargs)
+        except Exception as e:
+            timer.errors += 1
+            timer.last_error = repr(e)
+        end = monotonic_ns()
+        timer.duration.add((end - start) / 1e9)
+        if timer.interval is not None:
+            with self._condition:
+                if timer.slot is not None or timer.cancelled:
+                    # Re-armed or cancelled while it ran
+                    return
+                interval = timer.interval
+                deadline = timer.deadline + interval
+                if deadline <= end and timer.catch_up != FIRE_ALL:
+                    # Ticks due by now that this run overran
+                    missed = (end - deadline) // interval + 1
+                    if timer.catch_up == SKIP:
+                        timer.missed += missed
+                        deadline += missed * interval
+                    else:
+                        # COALESCE: one run right away stands in for them all
+                        timer.missed += missed - 1
+                        deadline += (missed - 1) * interval
+                timer.deadline = deadline
+                timer.expires = self._tick(deadline)
+                self._skip_idle()
+                self._count += 1
+                self._file(timer)
+
+    def stop(self):
+        with self._condition:
+            self._continue = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
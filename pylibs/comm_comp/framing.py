@@ -0,0 +1,327 @@
+#!/bin/python3
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+from __future__ import absolute_import
+
+__author__ = "Erol Yesin"
+
+import re
+import struct
+
+from comm_queues.byte_ring import ByteRing
+
+SLIP_END = b"\xc0"
+SLIP_ESC = b"\xdb"
+SLIP_ESC_END = b"\xdb\xdc"
+SLIP_ESC_ESC = b"\xdb\xdd"
+
+
+class Framer:
+    """Splits a byte stream into messages, one chunk at a time.
+
+    Chunks go into a ByteRing, either copied in by feed() or read straight
+    into it with fill(sock.recv_into) / writable() + commit().  Each call
+    returns the frames completed so far and remembers how far it already
+    searched, so a long partial frame is never scanned twice.  Frames are
+    bytes, or str when the framer has an `encoding`.  encode() does the
+    reverse for send().  Not thread-safe: one reader owns a framer.
+
+    Subclasses implement frames().  Garbage that can not be framed (a frame
+    larger than the ring, a bad COBS block) is dropped and counted in
+    `errors`.
+    """
+
+    encoding = None
+
+    def __init__(self, capacity: int = 64 << 10):
+        self.ring = ByteRing(capacity)
+        self.errors = 0
+        # Bytes taken in, for the device metrics
+        self.received = 0
+        self._scanned = 0
+
+    def message(self, view):
+        """One frame as bytes, or str when the framer has an encoding."""
+        if self.encoding is None:
+            return bytes(view)
+        return str(view, self.encoding)
+
+    def frames(self):
+        """Complete frames buffered in the ring, consumed."""
+        raise NotImplementedError
+
+    def encode(self, payload: bytes):
+        """payload framed for the wire."""
+        raise NotImplementedError
+
+    def feed(self, data):
+        """Copy a chunk in and return the frames it completed."""
+        ring = self.ring
+        view = memoryview(data)
+        self.received += len(view)
+        if len(view) <= ring.free:
+            ring.write(view)
+            return self.frames()
+        frames = []
+        while view:
+            # frames() never leaves the ring full, so there is always room
+            count = min(len(view), ring.free)
+            ring.write(view[:count])
+            view = view[count:]
+            frames += self.frames()
+        return frames
+
+    def fill(self, recv_into: callable):
+        """ring.fill(recv_into) and the frames it completed, None if nothing
+        was read (end of stream)."""
+        count = self.ring.fill(recv_into)
+        if not count:
+            return None
+        self.received += count
+        return self.frames()
+
+    def commit(self, count: int):
+        """For writes into ring.writable(): commit count bytes, return frames."""
+        self.ring.commit(count)
+        self.received += count
+        return self.frames()
+
+    def reset(self):
+        self.ring.clear()
+        self._scanned = 0
+
+
+class LineFramer(Framer):
+    """Frames ending in `delim`, delimiter included unless strip=True.  A line
+    longer than the ring is passed on in pieces, as the helpers always did.
+    Decoded to str by default."""
+
+    def __init__(
+        self,
+        delim: bytes = b"\n",
+        strip: bool = False,
+        encoding: str = "ascii",
+        capacity: int = 64 << 10,
+    ):
+        super(LineFramer, self).__init__(capacity=capacity)
+        self.delim = delim
+        self.strip = strip
+        self.encoding = encoding
+
+    def frames(self):
+        ring = self.ring
+        delim = self.delim
+        cut = len(delim) if self.strip else 0
+        frames = []
+        index = ring.find(delim, self._scanned)
+        while index >= 0:
+            view = ring.read(index + len(delim))
+            frames.append(self.message(view[: len(view) - cut]))
+            index = ring.find(delim)
+        # A delimiter may have arrived in part
+        self._scanned = max(len(ring) - len(delim) + 1, 0)
+        if ring.full:
+            frames.append(self.message(ring.read()))
+            self._scanned = 0
+        return frames
+
+    def encode(self, payload: bytes):
+        if payload.endswith(self.delim):
+            return payload
+        return payload + self.delim
+
+
+class RegexFramer(Framer):
+    """Frames ending at each match of a bytes regex, match included.  A match
+    is looked for again over the last `overlap` bytes of an unmatched tail,
+    so delimiters up to that long are found when they arrive split.
+    encode() appends `terminator` unless the payload already ends in it."""
+
+    def __init__(
+        self,
+        pattern,
+        terminator: bytes = b"\n",
+        overlap: int = 16,
+        encoding: str = "ascii",
+        capacity: int = 64 << 10,
+    ):
+        super(RegexFramer, self).__init__(capacity=capacity)
+        if isinstance(pattern, (bytes, str)):
+            pattern = re.compile(
+                pattern if isinstance(pattern, bytes) else pattern.encode()
+            )
+        self.pattern = pattern
+        self.terminator = terminator
+        self.overlap = overlap
+        self.encoding = encoding
+
+    def frames(self):
+        ring = self.ring
+        frames = []
+        span = ring.search(self.pattern, self._scanned)
+        while span is not None:
+            frames.append(self.message(ring.read(span[1])))
+            span = ring.search(self.pattern)
+        self._scanned = max(len(ring) - self.overlap, 0)
+        if ring.full:
+            frames.append(self.message(ring.read()))
+            self._scanned = 0
+        return frames
+
+    def encode(self, payload: bytes):
+        if payload.endswith(self.terminator):
+            return payload
+        return payload + self.terminator
+
+
+class LengthPrefixFramer(Framer):
+    """Frames led by a struct `header` holding the payload length, e.g. "!H"
+    (big-endian 16 bit) or "<I".  `adjust` is added to the header value for
+    protocols that count the header or a trailer too."""
+
+    def __init__(
+        self,
+        header: str = "!H",
+        adjust: int = 0,
+        include_header: bool = False,
+        capacity: int = 64 << 10,
+    ):
+        super(LengthPrefixFramer, self).__init__(capacity=capacity)
+        self.header = struct.Struct(header)
+        self.adjust = adjust
+        self.include_header = include_header
+
+    def frames(self):
+        ring = self.ring
+        size = self.header.size
+        unpack_from = self.header.unpack_from
+        skip = 0 if self.include_header else size
+        frames = []
+        while len(ring) >= size:
+            total = size + unpack_from(ring.peek(size))[0] + self.adjust
+            if total > ring.capacity or total < size:
+                # No way to find the next header again
+                self.errors += 1
+                ring.clear()
+                break
+            if len(ring) < total:
+                break
+            frames.append(bytes(ring.read(total)[skip:]))
+        return frames
+
+    def encode(self, payload: bytes):
+        return self.header.pack(len(payload) - self.adjust) + payload
+
+
+class _DelimitedFramer(Framer):
+    """Binary frames ending in a one byte DELIM that never occurs inside an
+    encoded frame.  Empty frames are skipped.  A frame that outgrows the
+    ring is dropped up to the next delimiter."""
+
+    DELIM = b"\x00"
+
+    def __init__(self, capacity: int = 64 << 10):
+        super(_DelimitedFramer, self).__init__(capacity=capacity)
+        self._discard = False
+
+    def _decode(self, frame):
+        return bytes(frame)
+
+    def frames(self):
+        ring = self.ring
+        delim = self.DELIM
+        frames = []
+        index = ring.find(delim, self._scanned)
+        while index >= 0:
+            frame = ring.read(index + 1)[:index]
+            if self._discard:
+                # Tail of the frame dropped when the ring filled up
+                self._discard = False
+            elif len(frame):
+                try:
+                    frames.append(self._decode(frame))
+                except ValueError:
+                    self.errors += 1
+            index = ring.find(delim)
+        self._scanned = len(ring)
+        if ring.full:
+            self.errors += 1
+            self.reset()
+            self._discard = True
+        return frames
+
+
+class SLIPFramer(_DelimitedFramer):
+    """RFC 1055 SLIP: frames end in END (0xC0); END and ESC inside a frame are
+    escaped.  Empty frames, e.g. from a leading END, are skipped."""
+
+    DELIM = SLIP_END
+
+    def _decode(self, frame):
+        frame = bytes(frame)
+        if SLIP_ESC in frame:
+            frame = frame.replace(SLIP_ESC_END, SLIP_END)
+            frame = frame.replace(SLIP_ESC_ESC, SLIP_ESC)
+        return frame
+
+    def encode(self, payload: bytes):
+        payload = payload.replace(SLIP_ESC, SLIP_ESC_ESC)
+        payload = payload.replace(SLIP_END, SLIP_ESC_END)
+        return SLIP_END + payload + SLIP_END
+
+
+def cobs_encode(data: bytes):
+    """Consistent Overhead Byte Stuffing, without the trailing zero."""
+    out = bytearray()
+    for block in bytes(data).split(b"\x00"):
+        while len(block) >= 254:
+            out += b"\xff" + block[:254]
+            block = block[254:]
+        out.append(len(block) + 1)
+        out += block
+    return bytes(out)
+
+
+def cobs_decode(data: bytes):
+    """Inverse of cobs_encode(); ValueError on a malformed block."""
+    out = bytearray()
+    index = 0
+    length = len(data)
+    while index < length:
+        code = data[index]
+        end = index + code
+        if code == 0 or end > length:
+            raise ValueError("bad COBS block at %d" % index)
+        out += data[index + 1 : end]
+        index = end
+        if code != 0xFF and index < length:
+            out.append(0)
+    return bytes(out)
+
+
+class COBSFramer(_DelimitedFramer):
+    """COBS encoded frames, each ending in a zero byte."""
+
+    DELIM = b"\x00"
+
+    def _decode(self, frame):
+        return cobs_decode(frame)
+
+    def encode(self, payload: bytes):
+        return cobs_encode(payload) + b"\x00"
@@ -0,0 +1,172 @@
+#!/bin/python3
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+from __future__ import absolute_import
+
+__author__ = "Erol Yesin"
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+# metrics() key, metric name, type, help
+FIELDS = (
+    ("rx_msgs", "rx_messages_total", "counter", "Messages received."),
+    ("rx_bytes", "rx_bytes_total", "counter", "Bytes received."),
+    ("tx_msgs", "tx_messages_total", "counter", "Messages sent."),
+    ("tx_bytes", "tx_bytes_total", "counter", "Bytes sent."),
+    ("tx_errors", "send_errors_total", "counter", "Failed sends."),
+    ("queue_in", "queue_in_depth", "gauge", "Messages waiting for the subscribers."),
+    ("queue_out", "queue_out_depth", "gauge", "Messages waiting to be sent."),
+    ("connected", "connected", "gauge", "1 while the device is connected."),
+)
+
+
+def _labels(**labels):
+    def escape(value):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        return value.replace("\n", "\\n")
+
+    return ",".join('%s="%s"' % (k, escape(v)) for k, v in labels.items())
+
+
+def _histogram(lines, name, labels, snap):
+    # queue_stats.Histogram snapshots count per bucket, Prometheus cumulates
+    seen = 0
+    for bound, count in snap["buckets"].items():
+        seen += count
+        lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, seen))
+    lines.append("%s_sum{%s} %r" % (name, labels, float(snap["sum"])))
+    lines.append("%s_count{%s} %d" % (name, labels, snap["count"]))
+
+
+def prometheus_text(sources, prefix: str = "comm"):
+    """The metrics() of every source (devices, MQTT_Wrapper) in the
+    Prometheus text exposition format, labelled by device and kind."""
+    snaps = [source.metrics() for source in sources]
+    lines = []
+    for key, name, kind, text in FIELDS:
+        name = "%s_%s" % (prefix, name)
+        lines.append("# HELP %s %s" % (name, text))
+        lines.append("# TYPE %s %s" % (name, kind))
+        for snap in snaps:
+            labels = _labels(device=snap["device"], kind=snap["kind"])
+            lines.append("%s{%s} %d" % (name, labels, int(snap[key])))
+
+    name = prefix + "_query_rtt_seconds"
+    lines.append("# HELP %s Seconds from query() to its reply." % name)
+    lines.append("# TYPE %s histogram" % name)
+    for snap in snaps:
+        if snap["rtt"] is not None:
+            labels = _labels(device=snap["device"], kind=snap["kind"])
+            _histogram(lines, name, labels, snap["rtt"])
+
+    name = prefix + "_dispatch_seconds"
+    lines.append("# HELP %s Seconds spent in a subscriber callback." % name)
+    lines.append("# TYPE %s histogram" % name)
+    for snap in snaps:
+        for event, subscribers in snap["dispatch"].items():
+            for subscriber, timing in subscribers.items():
+                labels = _labels(
+                    device=snap["device"],
+                    kind=snap["kind"],
+                    event=event,
+                    subscriber=subscriber,
+                )
+                _histogram(lines, name, labels, timing)
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.exporter.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """Serves prometheus_text() of its sources on http://host:port/metrics
+    from a daemon thread.  Each scrape calls metrics() on every source, the
+    devices themselves only keep their counters.  port=0 picks a free port,
+    see url."""
+
+    def __init__(
+        self,
+        sources: list = (),
+        host: str = "127.0.0.1",
+        port: int = 9108,
+        prefix: str = "comm",
+    ):
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self._sources = list(sources)
+        self._lock = Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://%s:%d/metrics" % (self.host, self.port)
+
+    def add(self, source):
+        with self._lock:
+            self._sources.append(source)
+        return source
+
+    def remove(self, source):
+        with self._lock:
+            self._sources.remove(source)
+        return source
+
+    def render(self):
+        with self._lock:
+            sources = list(self._sources)
+        return prometheus_text(sources, prefix=self.prefix)
+
+    def start(self):
+        if self._httpd is not None:
+            return self
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.exporter = self
+        self.port = self._httpd.server_address[1]
+        self._thread = Thread(
+            name="metricsT", target=self._httpd.serve_forever, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is None:
+            return self
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join(timeout=4)
+        self._httpd = None
+        self._thread = None
+        return self
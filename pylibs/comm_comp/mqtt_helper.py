@@ -25,19 +25,25 @@ import json
 import socket
 import time
 import urllib
+from collections import deque
 from datetime import datetime
 from pathlib import Path
-from threading import Thread
+from threading import Lock, Thread
 from typing import Any
 
 from paho.mqtt.client import Client
 
 from .comm_queues import Queue as Q
+from .comm_queues import SpillQueue
 from .event_handler import EventHandler as Eventer
+from .event_handler.event_bus import EventBus
 from .log_wrapper import LoggerWrapper
 
 
 class MQTT_Wrapper(object):
+    # Most messages moved per queue lock acquisition by the in/out threads
+    BATCH_SIZE: int = 64
+
     def __init__(
         self,
         broker: str,
@@ -47,6 +53,8 @@ class MQTT_Wrapper(object):
         sn_filter: list = ["+"],
         logger: (LoggerWrapper, None) = None,
         debug: bool = True,
+        spill_path: (str, None) = None,
+        spill_threshold: int = 1000,
     ):
 
         self.name = name
@@ -70,14 +78,40 @@ class MQTT_Wrapper(object):
         self.topic_event = dict()
 
         self.in_q = Q()
+        # attach_bus(): (EventBus, topic root) incoming messages are mirrored to
+        self._bus = None
         self.continue_thread = True
         self.connected = False
+        # Traffic counters, see metrics()
+        self.rx_msgs = 0
+        self.rx_bytes = 0
+        self.tx_msgs = 0
+        self.tx_bytes = 0
+        self.tx_errors = 0
+        # time_subscribers(): topic/event Eventers created later are timed too
+        self._timed = False
         self.in_qprocT = Thread(
             name="mqtt_InqT", target=self.in_qproc, args=[self.in_q]
         )
         self.in_qprocT.start()
 
-        self.out_q = Q()
+        # Store-and-forward: every message goes to a segment log and leaves
+        # it once the broker has it, see _on_publish()
+        if spill_path is not None:
+            self.out_q = SpillQueue(
+                path=spill_path,
+                threshold=spill_threshold,
+                serializer=lambda item: json.dumps(item).encode(),
+                deserializer=json.loads,
+                manual_ack=True,
+            )
+        else:
+            self.out_q = Q()
+        # Message ids of the out_q items taken, oldest first (None: nothing
+        # to wait for), and the ids on_publish reported ahead of their turn
+        self._inflight = deque()
+        self._published = set()
+        self._ack_lock = Lock()
         self.out_qprocT = Thread(
             name="mqtt_OutqT", target=self.out_qproc, args=[self.out_q]
         )
@@ -96,6 +130,7 @@ class MQTT_Wrapper(object):
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
         self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
         self.client.on_subscribe = self._on_subscribe
         self.client.on_unsubscribe = self._on_unsubscribe
         if self.port in (8883, 443):
@@ -108,50 +143,91 @@ class MQTT_Wrapper(object):
 
     def in_qproc(self, inq: Q):
         while self.continue_thread:
-            item = inq.get()
-            if item is not None and str(item) not in ["exit", "quit"]:
-                found_topic = self._section_compare(
-                    pub=item.topic, subs=list(self.topic_event.keys())
-                )
+            batch = inq.get_many(max_items=self.BATCH_SIZE)
+            subs = list(self.topic_event.keys())
+            found_topic = None
+            payloads = []
+            # Consecutive messages for the same subscription are posted together
+            for item in batch:
+                if str(item) in ["exit", "quit"]:
+                    continue
+                if self._bus is not None:
+                    bus, root = self._bus
+                    bus.publish(root + "/" + item.topic, item)
+                topic = self._section_compare(pub=item.topic, subs=subs)
+                if topic != found_topic and payloads:
+                    self.topic_event[found_topic].post_many(payloads=payloads)
+                    payloads = []
+                found_topic = topic
                 if found_topic is not None:
-                    # self.debug_write(topic=found_topic, data=item.payload)
-                    self.topic_event[found_topic].post(payload=item)
-            else:
-                pass
+                    payloads.append(item)
+            if payloads:
+                self.topic_event[found_topic].post_many(payloads=payloads)
         else:
             pass
 
+    def attach_bus(self, root: str = "mqtt", bus: EventBus = None):
+        """Mirror every received message onto the EventBus as <root>/<topic>
+        and status events as <root>/status."""
+        bus = bus or EventBus()
+        self._bus = (bus, root)
+        self.event["status"].bridge(topic=root + "/status", bus=bus)
+        return self
+
+    def detach_bus(self):
+        self._bus = None
+        self.event["status"].bridge(topic=None)
+        return self
+
     def out_qproc(self, outq: Q):
+        acked = isinstance(outq, SpillQueue)
         while self.continue_thread:
-            item = outq.get()
-            if item is not None and isinstance(item, dict):
+            if not self.connected:
+                # Hold the backlog (and let it spill) until the broker is back
+                time.sleep(0.5)
+                continue
+            batch = outq.get_many(max_items=self.BATCH_SIZE)
+            for indx, item in enumerate(batch):
+                if not isinstance(item, dict):
+                    if acked:
+                        self._track(None)
+                    continue
                 if "payload" not in item or "topic" not in item:
+                    if acked:
+                        self._track(None)
                     continue
-                rc, rc_msg = self.publish(
+                rc, rc_msg, mid = self._publish(
                     topic=item["topic"],
                     qos=item["qos"],
                     retain=item["retain"],
                     payload=item["payload"],
                 )
                 # QOS level 2 already does retries
+                if acked and (rc == 0 or item["qos"] == 2):
+                    self._track(mid)
                 if rc != 0 and item["qos"] != 2:
-                    self.out_q.put_back(item=item)
+                    # Requeue the failed item and the rest of the batch, in order
+                    for retry in reversed(batch[indx:]):
+                        self.out_q.put_back(item=retry)
                     time.sleep(0.5)
-                time.sleep(0.5)
-                item = None
+                    break
+            time.sleep(0.5)
 
     def send(
         self, data: str, channel: (str, None) = None, qos: int = 1, retain: bool = True
     ):
         msg = {"topic": channel, "qos": qos, "retain": retain, "payload": data}
         if channel is None:
-            for channel in self.subscriptions:
-                msg["topic"] = channel
-                self.out_q.put(item=msg)
+            self.out_q.put_many(
+                items=[dict(msg, topic=channel) for channel in self.subscriptions]
+            )
         else:
             self.out_q.put(item=msg)
 
     def publish(self, topic, payload, qos=1, retain=True):
+        return self._publish(topic, payload, qos=qos, retain=retain)[:2]
+
+    def _publish(self, topic, payload, qos=1, retain=True):
         try:
             json_object = json.loads(payload)
         except ValueError as ve:
@@ -159,11 +235,17 @@ class MQTT_Wrapper(object):
                 topic=ve.msg,
                 data=payload,
             )
+            self.tx_errors += 1
             raise ve
 
-        rc, cnt = self.client.publish(
+        rc, mid = self.client.publish(
             topic=topic, payload=payload, qos=qos, retain=retain
         )
+        if rc == 0:
+            self.tx_msgs += 1
+            self.tx_bytes += len(payload)
+        else:
+            self.tx_errors += 1
         if rc == 0:
             rc_msg = "SUCCESSFUL PUBLISH:rc=%d: Good job!  Gimme another" % int(rc)
         elif rc == 1:
@@ -183,7 +265,32 @@ class MQTT_Wrapper(object):
             topic=rc_msg,
             data=payload,
         )
-        return rc, rc_msg
+        return rc, rc_msg, mid
+
+    def _track(self, mid):
+        # out_qproc: the out_q item just taken is done once mid is published
+        with self._ack_lock:
+            self._inflight.append(mid)
+            self._ack_published()
+
+    def _on_publish(self, client, userdata, mid):
+        # The broker has the message (PUBACK/PUBCOMP, or sent for QOS 0)
+        with self._ack_lock:
+            self._published.add(mid)
+            self._ack_published()
+
+    def _ack_published(self):
+        # Lock held: ack the oldest out_q items whose publish completed
+        count = 0
+        while self._inflight:
+            mid = self._inflight[0]
+            if mid is not None and mid not in self._published:
+                break
+            self._inflight.popleft()
+            self._published.discard(mid)
+            count += 1
+        if count:
+            self.out_q.ack(count)
 
     # Events for internal events, like the app is starting or going down
     # Topics are external events, like the topic we subscribe to on the broker
@@ -194,13 +301,19 @@ class MQTT_Wrapper(object):
         event: str = None,
         topic: (str, list) = None,
         cookie: Any = None,
+        batch: bool = False,
+        **throttle,
     ):
+        # throttle: max_rate, debounce, latest_only (see EventHandler.subscribe)
         if name is None or call_back is None:
             return self
         if event is not None:
             if event not in self.event:
                 self.event[event] = Eventer(event=event, src="broker_event")
-            self.event[event].subscribe(name=name, on_event=call_back, cookie=cookie)
+                self.event[event].time_subscribers(enable=self._timed)
+            self.event[event].subscribe(
+                name=name, on_event=call_back, cookie=cookie, batch=batch, **throttle
+            )
             self.debug_update(event)
 
         if topic is not None:
@@ -211,8 +324,13 @@ class MQTT_Wrapper(object):
             for topic in topics:
                 if topic not in self.topic_event:
                     self.topic_event[topic] = Eventer(event=topic, src="broker_topic")
+                    self.topic_event[topic].time_subscribers(enable=self._timed)
                 self.topic_event[topic].subscribe(
-                    name=name, on_event=call_back, cookie=cookie
+                    name=name,
+                    on_event=call_back,
+                    cookie=cookie,
+                    batch=batch,
+                    **throttle,
                 )
                 self.client.subscribe(topic=topic, qos=2)
                 if topic not in self.subscriptions:
@@ -223,7 +341,12 @@ class MQTT_Wrapper(object):
         elif event is None:
             for topic in self.subscriptions:
                 self.subscribe(
-                    name=name, call_back=call_back, topic=topic, cookie=cookie
+                    name=name,
+                    call_back=call_back,
+                    topic=topic,
+                    cookie=cookie,
+                    batch=batch,
+                    **throttle,
                 )
 
         self.debug_write(topic=topic, data="Registered %s for %s event" % (name, topic))
@@ -266,8 +389,51 @@ class MQTT_Wrapper(object):
         self.continue_thread = False
         self.in_q.put(item="quit")
         self.in_qprocT.join(timeout=4)
-        self.out_q.put(item="quit")
+        self.out_q.put(item=None)
         self.out_qprocT.join(timeout=4)
+        if isinstance(self.out_q, SpillQueue):
+            self.out_q.close()
+
+    def instrument_queues(self, enable: bool = True):
+        self.in_q.instrument(enable=enable)
+        self.out_q.instrument(enable=enable)
+        return self
+
+    def queue_stats(self, reset: bool = False):
+        return {
+            "in": self.in_q.stats(reset=reset),
+            "out": self.out_q.stats(reset=reset),
+        }
+
+    def time_subscribers(self, enable: bool = True):
+        """Time every event and topic subscriber callback, see metrics()."""
+        self._timed = enable
+        for eventer in list(self.event.values()) + list(self.topic_event.values()):
+            eventer.time_subscribers(enable=enable)
+        return self
+
+    def metrics(self):
+        """Snapshot of the traffic counters, queue depths and, once
+        time_subscribers() is on, per-subscriber dispatch seconds keyed by
+        event or topic.  Same shape as BaseCommDeviceHelper.metrics()."""
+        eventers = dict(self.event)
+        eventers.update(self.topic_event)
+        return {
+            "device": self.name,
+            "kind": self.__class__.__name__,
+            "connected": self.connected,
+            "rx_msgs": self.rx_msgs,
+            "rx_bytes": self.rx_bytes,
+            "tx_msgs": self.tx_msgs,
+            "tx_bytes": self.tx_bytes,
+            "tx_errors": self.tx_errors,
+            "queue_in": len(self.in_q),
+            "queue_out": len(self.out_q),
+            "dispatch": {
+                event: eventer.dispatch_stats() for event, eventer in eventers.items()
+            },
+            "rtt": None,
+        }
 
     def _on_subscribe(self, client, userdata, mid, granted_qos):
         if mid not in self.subscribed:
@@ -339,6 +505,8 @@ class MQTT_Wrapper(object):
 
     # The callback for when a PUBLISH message is received from the server.
     def _on_message(self, client, userdata, msg):
+        self.rx_msgs += 1
+        self.rx_bytes += len(msg.payload)
         msg.payload = "".join(chr(x) for x in msg.payload)
 
         found_topic = self._section_compare(
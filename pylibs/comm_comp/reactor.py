@@ -0,0 +1,234 @@
+#!/bin/python3
+
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+from __future__ import absolute_import
+
+__author__ = "Erol Yesin"
+
+import selectors
+import socket
+from collections import deque
+from threading import Event, Lock, Thread, get_ident
+
+_reactor = None
+_reactor_lock = Lock()
+
+
+def shared_reactor():
+    """Process-wide single thread Reactor, created on first use."""
+    global _reactor
+    with _reactor_lock:
+        if _reactor is None:
+            _reactor = Reactor()
+        return _reactor
+
+
+class _Loop:
+    """One selector and the thread that runs it.
+
+    Other threads hand work to the loop with call_soon(), which appends to a
+    deque and writes one byte to a socketpair the selector also watches; the
+    byte is only written when the loop is not already due to wake up.
+    """
+
+    def __init__(self, name: str):
+        self.selector = selectors.DefaultSelector()
+        self.devices = 0
+        self.errors = 0
+        self.last_error = None
+        self._calls = deque()
+        self._lock = Lock()
+        self._woken = False
+        self._continue = True
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._thread = Thread(name=name, target=self._run, daemon=True)
+        self._thread.start()
+
+    def call_soon(self, callback: callable, *args):
+        """Run callback(*args) on the loop thread.  Safe from any thread."""
+        with self._lock:
+            self._calls.append((callback, args))
+            if self._woken:
+                return
+            self._woken = True
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            # Pipe full (a wake-up is pending anyway) or loop stopped
+            pass
+
+    def call(self, callback: callable, *args, timeout: float = 5):
+        """call_soon() and wait for the result; exceptions are re-raised here,
+        TimeoutError if the loop did not get to it within timeout seconds."""
+        if get_ident() == self._thread.ident or not self._thread.is_alive():
+            return callback(*args)
+        done = Event()
+        result = []
+        error = []
+
+        def run():
+            try:
+                result.append(callback(*args))
+            except Exception as e:
+                error.append(e)
+            finally:
+                done.set()
+
+        self.call_soon(run)
+        if not done.wait(timeout=timeout):
+            raise TimeoutError(
+                "%s is busy, %r did not run" % (self._thread.name, callback)
+            )
+        if error:
+            raise error[0]
+        return result[0] if result else None
+
+    def _register(self, device):
+        device._set_blocking(False)
+        self.selector.register(device.fileno(), selectors.EVENT_READ, device)
+
+    def _unregister(self, device):
+        try:
+            self.selector.unregister(device.fileno())
+        except (KeyError, ValueError, OSError):
+            # Already dropped after EOF, or the descriptor is closed
+            for key in list(self.selector.get_map().values()):
+                if key.data is device:
+                    self.selector.unregister(key.fileobj)
+        try:
+            device._set_blocking(True)
+        except (OSError, TypeError, ValueError):
+            pass
+
+    def want_write(self, device, enable: bool = True):
+        """Loop thread: also wait for device to turn writable, or stop."""
+        events = selectors.EVENT_READ
+        if enable:
+            events |= selectors.EVENT_WRITE
+        try:
+            key = self.selector.get_key(device.fileno())
+        except (KeyError, ValueError, TypeError):
+            # Dropped after EOF
+            return
+        if key.events != events:
+            self.selector.modify(key.fileobj, events, device)
+
+    def _run_calls(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except OSError:
+            pass
+        with self._lock:
+            # Cleared first so a call_soon racing with this pass wakes us again
+            self._woken = False
+            calls, self._calls = self._calls, deque()
+        for callback, args in calls:
+            self._guard(callback, *args)
+
+    def _guard(self, callback, *args):
+        try:
+            return callback(*args)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = repr(e)
+            return None
+
+    def _run(self):
+        select = self.selector.select
+        while self._continue:
+            for key, mask in select():
+                device = key.data
+                if device is None:
+                    self._run_calls()
+                    continue
+                if mask & selectors.EVENT_WRITE:
+                    self._guard(device._on_writable)
+                if mask & selectors.EVENT_READ:
+                    if self._guard(device._on_readable) is False:
+                        # EOF or a read error: stop watching the descriptor
+                        self._unregister(device)
+        self.selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def stop(self):
+        def halt():
+            self._continue = False
+
+        self.call_soon(halt)
+        self._thread.join(timeout=2)
+
+
+class Reactor:
+    """Runs reads, writes and dispatch for many BaseCommDeviceHelper devices
+    on one thread, or on a small pool of them, instead of three threads per
+    device.
+
+    device.open(reactor=...) makes the device's fileno() non-blocking and
+    registers it with the selector of the least loaded thread.  When it
+    turns readable the thread reads what is ready and posts complete
+    messages to the RX subscribers; send() queues the data and asks the same
+    thread to write what the transport takes and post TX, the rest once the
+    selector reports it writable, so a stalled peer holds up only itself.
+    Callbacks therefore run on the reactor thread and must not block for
+    long; use dispatch_async() on the device for slow subscribers.
+    """
+
+    def __init__(self, threads: int = 1, name: str = "reactor"):
+        self._loops = [_Loop(name="%s%d" % (name, n)) for n in range(threads)]
+        self._lock = Lock()
+
+    def register(self, device):
+        """Watch device on the least loaded thread and return that thread's loop."""
+        with self._lock:
+            loop = min(self._loops, key=lambda candidate: candidate.devices)
+            loop.devices += 1
+        try:
+            loop.call(loop._register, device)
+        except Exception:
+            with self._lock:
+                loop.devices -= 1
+            raise
+        return loop
+
+    def unregister(self, device, loop: _Loop):
+        try:
+            loop.call(loop._unregister, device)
+        finally:
+            with self._lock:
+                loop.devices -= 1
+
+    def stats(self):
+        return [
+            {
+                "thread": loop._thread.name,
+                "devices": loop.devices,
+                "errors": loop.errors,
+                "last_error": loop.last_error,
+            }
+            for loop in self._loops
+        ]
+
+    def stop(self):
+        for loop in self._loops:
+            loop.stop()
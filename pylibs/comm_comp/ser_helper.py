@@ -29,6 +29,7 @@ from typing import Any
 import serial
 
 from .base_dev_helper import BaseCommDeviceHelper
+from framing import Framer
 
 SERIAL_IN_EVENT = "serIn"
 SERIAL_OUT_EVENT = "serOut"
@@ -56,35 +57,72 @@ class MockSerial(BaseCommDeviceHelper):
 
 
 class SerialHelper(BaseCommDeviceHelper):
-    def __init__(self, port: str = None, baud: int = None):
+    # read() returns nothing when its timeout expires on an idle port
+    EOF_ON_EMPTY_READ = False
+
+    def __init__(
+        self,
+        port: str = None,
+        baud: int = None,
+        framer: Framer = None,
+        binary: bool = False,
+    ):
 
         self.port_name = port
         super(SerialHelper, self).__init__(
-            address=port, port=baud, recv_proc=self.__process_input__
+            address=port,
+            port=baud,
+            recv_proc=self.__process_input__,
+            framer=framer,
+            binary=binary,
         )
         if port is not None:
-            self._serport = serial.Serial(
-                port=port, baudrate=baud, timeout=4, exclusive=True
-            )
+            # Opened by open(), so a failed open can be retried
+            self._serport = serial.Serial(baudrate=baud, timeout=4, exclusive=True)
+            self._serport.port = port
         else:
             self._serport = MockSerial(port=port, baud=baud)
 
+    def _encode(self, data):
+        if isinstance(data, (bytes, bytearray)):
+            if self.framer is not None:
+                data = self.framer.encode(bytes(data))
+            return data
+        return data.encode(encoding="ascii")
+
     def _send(self, data):
         if not self._serport.is_open:
             self._open()
-        self._serport.write(data=data.encode(encoding="ascii"))
+        self._serport.write(data=self._encode(data))
+
+    def _send_many(self, batch):
+        # pyserial's writelines() is a write() per item; join for one write
+        if not self._serport.is_open:
+            self._open()
+        self._serport.write(data=b"".join(self._encode(data) for data in batch))
 
     def _recv(self, size=1024):
         if not self._serport.is_open:
             self._open()
         try:
             data = self._serport.readline()
-            data = data.decode()
-        except:
+            if not self.binary:
+                data = data.decode()
+        except UnicodeDecodeError:
             data = None
-            self.__event[self.RX_EVENT](payload="BAD DATA:")
+            self._post(self.RX_EVENT, ["BAD DATA:"])
         return data
 
+    def _recv_into(self, buffer):
+        # Only what has arrived, so a reactor read never waits for the timeout
+        waiting = self._serport.in_waiting
+        data = self._serport.read(min(len(buffer), waiting or 1))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def fileno(self):
+        return self._serport.fileno()
+
     def _open(self):
         if not self._serport.is_open:
             try:
@@ -94,12 +132,7 @@ class SerialHelper(BaseCommDeviceHelper):
                     topic=self.port_name + " OPEN ERROR",
                     data="Unable to open port. Error Code : " + str(e),
                 )
-                print(
-                    self.port_name
-                    + " OPEN ERROR: Unable to open port. Error: "
-                    + str(e)
-                )
-                super(SerialHelper, self).close()
+                raise
 
     def _close(self):
         if self._serport.is_open:
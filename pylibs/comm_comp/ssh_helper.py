@@ -38,6 +38,9 @@ from comm_queues import Queue as Q
 
 
 class SSHHelper(BaseCommDeviceHelper):
+    # _recv() polls the work queue and returns nothing when idle
+    EOF_ON_EMPTY_READ = False
+
     def __init__(self, address: str, port: int, username: str, password: str):
         self.host = address
         self.username = username
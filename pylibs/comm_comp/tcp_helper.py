@@ -21,59 +21,91 @@ from __future__ import absolute_import
 __author__ = "Erol Yesin"
 
 import socket
-import sys
 import time
 
 from base_dev_helper import BaseCommDeviceHelper
-from comm_queues import Queue as Q
+from framing import Framer, LineFramer
+
+# Most buffers one sendmsg() takes on Linux
+IOV_MAX = 1024
 
 
 class TCPHelper(BaseCommDeviceHelper):
-    def __init__(self, address: str):
+    # Seconds open() waits for the connection
+    CONNECT_TIMEOUT: float = 5.0
+
+    def __init__(self, address: str, framer: Framer = None, binary: bool = False):
 
         self.address = address.split(":")[0]
         self.port = int(address.split(":")[1])
+        self._socket = None
         super(TCPHelper, self).__init__(
-            address=self.address, port=self.port, recv_proc=self.__process_input__
+            address=self.address,
+            port=self.port,
+            recv_proc=self.__process_input__,
+            framer=framer or LineFramer(),
+            binary=binary,
         )
-        try:
-            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self._socket.connect((self.address, self.port))
-        except socket.error as msg:
-            self.debug_write(topic='Error',
-                             data="Socket could not be created. Error Code : "
-                                  + str(msg[0])
-                                  + " Message "
-                                  + msg[1]
-                             )
-            sys.exit()
-
-    def __process_input__(self, queue: Q):
-        msg = ""
-        while self.continue_thread:
-            data = self._recv(size=2)
-            if data is not None and len(data) > 0:
-                msg += data.decode("ascii")
-                if "\r\n" not in msg and "\n" not in msg:
-                    continue
-                queue.put(item=msg)
-                msg = ""
+        self.bus_id = "%s:%d" % (self.address, self.port)
 
-    def _send(self, data):
+    def _encode(self, data):
+        if isinstance(data, (bytes, bytearray)):
+            return self.framer.encode(bytes(data))
         data = str(data)
         if data is not None and ("\r\n" not in data and "\n" not in data):
             data += "\r\n"
-        data = data.encode()
-        self._socket.sendall(data)
+        return data.encode()
+
+    def _send(self, data):
+        self._socket.sendall(self._encode(data))
+
+    def _send_many(self, batch):
+        # One sendmsg() gathers the whole batch; loop only on a partial send
+        buffers = [self._encode(data) for data in batch]
+        if not hasattr(self._socket, "sendmsg"):
+            self._socket.sendall(b"".join(buffers))
+            return
+        while buffers:
+            sent = self._socket.sendmsg(buffers[:IOV_MAX])
+            while buffers and sent >= len(buffers[0]):
+                sent -= len(buffers.pop(0))
+            if sent:
+                buffers[0] = buffers[0][sent:]
 
     def _recv(self, size=1024):
-        return self._socket.recv(2)
+        return self._socket.recv(size)
+
+    def _recv_into(self, buffer):
+        return self._socket.recv_into(buffer)
+
+    def _write_some(self, view):
+        return self._socket.send(view)
+
+    def _set_blocking(self, flag):
+        self._socket.setblocking(flag)
+
+    def fileno(self):
+        return None if self._socket is None else self._socket.fileno()
 
     def _open(self):
-        pass
+        # Connect on every open() so a closed helper can reconnect
+        try:
+            self._socket = socket.create_connection((self.address, self.port),
+                                                    timeout=self.CONNECT_TIMEOUT)
+        except OSError as msg:
+            self.debug_write(topic='Error',
+                             data="Socket could not be connected. Error: " + str(msg))
+            raise
+        self._socket.settimeout(None)
 
     def _close(self):
-        self._socket.shutdown(socket.SHUT_RDWR)
+        if self._socket is None:
+            return
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            # Peer already gone
+            pass
         self._socket.close()
 
 
@@ -0,0 +1,267 @@
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+import unittest
+import sys
+import os
+import tempfile
+import asyncio
+import multiprocessing
+import threading
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from comm_queues import Queue, QueueFull, BLOCK, DROP_OLDEST, DROP_NEWEST, RAISE
+from comm_queues import ShmQueue, SpillQueue, AsyncQueue, ByteRing
+
+
+class QueueTestCase(unittest.TestCase):
+    def test_fifo_and_put_back(self):
+        q = Queue()
+        for item in ("a", "b", "c"):
+            q.put(item)
+        self.assertEqual(q.peek(), "a")
+        self.assertEqual(q.get(), "a")
+        q.put_back("a")
+        self.assertEqual(q.cycle(), "a")
+        self.assertEqual([q.get(), q.get(), q.get()], ["b", "c", "a"])
+        self.assertIsNone(q.get(timeout=0.01))
+
+    def test_drop_policies(self):
+        q = Queue(maxsize=2, policy=DROP_OLDEST)
+        for item in (1, 2, 3):
+            q.put(item)
+        self.assertEqual(list(q.items), [2, 3])
+
+        q = Queue(maxsize=2, policy=DROP_NEWEST)
+        for item in (1, 2, 3):
+            q.put(item)
+        self.assertEqual(list(q.items), [1, 2])
+        self.assertEqual(q.dropped, 1)
+
+    def test_raise_and_block(self):
+        q = Queue(maxsize=1, policy=RAISE)
+        q.put(1)
+        self.assertRaises(QueueFull, q.put, 2)
+
+        q = Queue(maxsize=1, policy=BLOCK, timeout=0.01)
+        q.put(1)
+        self.assertRaises(QueueFull, q.put, 2)
+        q.put_back(0)
+        self.assertEqual(q.size, 2)
+
+    def test_put_many_when_full(self):
+        q = Queue(maxsize=2, policy=RAISE).instrument()
+        self.assertRaises(QueueFull, q.put_many, [1, 2, 3])
+        self.assertEqual(q.stats()["puts"], 2)
+        self.assertEqual(q.get_many(), [1, 2])
+
+        # A consumer already waiting is woken to make room for the rest
+        q = Queue(maxsize=2, policy=BLOCK)
+        got = []
+        consumer = threading.Thread(
+            target=lambda: got.extend(q.get(timeout=2) for _ in range(4))
+        )
+        consumer.start()
+        self.assertEqual(q.put_many([1, 2, 3, 4], timeout=1), 4)
+        consumer.join(timeout=2)
+        self.assertEqual(got, [1, 2, 3, 4])
+
+    def test_get_many_put_many(self):
+        q = Queue()
+        self.assertEqual(q.put_many(range(1, 6)), 5)
+        self.assertEqual(q.get_many(max_items=2), [1, 2])
+        self.assertEqual(q.get_many(), [3, 4, 5])
+        self.assertEqual(q.get_many(timeout=0.01), [])
+
+    def test_instrumentation(self):
+        q = Queue(maxsize=2, policy=DROP_OLDEST)
+        self.assertFalse(q.stats()["enabled"])
+        q.instrument()
+        q.put_many([1, 2, 3])
+        q.get()
+        stats = q.stats()
+        self.assertEqual(
+            (stats["depth"], stats["high_watermark"], stats["dropped"]), (1, 2, 1)
+        )
+        self.assertEqual((stats["puts"], stats["gets"]), (3, 1))
+        self.assertEqual(stats["latency"]["count"], 1)
+        q.instrument(enable=False)
+        q.put(4)
+        self.assertEqual(q.get_many(), [3, 4])
+
+
+def _shm_produce(q, count, consumers):
+    q.put_many(b"%d" % n for n in range(count))
+    # One empty frame per consumer ends its loop
+    for _ in range(consumers):
+        q.put(b"")
+    q.close()
+
+
+def _shm_consume(q, results):
+    got = []
+    while True:
+        frame = q.get(timeout=10)
+        if not frame:
+            break
+        got.append(int(frame))
+    q.close()
+    results.put(got)
+
+
+class ShmQueueTestCase(unittest.TestCase):
+    def test_cross_process_delivery(self):
+        count, consumers = 5000, 4
+        ctx = multiprocessing.get_context()
+        # Small ring so the producer wraps and blocks on the consumers
+        q = ShmQueue(capacity=256, ctx=ctx)
+        results = ctx.Queue()
+        try:
+            procs = [
+                ctx.Process(target=_shm_consume, args=(q, results))
+                for _ in range(consumers)
+            ]
+            procs.append(ctx.Process(target=_shm_produce, args=(q, count, consumers)))
+            for proc in procs:
+                proc.start()
+            got = []
+            for _ in range(consumers):
+                got.extend(results.get(timeout=30))
+            for proc in procs:
+                proc.join(timeout=10)
+                self.assertEqual(proc.exitcode, 0)
+            self.assertEqual(sorted(got), list(range(count)))
+            self.assertTrue(q.empty)
+        finally:
+            q.close()
+
+    def test_frames_wrap_around(self):
+        q = ShmQueue(capacity=64)
+        try:
+            for rnd in range(10):
+                frames = [bytes([rnd]) * n for n in (5, 17, 0, 9)]
+                self.assertEqual(q.put_many(frames), 4)
+                self.assertEqual(q.get_many(), frames)
+            q.put(b"x" * 60)
+            self.assertRaises(QueueFull, q.put, b"y", timeout=0.01)
+            self.assertEqual(q.get(), b"x" * 60)
+            self.assertIsNone(q.get(timeout=0.01))
+        finally:
+            q.close()
+
+
+class SpillQueueTestCase(unittest.TestCase):
+    def test_spill_and_replay(self):
+        with tempfile.TemporaryDirectory() as path:
+            q = SpillQueue(path=path, threshold=2, segment_size=32)
+            q.put_many(range(10))
+            self.assertEqual(len(q.items), 2)
+            self.assertEqual(q.size, 10)
+            self.assertEqual(q.get_many(max_items=3), [0, 1, 2])
+            q.close()
+
+            q = SpillQueue(path=path, threshold=2, segment_size=32)
+            self.assertEqual(q.get_many(), list(range(3, 10)))
+            self.assertEqual(len(list(q.path.glob("*.seg"))), 1)
+            q.close()
+
+    def test_crash_keeps_ram_head(self):
+        with tempfile.TemporaryDirectory() as path:
+            crashed = SpillQueue(path=path, threshold=3)
+            crashed.put_many([1, 2, 3, 4, 5])
+            self.assertEqual(crashed.get(), 1)
+            # No close(): the process died with 2 and 3 only in RAM
+            q = SpillQueue(path=path, threshold=3)
+            self.assertEqual(q.get_many(), [2, 3, 4, 5])
+            q.close()
+            crashed.close()
+
+    def test_manual_ack(self):
+        def reopened():
+            crashed = SpillQueue(path=path, threshold=2, manual_ack=True)
+            try:
+                return crashed.get_many(timeout=0.01)
+            finally:
+                crashed.close()
+
+        with tempfile.TemporaryDirectory() as path:
+            q = SpillQueue(path=path, threshold=2, segment_size=32, manual_ack=True)
+            q.put_many(range(6))
+            self.assertEqual(q.get_many(max_items=4), [0, 1, 2, 3])
+            # Taken but not acked: a crash replays them
+            self.assertEqual(reopened(), list(range(6)))
+            q.put_back(3)
+            self.assertEqual(q.ack(2), 2)
+            self.assertEqual(q.unacked, 1)
+            self.assertEqual(reopened(), [2, 3, 4, 5])
+            self.assertEqual(q.get_many(), [3, 4, 5])
+            self.assertEqual(q.ack(), 4)
+            self.assertEqual(reopened(), [])
+            self.assertEqual(len(list(q.path.glob("*.seg"))), 1)
+            q.close()
+
+
+class ByteRingTestCase(unittest.TestCase):
+    def test_framing_and_compaction(self):
+        ring = ByteRing(capacity=16)
+        ring.write(b"ab\r\ncd")
+        self.assertEqual(ring.find(b"\n"), 3)
+        self.assertEqual(bytes(ring.read_until(b"\r\n")), b"ab\r\n")
+        self.assertIsNone(ring.read_until(b"\r\n"))
+
+        view = ring.writable(min_size=12)
+        self.assertEqual(len(view), 14)
+        view[:5] = b"ef\ngh"
+        ring.commit(5)
+        self.assertEqual(bytes(ring.read_until(b"\n")), b"cdef\n")
+        self.assertEqual(bytes(ring.peek()), b"gh")
+        self.assertRaises(BufferError, ring.write, b"x" * 15)
+        # Fills the tail first, then compacts to reuse the space already read
+        self.assertEqual(ring.fill(lambda buf: len(buf)), 9)
+        self.assertEqual(ring.fill(lambda buf: len(buf)), 5)
+        self.assertTrue(ring.full)
+        self.assertEqual(len(ring.read()), 16)
+        self.assertEqual(len(ring), 0)
+
+
+class AsyncQueueTestCase(unittest.TestCase):
+    def test_thread_producer_async_consumer(self):
+        async def consume():
+            q = Queue()
+            aq = AsyncQueue(q)
+            self.assertEqual(await aq.get_many(timeout=0.01), [])
+            producer = threading.Thread(target=q.put_many, args=(range(100),))
+            producer.start()
+            received = []
+            while len(received) < 100:
+                received += await aq.get_many(timeout=1)
+            producer.join()
+            threading.Timer(0.01, q.put, args=("late",)).start()
+            self.assertEqual(await aq.get(timeout=1), "late")
+            aq.close()
+            return received
+
+        self.assertEqual(asyncio.run(consume()), list(range(100)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,1032 @@
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+import unittest
+import sys
+import os
+import asyncio
+import builtins
+import json
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import TimeoutError
+from urllib.request import urlopen
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from base_dev_helper import BaseCommDeviceHelper
+from capture import RX, TX, CaptureWriter, read_capture
+from correlator import Correlator
+from async_dev_helper import AsyncTCPHelper, AsyncUDPHelper, AsyncSerialHelper
+from device_pool import DevicePool
+from framing import COBSFramer, LineFramer
+from metrics import MetricsServer
+from reactor import Reactor
+from tcp_helper import TCPHelper
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+
+class SocketDevice(BaseCommDeviceHelper):
+    """Device over one end of a socketpair, without log files."""
+
+    def __init__(self, sock: socket.socket, framer=None):
+        self._socket = sock
+        super(SocketDevice, self).__init__(
+            address="pair%d" % sock.fileno(), framer=framer
+        )
+
+    def debug_on(self, *args, **kwargs):
+        pass
+
+    def _send(self, data):
+        self._socket.sendall(data.encode())
+
+    def _recv(self, size=1024):
+        return self._socket.recv(size)
+
+    def _recv_into(self, buffer):
+        return self._socket.recv_into(buffer)
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def _open(self):
+        pass
+
+    def _close(self):
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+class ReactorTestCase(unittest.TestCase):
+    def test_many_devices_one_thread(self):
+        reactor = Reactor()
+        threads = threading.active_count()
+        pairs = [socket.socketpair() for _ in range(50)]
+        received = []
+        devices = []
+        for near, far in pairs:
+            device = SocketDevice(near).open(reactor=reactor)
+            device.subscribe(
+                name="test", call_back=lambda pkt: received.append(pkt.payload)
+            )
+            devices.append(device)
+        self.assertEqual(threading.active_count(), threads)
+        try:
+            for n, (near, far) in enumerate(pairs):
+                # Split lines arrive whole, several lines in one read come apart
+                far.sendall(b"dev%d:a\r\ndev%d:" % (n, n))
+                far.sendall(b"b\n")
+            self.assertTrue(wait_for(lambda: len(received) == 100))
+            self.assertIn("dev7:a\r\n", received)
+            self.assertIn("dev7:b\n", received)
+
+            sent = []
+            devices[3].subscribe(
+                name="tx",
+                call_back=lambda pkt: sent.append(pkt.payload),
+                event=devices[3].TX_EVENT,
+            )
+            devices[3].send("ping\n")
+            pairs[3][1].settimeout(2)
+            self.assertEqual(pairs[3][1].recv(64), b"ping\n")
+            self.assertTrue(wait_for(lambda: sent == ["ping\n"]))
+
+            # Peer hang-up drops the device from the selector only
+            pairs[0][1].close()
+            pairs[1][1].sendall(b"still here\n")
+            self.assertTrue(wait_for(lambda: "still here\n" in received))
+            self.assertEqual(reactor.stats()[0]["errors"], 0)
+        finally:
+            for device in devices:
+                device.close()
+            for near, far in pairs:
+                far.close()
+        self.assertEqual(reactor.stats()[0]["devices"], 0)
+        reactor.stop()
+
+    def test_call_timeout(self):
+        reactor = Reactor()
+        loop = reactor._loops[0]
+        try:
+            loop.call_soon(time.sleep, 0.3)
+            with self.assertRaises(builtins.TimeoutError):
+                loop.call(int, timeout=0.05)
+        finally:
+            reactor.stop()
+
+    def test_stalled_peer(self):
+        reactor = Reactor()
+        (stuck_near, stuck_far), (near, far) = socket.socketpair(), socket.socketpair()
+        stuck = SocketDevice(stuck_near).open(reactor=reactor)
+        device = SocketDevice(near).open(reactor=reactor)
+        sent = []
+        stuck.subscribe(
+            name="tx", call_back=lambda pkt: sent.append(pkt), event=stuck.TX_EVENT
+        )
+        line = "x" * 1023 + "\n"
+        try:
+            # Far more than the socket buffers hold, and nobody reads it
+            for _ in range(4096):
+                stuck.send(line)
+            device.send("ping\n")
+            far.settimeout(2)
+            self.assertEqual(far.recv(64), b"ping\n")
+            self.assertLess(len(sent), 4096)
+
+            # Draining the peer lets the rest go out
+            received = 0
+            stuck_far.settimeout(2)
+            while received < 4096 * 1024:
+                received += len(stuck_far.recv(1 << 16))
+            self.assertTrue(wait_for(lambda: len(sent) == 4096))
+            self.assertEqual(reactor.stats()[0]["errors"], 0)
+        finally:
+            stuck.close()
+            device.close()
+            stuck_far.close()
+            far.close()
+            reactor.stop()
+
+    def test_binary_framer(self):
+        near, far = socket.socketpair()
+        device = SocketDevice(near, framer=COBSFramer())
+        received = []
+        device.subscribe(
+            name="test", call_back=lambda pkt: received.append(pkt.payload)
+        )
+        payloads = [b"\x00\x01\x02", b"\n" * 300, b""]
+        encoded = b"".join(map(device.framer.encode, payloads))
+        device.open()
+        try:
+            # Threaded input: frames split across reads
+            far.sendall(encoded[:5])
+            time.sleep(0.02)
+            far.sendall(encoded[5:])
+            self.assertTrue(wait_for(lambda: len(received) == 3))
+            self.assertEqual(received, payloads)
+        finally:
+            far.close()
+            device.close()
+
+    def test_thread_pool(self):
+        reactor = Reactor(threads=3)
+        pairs = [socket.socketpair() for _ in range(6)]
+        devices = [SocketDevice(near).open(reactor=reactor) for near, far in pairs]
+        self.assertEqual([loop["devices"] for loop in reactor.stats()], [2, 2, 2])
+        for device in devices:
+            device.close()
+        for near, far in pairs:
+            far.close()
+        reactor.stop()
+
+
+def responder(sock, latency, reply=lambda line: line, reverse=False):
+    """Answer every line read from sock after `latency` seconds, pipelined:
+    each line's reply is due `latency` after it arrived.  With reverse,
+    replies to lines that arrived together go out in reverse order."""
+    buffered = b""
+    while True:
+        try:
+            data = sock.recv(65536)
+        except OSError:
+            # Closed by tearDown
+            return
+        if not data:
+            return
+        buffered += data
+        lines = buffered.split(b"\n")
+        buffered = lines.pop()
+        due = time.monotonic() + latency
+        if reverse:
+            lines.reverse()
+        time.sleep(max(due - time.monotonic(), 0))
+        try:
+            sock.sendall(b"".join(reply(line) + b"\n" for line in lines))
+        except OSError:
+            return
+
+
+class QueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.near, self.far = socket.socketpair()
+        self.device = SocketDevice(self.near, framer=LineFramer())
+        self.device.open()
+
+    def tearDown(self):
+        self.device.close()
+        self.far.close()
+
+    def start_responder(self, **kwargs):
+        thread = threading.Thread(
+            target=responder, args=(self.far, 0.02), kwargs=kwargs
+        )
+        thread.daemon = True
+        thread.start()
+
+    def test_fifo_pipelined(self):
+        self.start_responder(reply=lambda line: b"re:" + line)
+        start = time.monotonic()
+        futures = [self.device.query("q%d\n" % n) for n in range(8)]
+        replies = [future.result(timeout=2) for future in futures]
+        elapsed = time.monotonic() - start
+        self.assertEqual(replies, ["re:q%d\n" % n for n in range(8)])
+        # Eight round trips of 20 ms overlap instead of adding up
+        self.assertLess(elapsed, 0.1)
+        self.assertEqual(self.device.query_stats()["answered"], 8)
+
+    def test_keyed_out_of_order_and_timeout(self):
+        self.device.correlate(key=lambda msg: msg.split(":")[0].strip(), in_flight=4)
+        self.start_responder(reply=lambda line: line + b":ok", reverse=True)
+        futures = [self.device.query("id%d\n" % n) for n in range(4)]
+        self.assertEqual(
+            [future.result(timeout=2) for future in futures],
+            ["id%d:ok\n" % n for n in range(4)],
+        )
+
+        self.device.correlate(key=lambda msg: msg.split(":")[0].strip(), in_flight=1)
+        lost = self.device.query("lost\n", timeout=0.05, key="never")
+        self.assertRaises(TimeoutError, lost.result, timeout=2)
+        # The slot came back
+        self.assertEqual(self.device.query("id9\n").result(timeout=2), "id9:ok\n")
+        self.assertEqual(self.device.query_stats()["expired"], 1)
+
+    def test_fifo_late_reply_dropped(self):
+        self.far.settimeout(2)
+        lost = self.device.query("A?\n", timeout=0.05)
+        self.assertRaises(TimeoutError, lost.result, timeout=2)
+        future = self.device.query("B?\n")
+        self.assertTrue(
+            wait_for(lambda: self.far.recv(1024, socket.MSG_PEEK) == b"A?\nB?\n")
+        )
+        self.far.sendall(b"reply-to-A\nreply-to-B\n")
+        self.assertEqual(future.result(timeout=2), "reply-to-B\n")
+        stats = self.device.query_stats()
+        self.assertEqual((stats["expired"], stats["late"], stats["pending"]), (1, 1, 0))
+
+    def test_submit_keeps_wire_order(self):
+        correlator = Correlator()
+        wire = []
+        first_sending = threading.Event()
+
+        def send(cmd):
+            if cmd == "A":
+                first_sending.set()
+                # B is submitted while A is still being sent
+                time.sleep(0.1)
+            wire.append(cmd)
+
+        futures = {}
+        thread = threading.Thread(
+            target=lambda: futures.setdefault("A", correlator.submit("A", send))
+        )
+        thread.start()
+        self.assertTrue(first_sending.wait(timeout=2))
+        futures["B"] = correlator.submit("B", send)
+        thread.join(timeout=2)
+        self.assertEqual(wire, ["A", "B"])
+        correlator.match(["re:A", "re:B"])
+        self.assertEqual(futures["A"].result(timeout=1), "re:A")
+        self.assertEqual(futures["B"].result(timeout=1), "re:B")
+
+    def test_key_errors_leave_reading_alive(self):
+        self.device.correlate(key=lambda msg: json.loads(msg)["id"])
+        received = []
+        self.device.subscribe(name="rx", call_back=lambda pkt: received.append(pkt))
+        future = self.device.query('{"id": 1}\n', timeout=2)
+        self.far.settimeout(2)
+        # An unsolicited line the key cannot parse comes first
+        self.far.sendall(b"noise\n" + self.far.recv(1024))
+        self.assertEqual(future.result(timeout=2), '{"id": 1}\n')
+        self.assertEqual(self.device.query_stats()["key_errors"], 1)
+        self.assertTrue(wait_for(lambda: len(received) == 2))
+        # A bad request side key fails only its own query
+        self.assertRaises(json.JSONDecodeError, self.device.query("x\n").result, 1)
+        self.assertEqual(self.device.query_stats()["pending"], 0)
+
+
+class FlakyDevice(SocketDevice):
+    """Fails the send of one given line once; survives close() for reopening."""
+
+    def __init__(self, sock, fail):
+        sock.settimeout(0.02)
+        super(FlakyDevice, self).__init__(sock)
+        self.fail = fail
+
+    def _send(self, data):
+        if data == self.fail:
+            self.fail = None
+            raise ConnectionResetError("send failed")
+        super(FlakyDevice, self)._send(data)
+
+    def _recv(self, size=1024):
+        try:
+            return self._socket.recv(size)
+        except socket.timeout:
+            return None
+
+    def _close(self):
+        pass
+
+
+class ReopenDevice(FlakyDevice):
+    """FlakyDevice that gets its read timeout back off a Reactor."""
+
+    def _set_blocking(self, flag):
+        self._socket.settimeout(0.02 if flag else 0)
+
+
+class ReopenTestCase(unittest.TestCase):
+    def test_reactor_then_threads(self):
+        reactor = Reactor()
+        near, far = socket.socketpair()
+        device = ReopenDevice(near, fail=None)
+        received = []
+        device.subscribe(name="test", call_back=lambda pkt: received.append(pkt))
+        try:
+            device.open(reactor=reactor)
+            far.sendall(b"line\n")
+            self.assertTrue(wait_for(lambda: len(received) == 1))
+            device.close()
+            # The reactor's line framer does not stick to the device
+            self.assertIsNone(device.framer)
+            device.open()
+            far.sendall(b"raw")
+            self.assertTrue(wait_for(lambda: len(received) == 2))
+            self.assertEqual(device.metrics()["rx_bytes"], 8)
+        finally:
+            device.close()
+            reactor.stop()
+            near.close()
+            far.close()
+
+
+class SendFailureTestCase(unittest.TestCase):
+    def test_unsent_items_kept_for_reconnect(self):
+        near, far = socket.socketpair()
+        device = FlakyDevice(near, fail="c\n")
+        sent = []
+        device.subscribe(
+            name="tx",
+            call_back=lambda pkt: sent.append(pkt.payload),
+            event=device.TX_EVENT,
+        )
+        lines = ["%s\n" % c for c in "abcde"]
+        # Queued before open() so one batch holds them all
+        for line in lines:
+            device.send(line)
+        far.settimeout(2)
+        try:
+            device.open()
+            self.assertTrue(wait_for(lambda: not device.connected))
+            # What went out before the failure is still posted
+            self.assertEqual(sent, lines[:2])
+            device.close()
+            device.open()
+            received = b""
+            while len(received) < 10:
+                received += far.recv(1024)
+            self.assertEqual(received.decode(), "".join(lines))
+            self.assertTrue(wait_for(lambda: sent == lines))
+        finally:
+            device.close()
+            near.close()
+            far.close()
+
+
+class QuietTCP(AsyncTCPHelper):
+    def debug_on(self, *args, **kwargs):
+        pass
+
+
+class QuietUDP(AsyncUDPHelper):
+    def debug_on(self, *args, **kwargs):
+        pass
+
+
+class QuietSerial(AsyncSerialHelper):
+    def debug_on(self, *args, **kwargs):
+        pass
+
+
+async def echo(reader, writer):
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        writer.write(line)
+    writer.close()
+
+
+async def slow_echo(reader, writer):
+    # Echoes "slow" lines 0.2 s late, the rest at once
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if line.startswith(b"slow"):
+            await asyncio.sleep(0.2)
+        writer.write(line)
+    writer.close()
+
+
+class EchoUDP(asyncio.DatagramProtocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.transport.sendto(data, addr)
+
+
+class AsyncDeviceTestCase(unittest.TestCase):
+    def test_tcp_against_echo_server(self):
+        async def run():
+            server = await asyncio.start_server(echo, "127.0.0.1", 0)
+            address = "127.0.0.1:%d" % server.sockets[0].getsockname()[1]
+            received = []
+            async with QuietTCP(address, timeout=2) as dev:
+                dev.subscribe(
+                    name="test", call_back=lambda pkt: received.append(pkt.payload)
+                )
+                self.assertEqual(await dev.query("*IDN?"), "*IDN?\r\n")
+                # The encoded line, EOL included
+                self.assertEqual(dev.metrics()["tx_bytes"], len(b"*IDN?\r\n"))
+                await dev.send("a\nb\n")
+                iterated = []
+                async for msg in dev:
+                    iterated.append(msg)
+                    if msg == "b\n":
+                        break
+            self.assertFalse(dev.continue_thread)
+            # Opened and closed: the iterator ends instead of waiting
+            self.assertEqual([msg async for msg in dev], [])
+
+            threads = threading.active_count()
+            devs = [QuietTCP(address, timeout=2) for _ in range(200)]
+            await asyncio.gather(*(dev.aopen() for dev in devs))
+            self.assertEqual(threading.active_count(), threads)
+            replies = await asyncio.gather(
+                *(dev.query("dev%d" % n) for n, dev in enumerate(devs))
+            )
+            await asyncio.gather(*(dev.aclose() for dev in devs))
+            server.close()
+            await server.wait_closed()
+            return received, iterated, replies
+
+        received, iterated, replies = asyncio.run(run())
+        self.assertEqual(received, ["*IDN?\r\n", "a\n", "b\n"])
+        self.assertEqual(iterated, ["*IDN?\r\n", "a\n", "b\n"])
+        self.assertEqual(replies, ["dev%d\r\n" % n for n in range(200)])
+
+    def test_failed_query_send(self):
+        async def run():
+            server = await asyncio.start_server(echo, "127.0.0.1", 0)
+            address = "127.0.0.1:%d" % server.sockets[0].getsockname()[1]
+            async with QuietTCP(address, timeout=2) as dev:
+                write = dev._write
+
+                def fail(data):
+                    dev._write = write
+                    raise ConnectionResetError("write failed")
+
+                dev._write = fail
+                with self.assertRaises(ConnectionResetError):
+                    await dev.query("lost")
+                # The failed query does not take the next reply
+                reply = await dev.query("next", timeout=1)
+            server.close()
+            await server.wait_closed()
+            return reply
+
+        self.assertEqual(asyncio.run(run()), "next\r\n")
+
+    def test_timed_out_query_late_reply(self):
+        async def run():
+            server = await asyncio.start_server(slow_echo, "127.0.0.1", 0)
+            address = "127.0.0.1:%d" % server.sockets[0].getsockname()[1]
+            async with QuietTCP(address, timeout=2) as dev:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await dev.query("slow", timeout=0.05)
+                # "slow" is echoed first and must not answer this one
+                reply = await dev.query("fast", timeout=1)
+                late = dev.query_stats()["late"]
+            server.close()
+            await server.wait_closed()
+            return reply, late
+
+        self.assertEqual(asyncio.run(run()), ("fast\r\n", 1))
+
+    def test_query_correlated(self):
+        async def run():
+            server = await asyncio.start_server(echo, "127.0.0.1", 0)
+            address = "127.0.0.1:%d" % server.sockets[0].getsockname()[1]
+            async with QuietTCP(address, timeout=2) as dev:
+                dev.correlate(key=lambda msg: msg.split(":")[0], in_flight=2)
+                # More queries than slots: the rest wait for one off the loop
+                replies = await asyncio.gather(
+                    *(dev.query("id%d:q" % n) for n in range(6))
+                )
+                answered = dev.query_stats()["answered"]
+                rtt = dev.metrics()["rtt"]
+            server.close()
+            await server.wait_closed()
+            return replies, answered, rtt["count"]
+
+        self.assertEqual(
+            asyncio.run(run()), (["id%d:q\r\n" % n for n in range(6)], 6, 6)
+        )
+
+    def test_udp_against_echo_server(self):
+        async def run():
+            loop = asyncio.get_running_loop()
+            server, _ = await loop.create_datagram_endpoint(
+                EchoUDP, local_addr=("127.0.0.1", 0)
+            )
+            address = "127.0.0.1:%d" % server.get_extra_info("sockname")[1]
+            async with QuietUDP(address, timeout=2) as dev:
+                reply = await dev.query(b"ping")
+                server.close()
+                try:
+                    await dev.query(b"lost", timeout=0.05)
+                    timed_out = False
+                except asyncio.TimeoutError:
+                    timed_out = True
+            return reply, timed_out
+
+        self.assertEqual(asyncio.run(run()), ("ping", True))
+
+    @unittest.skipIf(serial is None or not hasattr(os, "openpty"), "needs pyserial")
+    def test_serial_over_pty(self):
+        async def run():
+            controller, peripheral = os.openpty()
+            async with QuietSerial(os.ttyname(peripheral), timeout=2) as dev:
+                os.write(controller, b"hello\r\n")
+                msg = await dev.__anext__()
+                await dev.send("reply")
+                await asyncio.sleep(0.05)
+                written = os.read(controller, 64)
+            os.close(controller)
+            os.close(peripheral)
+            return msg, written
+
+        self.assertEqual(asyncio.run(run()), ("hello\r\n", b"reply\r\n"))
+
+
+class QuietTCPHelper(TCPHelper):
+    def debug_on(self, *args, **kwargs):
+        pass
+
+
+class LineEchoServer:
+    """Threaded TCP echo server that can drop every connection and refuse new
+    ones for a while, like a switch reboot."""
+
+    def __init__(self):
+        self.port = None
+        self.accepted = 0
+        self._conns = []
+        self._listener = None
+        self.listen()
+
+    def listen(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(("127.0.0.1", self.port or 0))
+        listener.listen(64)
+        self.port = listener.getsockname()[1]
+        self._listener = listener
+        thread = threading.Thread(target=self._accept, args=(listener,))
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self, listener):
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            self.accepted += 1
+            self._conns.append(conn)
+            thread = threading.Thread(target=self._echo, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _echo(self, conn):
+        try:
+            data = conn.recv(4096)
+            while data:
+                conn.sendall(data)
+                data = conn.recv(4096)
+        except OSError:
+            pass
+
+    def drop(self):
+        """Stop listening and reset every connection."""
+        # shutdown() first: close() alone does not wake the accept() call
+        try:
+            self._listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._listener.close()
+        conns, self._conns = self._conns, []
+        for conn in conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+    def close(self):
+        self.drop()
+
+
+class SlowOpenTCPHelper(QuietTCPHelper):
+    def open(self, reactor=None):
+        time.sleep(0.3)
+        return super(SlowOpenTCPHelper, self).open(reactor=reactor)
+
+
+class DevicePoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = LineEchoServer()
+        self.address = "127.0.0.1:%d" % self.server.port
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_async_devices(self):
+        # The sync open()/close() run the coroutines on shared_loop()
+        devices = [QuietTCP(self.address, timeout=2) for _ in range(3)]
+        pool = DevicePool(devices=devices, backoff=0.05, max_backoff=0.2)
+        try:
+            pool.open(timeout=2)
+            self.assertTrue(all(device.connected for device in devices))
+            self.server.drop()
+            self.assertTrue(wait_for(lambda: not any(d.connected for d in devices)))
+            self.server.listen()
+            self.assertTrue(
+                wait_for(lambda: all(s["reconnects"] for s in pool.stats()))
+            )
+            self.assertTrue(all(device.connected for device in devices))
+        finally:
+            pool.close()
+        self.assertFalse(any(device.connected for device in devices))
+
+    def test_reconnect_after_outage(self):
+        reactor = Reactor()
+        devices = [QuietTCPHelper(self.address) for _ in range(20)]
+        pool = DevicePool(
+            devices=devices, reactor=reactor, backoff=0.05, max_backoff=0.2
+        )
+        received = []
+        devices[0].subscribe(
+            name="test", call_back=lambda pkt: received.append(pkt.payload)
+        )
+        try:
+            pool.open(timeout=2)
+            self.assertTrue(all(device.connected for device in devices))
+            devices[0].send("before\n")
+            self.assertTrue(wait_for(lambda: received == ["before\n"]))
+
+            # Everything drops and the server is gone for a moment
+            self.server.drop()
+            self.assertTrue(wait_for(lambda: not any(d.connected for d in devices)))
+            time.sleep(0.3)
+            self.server.listen()
+            self.assertTrue(
+                wait_for(lambda: all(s["reconnects"] for s in pool.stats()))
+            )
+            self.assertTrue(all(device.connected for device in devices))
+
+            # Same device object, same subscriber
+            devices[0].send("after\n")
+            self.assertTrue(wait_for(lambda: received[-1:] == ["after\n"]))
+            stats = pool.stats()
+            self.assertEqual(len(stats), 20)
+            for stat in stats:
+                self.assertEqual(stat["device"], self.address)
+                self.assertEqual((stat["reconnects"], stat["losses"]), (1, 1))
+                self.assertGreater(stat["failures"], 0)
+                self.assertTrue(0 < stat["availability"] < 1)
+        finally:
+            pool.close()
+            reactor.stop()
+
+    def test_close_during_open(self):
+        device = SlowOpenTCPHelper(self.address)
+        pool = DevicePool(devices=[device])
+        pool.open(timeout=0.05)
+        # The open is still running and finishes after close()
+        pool.close()
+        time.sleep(0.4)
+        self.assertFalse(device.connected)
+        self.assertFalse(device.continue_thread)
+        self.assertEqual(pool.stats()[0]["opens"], 0)
+
+    def test_probe_failure_and_failed_open(self):
+        self.server.drop()
+        device = QuietTCPHelper(self.address)
+        healthy = [True]
+        pool = DevicePool(
+            devices=[device],
+            probe=lambda dev: healthy[0],
+            interval=0.05,
+            backoff=0.05,
+            max_backoff=0.1,
+        )
+        try:
+            pool.open(timeout=2)
+            self.assertFalse(device.connected)
+            self.server.listen()
+            self.assertTrue(wait_for(lambda: device.connected))
+            accepted = self.server.accepted
+
+            healthy[0] = False
+            self.assertTrue(wait_for(lambda: pool.stats()[0]["probe_failures"]))
+            healthy[0] = True
+            self.assertTrue(wait_for(lambda: self.server.accepted > accepted))
+            self.assertTrue(wait_for(lambda: pool.stats()[0]["reconnects"] == 1))
+            self.assertTrue(device.connected)
+        finally:
+            pool.close()
+        self.assertFalse(device.connected)
+
+
+class CoalesceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = LineEchoServer()
+        self.device = QuietTCPHelper("127.0.0.1:%d" % self.server.port)
+        self.received = []
+        self.sent = []
+        self.device.subscribe(
+            name="rx", call_back=lambda pkt: self.received.append(pkt.payload)
+        )
+        self.device.subscribe(
+            name="tx",
+            call_back=lambda pkt: self.sent.append(pkt.payload),
+            event=self.device.TX_EVENT,
+        )
+
+    def tearDown(self):
+        self.device.close()
+        self.server.close()
+
+    def test_window_and_byte_budget(self):
+        lines = ["line%02d\n" % n for n in range(50)]
+        self.device.coalesce(window=0.05).open()
+        for line in lines:
+            self.device.send(line)
+        self.assertTrue(wait_for(lambda: len(self.received) == 50))
+        self.assertEqual("".join(self.received), "".join(lines))
+        # Every item still gets its own TX event
+        self.assertTrue(wait_for(lambda: self.sent == lines))
+        stats = self.device.coalesce_stats(reset=True)
+        self.assertEqual((stats["items"], stats["bytes"]), (50, 350))
+        self.assertLessEqual(stats["writes"], 5)
+
+        # 64 byte budget: at most 9 seven-byte lines per write
+        self.device.coalesce(window=0.05, max_bytes=64)
+        for line in lines:
+            self.device.send(line)
+        self.assertTrue(wait_for(lambda: len(self.received) == 100))
+        stats = self.device.coalesce_stats()
+        self.assertGreaterEqual(stats["writes"], 6)
+        self.assertLessEqual(stats["items_per_write"]["max"], 9)
+
+
+class BinaryModeTestCase(unittest.TestCase):
+    def test_bytes_end_to_end(self):
+        server = LineEchoServer()
+        device = QuietTCPHelper("127.0.0.1:%d" % server.port, binary=True)
+        raw, text, batches = [], [], []
+        # Subscribers before and after the text one see the bytes untouched
+        device.subscribe(name="raw", call_back=lambda pkt: raw.append(pkt.payload))
+        device.subscribe(
+            name="text",
+            call_back=lambda pkt: text.append(pkt.payload),
+            encoding="latin-1",
+        )
+        device.subscribe(
+            name="batch",
+            call_back=lambda pkt: batches.append(pkt.payload),
+            batch=True,
+            encoding="ascii",
+        )
+        device.subscribe(name="raw2", call_back=lambda pkt: raw.append(pkt.payload))
+        try:
+            device.open()
+            device.send(b"\x00\xff\x10")
+            self.assertTrue(wait_for(lambda: len(raw) == 2))
+            self.assertEqual(raw, [b"\x00\xff\x10\n"] * 2)
+            self.assertEqual(text, ["\x00\xff\x10\n"])
+            self.assertEqual(batches, [["\x00\ufffd\x10\n"]])
+        finally:
+            device.close()
+            server.close()
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_counters_and_scrape(self):
+        near, far = socket.socketpair()
+        device = SocketDevice(near, framer=LineFramer()).correlate()
+        device.time_subscribers()
+        received = []
+        device.subscribe(name="sink", call_back=lambda pkt: received.append(pkt))
+        device.open()
+        thread = threading.Thread(target=responder, args=(far, 0.01), daemon=True)
+        thread.start()
+        server = MetricsServer(sources=[device], port=0).start()
+        try:
+            for n in range(3):
+                self.assertEqual(
+                    device.query("q%d\n" % n).result(timeout=2), "q%d\n" % n
+                )
+            self.assertTrue(wait_for(lambda: len(received) == 3))
+            snap = device.metrics()
+            self.assertEqual((snap["tx_msgs"], snap["tx_bytes"]), (3, 9))
+            self.assertEqual((snap["rx_msgs"], snap["rx_bytes"]), (3, 9))
+            self.assertEqual(snap["tx_errors"], 0)
+            self.assertEqual(snap["rtt"]["count"], 3)
+            self.assertGreaterEqual(snap["rtt"]["sum"], 0.03)
+            # Neither resetting query_stats() nor a new correlate() rewinds it
+            device.query_stats(reset=True)
+            device.correlate()
+            self.assertEqual(device.metrics()["rtt"]["count"], 3)
+            self.assertTrue(
+                wait_for(lambda: device.metrics()["dispatch"][device.RX_EVENT])
+            )
+
+            with urlopen(server.url, timeout=2) as response:
+                text = response.read().decode()
+            labels = 'device="%s",kind="SocketDevice"' % device.bus_id
+            self.assertIn("comm_rx_messages_total{%s} 3" % labels, text)
+            self.assertIn("comm_tx_bytes_total{%s} 9" % labels, text)
+            self.assertIn(
+                'comm_query_rtt_seconds_bucket{%s,le="+Inf"} 3' % labels, text
+            )
+            self.assertIn("comm_query_rtt_seconds_count{%s} 3" % labels, text)
+            self.assertIn(
+                'comm_dispatch_seconds_count{%s,event="%s",subscriber="sink"}'
+                % (labels, device.RX_EVENT),
+                text,
+            )
+        finally:
+            server.stop()
+            device.close()
+            far.close()
+
+
+class CaptureTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "dev.cap")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_capture_round_trip(self):
+        near, far = socket.socketpair()
+        device = SocketDevice(near, framer=LineFramer())
+        received = []
+        device.subscribe(name="sink", call_back=lambda pkt: received.append(pkt))
+        device.capture(self.path).open()
+        thread = threading.Thread(target=responder, args=(far, 0), daemon=True)
+        thread.start()
+        try:
+            device.send("a\n")
+            device.send("b\n")
+            self.assertTrue(wait_for(lambda: len(received) == 2))
+        finally:
+            device.close()
+            far.close()
+        self.assertEqual(device.capture_stats()["records"], 4)
+        device.capture(None)
+        records = list(read_capture(self.path))
+        self.assertEqual(
+            sorted((direction, payload) for _, direction, payload in records),
+            [("rx", "a\n"), ("rx", "b\n"), ("tx", "a\n"), ("tx", "b\n")],
+        )
+        stamps = [stamp for stamp, _, _ in records]
+        self.assertEqual(stamps, sorted(stamps))
+
+    def test_mmap_bytes_exact(self):
+        frames = [bytes(range(256)), b"", b"\x00\r\n" * 100]
+        writer = CaptureWriter(self.path, mmap=True, mmap_size=64)
+        writer.write(RX, frames, stamp=1)
+        writer.write(TX, ["t\u00e9xt"], stamp=2)
+        writer.close()
+        self.assertEqual(
+            list(read_capture(self.path)),
+            [(1, "rx", frame) for frame in frames] + [(2, "tx", "t\u00e9xt")],
+        )
+
+    def test_replay_speed(self):
+        writer = CaptureWriter(self.path)
+        for n in range(5):
+            # 50 ms apart
+            writer.write(RX, [b"m%d\n" % n], stamp=1 + n * 50000000)
+        writer.write(TX, [b"cmd\n"], stamp=1 + 5 * 50000000)
+        writer.close()
+
+        near, far = socket.socketpair()
+        device = SocketDevice(near, framer=LineFramer())
+        rx, tx = [], []
+        device.subscribe(name="rx", call_back=lambda pkt: rx.append(pkt.payload))
+        device.subscribe(
+            name="tx",
+            call_back=lambda pkt: tx.append(pkt.payload),
+            event=device.TX_EVENT,
+        )
+        try:
+            replay = device.replay(self.path, speed=1.0)
+            self.assertTrue(replay.wait(timeout=2))
+            self.assertGreaterEqual(replay.stats()["seconds"], 0.19)
+            self.assertEqual(rx, [b"m%d\n" % n for n in range(5)])
+            self.assertEqual(device.metrics()["rx_msgs"], 5)
+
+            replay = device.replay(self.path, speed=10, tx=True)
+            self.assertTrue(replay.wait(timeout=2))
+            self.assertLess(replay.stats()["seconds"], 0.15)
+            self.assertEqual(tx, [b"cmd\n"])
+
+            replay = device.replay(self.path, speed=0)
+            self.assertTrue(replay.wait(timeout=2))
+            self.assertEqual(replay.stats()["records"], 5)
+            self.assertEqual(len(rx), 15)
+        finally:
+            near.close()
+            far.close()
+
+
+class TimeoutDevice(SocketDevice):
+    """Reads time out empty after 20 ms, as an idle serial port's do."""
+
+    EOF_ON_EMPTY_READ = False
+
+    def _recv_into(self, buffer):
+        try:
+            return self._socket.recv_into(buffer)
+        except socket.timeout:
+            return 0
+
+
+class IdleReadTestCase(unittest.TestCase):
+    def test_timeouts_are_not_eof(self):
+        near, far = socket.socketpair()
+        near.settimeout(0.02)
+        device = TimeoutDevice(near, framer=LineFramer())
+        states, received = [], []
+        device.subscribe(
+            name="state",
+            call_back=lambda pkt: states.append(pkt.payload),
+            event=device.STATE_EVENT,
+        )
+        device.subscribe(name="sink", call_back=lambda pkt: received.append(pkt))
+        device.open()
+        try:
+            time.sleep(0.2)
+            self.assertTrue(device.connected)
+            far.sendall(b"late\n")
+            self.assertTrue(wait_for(lambda: len(received) == 1))
+            self.assertEqual(states, [{"connected": True, "error": None}])
+        finally:
+            device.close()
+            far.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,6 +19,9 @@
 import unittest
 import sys
 import os
+import re
+import threading
+import time
 
 current = os.path.dirname(os.path.realpath(__file__))
 parent = os.path.dirname(current)
@@ -26,12 +29,190 @@ parent = os.path.dirname(current)
 sys.path.append(parent)
 
 import event_handler
+from event_handler.event_handler import EventHandler
+from event_handler.packet import Packet
+from event_handler.event_bus import EventBus
 
 
 class MyTestCase(unittest.TestCase):
     def test_something(self):
         self.assertEqual(True, True)  # add assertion here
 
+    def test_post_many(self):
+        received = {"legacy": [], "batch": []}
+        eventer = EventHandler(src="test", event="testEvent")
+        eventer.subscribe(
+            name="legacy",
+            on_event=lambda pkt: received["legacy"].append(pkt["payload"]),
+        )
+        eventer.subscribe(
+            name="batch",
+            on_event=lambda pkt: received["batch"].append(pkt["payload"]),
+            batch=True,
+        )
+        eventer.post_many(payloads=["a", "b"])
+        self.assertEqual(received["legacy"], ["a", "b"])
+        self.assertEqual(received["batch"], [["a", "b"]])
+
+    def test_packet_is_dict_compatible(self):
+        seen = []
+        eventer = EventHandler(src="test", event="testEvent", channel=7)
+        eventer.subscribe(name="a", on_event=seen.append, cookie="ca")
+        eventer.subscribe(name="b", on_event=lambda pkt: seen.append(pkt.copy()))
+        eventer.post(payload="x", qos=1)
+        pkt = seen[1]
+        self.assertEqual(
+            pkt,
+            {
+                "event": "testEvent",
+                "src": "test",
+                "dest": "b",
+                "payload": "x",
+                "cookie": None,
+                "channel": 7,
+                "qos": 1,
+            },
+        )
+        # The packet itself is recycled once post() returns
+        self.assertIsInstance(seen[0], Packet)
+        self.assertIsNone(seen[0]["payload"])
+        eventer.post(payload="y")
+        self.assertIs(seen[2], seen[0])
+        self.assertNotIn("qos", seen[2])
+
+        eventer.unsubscribe(name="a")
+        eventer.post(payload="z")
+        self.assertEqual(seen[-1]["payload"], "z")
+        self.assertEqual(len(seen), 5)
+
+    def test_dispatch_async_lanes(self):
+        gate = threading.Event()
+        slow, fast = [], []
+        eventer = EventHandler(src="test", event="testEvent")
+        eventer.subscribe(
+            name="slow", on_event=lambda pkt: gate.wait(2) and slow.append(pkt)
+        )
+        eventer.subscribe(name="fast", on_event=fast.append)
+        eventer.dispatch_async(backlog=20)
+        eventer.post_many(payloads=list(range(10)))
+        # The blocked subscriber holds up neither the poster nor the other lane
+        for payload in range(10, 40):
+            self.assertTrue(eventer._lane_map["fast"].join(timeout=2))
+            eventer.post(payload=payload)
+        self.assertTrue(eventer._lane_map["fast"].join(timeout=2))
+        self.assertEqual([pkt["payload"] for pkt in fast], list(range(40)))
+        gate.set()
+        self.assertTrue(eventer.join(timeout=2))
+        # slow's first batch was in flight; its backlog then kept the newest 20
+        self.assertEqual(
+            [pkt["payload"] for pkt in slow], list(range(10)) + list(range(20, 40))
+        )
+        stats = eventer.lane_stats()
+        self.assertEqual(stats["slow"]["dropped"], 10)
+        self.assertEqual(stats["fast"]["dispatched"], 40)
+        self.assertEqual(stats["fast"]["lag"]["count"], 40)
+
+        eventer.dispatch_async(enable=False)
+        eventer.post(payload="inline")
+        self.assertEqual(len(fast), 41)
+
+    def test_where_filters(self):
+        seen = {}
+
+        def collect(pkt):
+            seen.setdefault(pkt.dest, []).append(pkt.payload)
+
+        eventer = EventHandler(src="test", event="testEvent")
+        eventer.subscribe(name="all", on_event=collect)
+        eventer.subscribe(name="gps", on_event=collect, where=["$GPGGA", "$GPRMC"])
+        eventer.subscribe(name="nmea", on_event=collect, where="$GP")
+        eventer.subscribe(name="err", on_event=collect, where=re.compile(r"ERR\d"))
+        eventer.subscribe(name="id7", on_event=collect, where={"id": 7, "ok": True})
+        eventer.subscribe(name="batch", on_event=collect, batch=True, where=b"$GP")
+        payloads = [
+            "$GPGGA,1",
+            b"$GPVTG,2",
+            "boot ERR3",
+            '{"id": 7, "ok": true}',
+            {"id": 7, "ok": False},
+            "$GPRMC,3",
+        ]
+        eventer.post_many(payloads=payloads)
+        eventer.post(payload={"id": 7, "ok": True})
+        self.assertEqual(seen["all"], payloads + [{"id": 7, "ok": True}])
+        self.assertEqual(seen["gps"], ["$GPGGA,1", "$GPRMC,3"])
+        self.assertEqual(seen["nmea"], ["$GPGGA,1", b"$GPVTG,2", "$GPRMC,3"])
+        self.assertEqual(seen["err"], ["boot ERR3"])
+        self.assertEqual(seen["id7"], ['{"id": 7, "ok": true}', {"id": 7, "ok": True}])
+        self.assertEqual(seen["batch"], [["$GPGGA,1", b"$GPVTG,2", "$GPRMC,3"]])
+
+    def test_throttled_subscribers(self):
+        seen = {"rate": [], "latest": [], "debounce": []}
+        eventer = EventHandler(src="test", event="testEvent")
+        for name, options in (
+            ("rate", {"max_rate": 5}),
+            ("latest", {"max_rate": 20, "latest_only": True}),
+            ("debounce", {"debounce": 0.05}),
+        ):
+            eventer.subscribe(
+                name=name,
+                on_event=lambda pkt: seen[pkt.dest].append(pkt.payload),
+                **options,
+            )
+        for payload in range(10):
+            eventer.post(payload=payload)
+        # Trailing deliveries run on the shared wheel, which may be busy
+        deadline = time.monotonic() + 2
+        while not (seen["latest"] and seen["debounce"]):
+            if time.monotonic() > deadline:
+                break
+            time.sleep(0.01)
+        self.assertEqual(seen["rate"], [0])
+        self.assertEqual(seen["latest"], [9])
+        self.assertEqual(seen["debounce"], [9])
+        stats = eventer.throttle_stats()
+        self.assertEqual(stats["rate"]["suppressed"], 9)
+        self.assertEqual(stats["latest"]["suppressed"], 9)
+        self.assertEqual(
+            (stats["debounce"]["delivered"], stats["debounce"]["suppressed"]), (1, 9)
+        )
+
+    def test_event_bus_wildcards(self):
+        bus = EventBus()
+        self.assertIs(bus, EventBus())
+        seen = []
+        patterns = ("dev/serial/+/rx", "dev/#", "dev/+/ttyUSB0/#", "$SYS/#", "#")
+        for pattern in patterns:
+            bus.subscribe(
+                pattern=pattern,
+                name="t",
+                on_event=lambda pkt: seen.append(
+                    (pkt.event, pkt["topic"], pkt.payload)
+                ),
+            )
+        try:
+            rx = EventHandler(src="SerialHelper", event="SerialHelperInEvent")
+            rx.bridge(topic="dev/serial/ttyUSB0/rx")
+            rx.post_many(payloads=["a"])
+            self.assertEqual(
+                sorted(seen),
+                sorted(
+                    (pattern, "dev/serial/ttyUSB0/rx", "a")
+                    for pattern in ("dev/serial/+/rx", "dev/#", "dev/+/ttyUSB0/#", "#")
+                ),
+            )
+            seen.clear()
+            bus.publish("$SYS/up", "b")
+            bus.publish("dev", "c")
+            self.assertEqual(
+                sorted(seen),
+                [("#", "dev", "c"), ("$SYS/#", "$SYS/up", "b"), ("dev/#", "dev", "c")],
+            )
+            self.assertRaises(ValueError, bus.subscribe, "dev/#/rx", "x", print)
+        finally:
+            for pattern in patterns:
+                bus.unsubscribe(pattern=pattern, name="t")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,99 @@
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+import unittest
+import sys
+import os
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from framing import LineFramer, RegexFramer, LengthPrefixFramer
+from framing import SLIPFramer, COBSFramer, cobs_encode, cobs_decode
+
+PAYLOADS = [
+    b"",
+    b"\x00",
+    b"plain",
+    b"\xc0\xdb\xdc\xdd\x00\x00",
+    bytes(range(256)) * 3,
+    b"\x01" * 254,
+    b"\x01" * 254 + b"\x00",
+]
+
+
+def dribble(framer, data, size):
+    """Feed data in size byte chunks and collect every frame."""
+    frames = []
+    for start in range(0, len(data), size):
+        frames += framer.feed(data[start : start + size])
+    return frames
+
+
+class FramingTestCase(unittest.TestCase):
+    def test_binary_round_trips(self):
+        for framer_class in (LengthPrefixFramer, SLIPFramer, COBSFramer):
+            for size in (1, 3, 1000):
+                framer = framer_class(capacity=1024)
+                stream = b"".join(framer.encode(payload) for payload in PAYLOADS)
+                frames = dribble(framer, stream, size)
+                expected = PAYLOADS
+                if framer_class is SLIPFramer:
+                    # SLIP can not tell an empty frame from a frame boundary
+                    expected = [payload for payload in PAYLOADS if payload]
+                self.assertEqual(frames, expected, (framer_class.__name__, size))
+                self.assertEqual(framer.errors, 0)
+
+    def test_cobs(self):
+        self.assertEqual(cobs_encode(b"\x11\x22\x00\x33"), b"\x03\x11\x22\x02\x33")
+        self.assertEqual(cobs_encode(b"\x00"), b"\x01\x01")
+        for payload in PAYLOADS:
+            self.assertEqual(cobs_decode(cobs_encode(payload)), payload)
+        framer = COBSFramer()
+        self.assertEqual(framer.feed(b"\x05\x01\x00ok\x00\x02a\x00"), [b"a"])
+        self.assertEqual(framer.errors, 2)
+
+    def test_lines_and_regex(self):
+        framer = LineFramer(delim=b"\r\n")
+        self.assertEqual(framer.feed(b"ab\r"), [])
+        self.assertEqual(framer.feed(b"\ncd\r\nef"), ["ab\r\n", "cd\r\n"])
+        self.assertEqual(LineFramer(strip=True).feed(b"x\ny"), ["x"])
+        self.assertEqual(LineFramer(encoding=None).feed(b"x\n"), [b"x\n"])
+
+        # Lines longer than the ring come out in pieces
+        framer = LineFramer(capacity=8)
+        self.assertEqual(framer.feed(b"0123456789\n"), ["01234567", "89\n"])
+
+        framer = RegexFramer(rb"\r?\n|;")
+        self.assertEqual(framer.feed(b"a;b\r"), ["a;"])
+        self.assertEqual(framer.feed(b"\nc\n"), ["b\r\n", "c\n"])
+
+    def test_oversized_frames_resync(self):
+        framer = SLIPFramer(capacity=16)
+        self.assertEqual(framer.feed(b"x" * 20 + b"\xc0ok\xc0"), [b"ok"])
+        self.assertEqual(framer.errors, 1)
+        framer = LengthPrefixFramer(capacity=16)
+        self.assertEqual(framer.feed(b"\xff\xff" + b"x" * 8), [])
+        self.assertEqual(framer.errors, 1)
+        self.assertEqual(framer.feed(framer.encode(b"ok")), [b"ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
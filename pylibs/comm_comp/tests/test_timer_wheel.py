@@ -0,0 +1,225 @@
+#
+#  Copyright (c) 2021.  SandboxZilla
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+#  software and associated documentation files (the "Software"), to deal in the Software
+#  without restriction, including without limitation the rights to use, copy, modify,
+#  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+#  permit persons to whom the Software is furnished to do so.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+#  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+#  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+#  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+#  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+#  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+
+import unittest
+import sys
+import os
+import asyncio
+import threading
+import time
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+# append the path of the parent directory
+sys.path.append(parent)
+
+from event_handler import RepeatedTimer, TimerEvent, TimerWheel
+from event_handler import SKIP, FIRE_ALL, COALESCE
+from event_handler import AsyncRepeatedTimer, AsyncTimerEvent
+
+
+class TimerWheelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.wheel = TimerWheel(resolution=0.001)
+
+    def tearDown(self):
+        self.wheel.stop()
+
+    def test_one_shot_periodic_and_cancel(self):
+        fired = []
+        self.wheel.call_later(0.02, fired.append, "once")
+        # 400 ticks out: filed in the second level and cascaded down
+        self.wheel.call_later(0.4, fired.append, "late")
+        cancelled = self.wheel.call_later(0.03, fired.append, "cancelled")
+        periodic = self.wheel.call_every(0.05, fired.append, "tick")
+        cancelled.cancel()
+        self.assertEqual(len(self.wheel), 3)
+        time.sleep(0.27)
+        periodic.cancel()
+        time.sleep(0.2)
+        self.assertEqual(fired[0], "once")
+        self.assertEqual(fired[-1], "late")
+        self.assertIn(fired.count("tick"), (4, 5))
+        self.assertNotIn("cancelled", fired)
+        self.assertFalse(periodic.active)
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_thousands_of_timers_one_thread(self):
+        done = threading.Event()
+        fired = []
+
+        def fire(n):
+            fired.append(n)
+            if len(fired) == 2500:
+                done.set()
+
+        threads = threading.active_count()
+        timers = [
+            self.wheel.call_later(0.2 + 0.001 * (n % 300), fire, n) for n in range(5000)
+        ]
+        for timer in timers[1::2]:
+            timer.cancel()
+        self.assertLessEqual(threading.active_count(), threads + 1)
+        self.assertTrue(done.wait(timeout=2))
+        time.sleep(0.05)
+        self.assertEqual(sorted(fired), list(range(0, 5000, 2)))
+
+    def test_catch_up_policies(self):
+        def overrun(runs):
+            # Only the first run overshoots, by two and a half intervals
+            runs.append(time.monotonic())
+            if len(runs) == 1:
+                time.sleep(0.05)
+
+        results = {}
+        for policy in (SKIP, COALESCE, FIRE_ALL):
+            runs = []
+            timer = self.wheel.call_every(0.02, overrun, runs, catch_up=policy)
+            time.sleep(0.15)
+            timer.cancel()
+            stats = timer.stats()
+            self.assertEqual(stats["lateness"]["count"], stats["runs"])
+            self.assertEqual(stats["duration"]["count"], stats["runs"])
+            results[policy] = (stats["missed"], len(runs))
+        self.assertEqual(results[SKIP][0], 2)
+        self.assertEqual(results[COALESCE][0], 1)
+        self.assertEqual(results[FIRE_ALL][0], 0)
+        # Missed ticks are not run again, except under FIRE_ALL
+        self.assertLess(results[SKIP][1], results[FIRE_ALL][1])
+        self.assertRaises(
+            ValueError, self.wheel.call_every, 0.01, print, catch_up="bogus"
+        )
+
+    def test_idle_wheel_does_not_replay_ticks(self):
+        # 100 ns ticks: a 0.3 s idle spell is 3 million of them
+        wheel = TimerWheel(resolution=1e-7)
+        fired = threading.Event()
+        try:
+            wheel.call_later(0, fired.set)
+            self.assertTrue(fired.wait(timeout=2))
+            fired.clear()
+            time.sleep(0.3)
+            start = time.monotonic()
+            wheel.call_later(0.001, fired.set)
+            self.assertTrue(fired.wait(timeout=2))
+            # Stepping through the idle ticks one by one takes about a second
+            self.assertLess(time.monotonic() - start, 0.2)
+        finally:
+            wheel.stop()
+
+    def test_cancel_between_expire_and_fire(self):
+        fired = []
+        release = threading.Event()
+        # The first callback holds the wheel thread while the second, due in
+        # the same tick, has already been taken off the wheel
+        self.wheel.call_later(0.01, release.wait, 2)
+        late = self.wheel.call_later(0.01, fired.append, "late")
+        time.sleep(0.05)
+        late.cancel()
+        release.set()
+        time.sleep(0.05)
+        self.assertEqual(fired, [])
+
+
+class RepeatedTimerTestCase(unittest.TestCase):
+    def test_facades(self):
+        calls, posts = [], []
+        wheel = TimerWheel()
+        rt = RepeatedTimer(interval=0.02, target=calls.append, src="rt", wheel=wheel)
+        te = TimerEvent(interval=0.02, src="te", wheel=wheel)
+        te.subscribe(name="test", on_event=lambda pkt: posts.append(pkt.payload))
+        time.sleep(0.11)
+        self.assertTrue(rt.is_alive())
+        rt.stop()
+        te.stop()
+        self.assertFalse(rt.is_alive())
+        wheel.stop()
+        self.assertGreaterEqual(len(calls), 3)
+        self.assertEqual(calls[0]["dest"], "Ether")
+        self.assertGreaterEqual(len(posts), 3)
+        self.assertEqual(posts[0]["src"], "te")
+
+    def test_phase_and_stats(self):
+        calls = []
+        wheel = TimerWheel()
+        # Phase comes from the wall clock start_tm, ticks from the monotonic clock
+        rt = RepeatedTimer(
+            interval=0.05,
+            target=lambda kwargs: calls.append(time.time()),
+            src="rt",
+            start_tm=time.time() - 0.03,
+            wheel=wheel,
+        )
+        time.sleep(0.12)
+        rt.stop()
+        wheel.stop()
+        self.assertGreaterEqual(len(calls), 2)
+        self.assertAlmostEqual(calls[1] - calls[0], 0.05, delta=0.01)
+        stats = rt.stats()
+        self.assertEqual(stats["runs"], len(calls))
+        self.assertLess(stats["lateness"]["max"], 0.02)
+
+
+class AsyncTimerTestCase(unittest.TestCase):
+    def test_many_timers_one_loop(self):
+        async def run():
+            threads = threading.active_count()
+            ticks = []
+            timers = [
+                AsyncRepeatedTimer(interval=0.02, target=ticks.append, src=str(n))
+                for n in range(2000)
+            ]
+            posts = []
+            te = AsyncTimerEvent(interval=0.02, src="te")
+            te.subscribe(name="test", on_event=lambda pkt: posts.append(pkt.payload))
+            await asyncio.sleep(0.11)
+            for timer in timers + [te]:
+                timer.stop()
+            self.assertEqual(threading.active_count(), threads)
+            return ticks, posts
+
+        ticks, posts = asyncio.run(run())
+        self.assertGreaterEqual(len(ticks), 2000 * 4)
+        self.assertGreaterEqual(len(posts), 4)
+        self.assertEqual(posts[0]["src"], "te")
+
+    def test_async_target_overlap(self):
+        async def run():
+            active = []
+
+            async def slow(kwargs):
+                active.append(kwargs["src"])
+                self.assertEqual(len(active), 1)
+                await asyncio.sleep(0.025)
+                active.pop()
+
+            rt = AsyncRepeatedTimer(interval=0.01, target=slow, src="slow")
+            await asyncio.sleep(0.105)
+            rt.stop()
+            await rt.drain(timeout=1)
+            return rt.stats()
+
+        stats = asyncio.run(run())
+        self.assertEqual(stats["errors"], 0)
+        self.assertGreaterEqual(stats["overlaps"], 4)
+        self.assertIn(stats["runs"], (3, 4))
+        self.assertEqual(stats["duration"]["count"], stats["runs"])
+
+
+if __name__ == "__main__":
+    unittest.main()
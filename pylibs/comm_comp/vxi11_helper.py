@@ -25,12 +25,17 @@ from typing import Any
 import vxi11
 
 from .base_dev_helper import BaseCommDeviceHelper
+from framing import Framer
 
 
 class VXI11Helper(BaseCommDeviceHelper):
-    def __init__(self, address: str):
+    def __init__(self, address: str, framer: Framer = None, binary: bool = False):
         super(VXI11Helper, self).__init__(
-            address=address, port="VXI11", recv_proc=self.__process_input__
+            address=address,
+            port="VXI11",
+            recv_proc=self.__process_input__,
+            framer=framer,
+            binary=binary,
         )
         self.EOL = "\n"
         self.instrument = vxi11.Instrument(address)
@@ -38,12 +43,19 @@ class VXI11Helper(BaseCommDeviceHelper):
     def _send(self, data):
         if data is None:
             return
+        if isinstance(data, (bytes, bytearray)):
+            if self.framer is not None:
+                data = self.framer.encode(bytes(data))
+            self.instrument.write_raw(bytes(data))
+            return
         data = str(data)
         if all(eol not in data for eol in self.EOLL):
             data += self.EOL
         self.instrument.write(message=data, encoding="ascii")
 
     def _recv(self, size=1024):
+        if self.binary:
+            return self.instrument.read_raw(num=size)
         return self.instrument.read(num=size, encoding="ascii")
 
     def _open(self):